@@ -0,0 +1,168 @@
+import asyncio
+import os
+from collections import deque
+
+from metrics import REGISTRY
+from pdf_writer import ENCODE_WORKERS
+
+# Try to load dotenv if available (for production), but don't fail if missing (for tests)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+ADMISSION_BUDGET_MB = float(os.getenv("ADMISSION_BUDGET_MB", "4096"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "50"))
+ADMISSION_QUEUE_TIMEOUT_S = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "120"))
+
+# Measured peak RSS of one page in flight is ~190 MB for a 9x14 page: the
+# stitched page, column strips, decoded tiles, track overlay, mask and
+# annotated copy. Pillow stores RGB pixels on 4 bytes.
+PAGE_WORKING_SET_FACTOR = 6
+# Parsed track, layout, HTTP session...
+JOB_BASE_BYTES = 16 * 1024 * 1024
+# Pages are rendered one after the other and streamed out, each finished
+# page JPEG-encoded on one of ENCODE_WORKERS threads while the next one
+# renders (utils.render_encoded_pages). So a job holds the bitmaps of this
+# many pages at most, however long the route is: the one rendering and
+# those waiting for their encoding.
+PAGES_IN_FLIGHT = ENCODE_WORKERS + 1
+
+queue_depth = REGISTRY.gauge("admission_queue_depth", "Render jobs waiting for memory")
+running_jobs = REGISTRY.gauge("admission_running_jobs", "Render jobs admitted and running")
+reserved_bytes = REGISTRY.gauge("admission_reserved_bytes", "Estimated memory reserved by running jobs")
+admitted_total = REGISTRY.counter("admission_admitted_total", "Render jobs admitted")
+rejected_total = REGISTRY.counter("admission_rejected_total", "Render jobs rejected, by reason")
+
+
+def estimate_job_bytes(page_count, columns=9, rows=14, pages_in_flight=PAGES_IN_FLIGHT):
+    """
+    Estimate the peak memory of rendering an atlas.
+
+    Args:
+        page_count: Number of pages, from get_filled_pages
+        columns: Tiles per page horizontally
+        rows: Tiles per page vertically
+        pages_in_flight: Pages held at the same time by one job, the one
+            rendering and the finished ones waiting for their encoding
+
+    Returns:
+        int: Estimated peak bytes.
+    """
+    page_bytes = columns * 256 * rows * 256 * 4
+    in_flight = min(page_count, pages_in_flight)
+    # Only the page rendering has the whole working set, the others are finished bitmaps
+    rendering = min(in_flight, 1)
+    return JOB_BASE_BYTES + rendering * page_bytes * PAGE_WORKING_SET_FACTOR + (in_flight - rendering) * page_bytes
+
+
+class AdmissionRejected(Exception):
+    """Raised when a job cannot be admitted within the memory budget."""
+
+    def __init__(self, reason, message):
+        super().__init__(message)
+        self.reason = reason
+
+
+class AdmissionController:
+    """
+    Admit render jobs against a memory budget.
+
+    Jobs whose estimated memory fits in what is left of the budget start
+    right away; the others wait in a FIFO queue until running jobs release
+    enough memory. Jobs larger than the whole budget, jobs arriving when the
+    queue is full and jobs waiting longer than `queue_timeout` are rejected.
+
+    Args:
+        budget_bytes: Memory available to render jobs
+        max_queue: Maximum number of waiting jobs
+        queue_timeout: Seconds a job may wait before being rejected
+    """
+
+    def __init__(
+        self,
+        budget_bytes=int(ADMISSION_BUDGET_MB * 1024 * 1024),
+        max_queue=ADMISSION_MAX_QUEUE,
+        queue_timeout=ADMISSION_QUEUE_TIMEOUT_S,
+    ):
+        self.budget_bytes = budget_bytes
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.reserved = 0
+        self.running = 0
+        self._waiters = deque()
+
+    def _reject(self, reason, message):
+        rejected_total.inc(reason=reason)
+        raise AdmissionRejected(reason, message)
+
+    def _fits(self, nbytes):
+        return self.reserved + nbytes <= self.budget_bytes
+
+    def _grant(self, nbytes):
+        self.reserved += nbytes
+        self.running += 1
+        admitted_total.inc()
+        self._update_gauges()
+
+    def _update_gauges(self):
+        queue_depth.set(len(self._waiters))
+        running_jobs.set(self.running)
+        reserved_bytes.set(self.reserved)
+
+    async def acquire(self, nbytes):
+        """
+        Reserve nbytes, waiting in the queue if needed.
+
+        Raises:
+            AdmissionRejected: The job is too large, the queue is full or the wait timed out.
+        """
+        if nbytes > self.budget_bytes:
+            self._reject("too_large", f"Job needs {nbytes} bytes, the budget is {self.budget_bytes}")
+
+        # Nobody overtakes the jobs already waiting
+        if not self._waiters and self._fits(nbytes):
+            self._grant(nbytes)
+            return nbytes
+
+        if len(self._waiters) >= self.max_queue:
+            self._reject("queue_full", f"{len(self._waiters)} jobs already waiting")
+
+        waiter = (nbytes, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._update_gauges()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            self._reject("timeout", f"Waited more than {self.queue_timeout}s for memory")
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        return nbytes
+
+    def _abandon(self, waiter):
+        if waiter[1].done() and not waiter[1].cancelled():
+            # Granted while giving up: hand the memory back
+            self.release(waiter[0])
+            return
+        waiter[1].cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+        self._wake()
+
+    def release(self, nbytes):
+        """Give back memory reserved by acquire()."""
+        self.reserved -= nbytes
+        self.running -= 1
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self._fits(self._waiters[0][0]):
+            nbytes, future = self._waiters.popleft()
+            self._grant(nbytes)
+            future.set_result(True)
+        self._update_gauges()
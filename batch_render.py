@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+"""
+Render the atlases of many GPX files in one batch.
+
+All files are laid out first. The tiles of every layout are then fetched
+once through the shared tile fetcher: a tile needed by several routes is
+downloaded once and read from the tile cache afterwards. Files are then
+rendered concurrently, their pages going to one shared pool of worker
+processes. Each atlas is written to <output-dir>/<gpx name>.pdf, and a
+JSON summary of timings and cache hits to <output-dir>/summary.json.
+
+Usage:
+    python batch_render.py gpx_files/ "routes/*.gpx" --output-dir atlases [--tile-source OSM] [--bundle lyon.zip]
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import time
+
+from utils import LINE_COLOR, TILE_SOURCE, layout_atlas, parse_gpx, render_atlas, render_settings
+from instrumentation import RenderReport, recording
+from distributed_render import RENDER_WORKERS, process_pool_mapper, render_atlas_distributed, render_process_pool
+from prefetch import page_tiles
+from result_cache import get_default_cache, render_key
+import tile_fetcher
+from tile_fetcher import get_default_fetcher
+
+# Files rendered at the same time, their pages share the worker pool
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+# Tiles downloaded at the same time while prefetching
+BATCH_FETCH_CONCURRENCY = int(os.getenv("BATCH_FETCH_CONCURRENCY", "32"))
+
+
+def find_gpx_files(inputs):
+    """
+    Expand directories, glob patterns and file names into GPX file paths.
+
+    Returns:
+        list: Sorted unique paths.
+    """
+    paths = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            paths.update(glob.glob(os.path.join(item, "*.gpx")))
+        elif os.path.isfile(item):
+            paths.add(item)
+        else:
+            # Existing names are taken as is, so "[Hard]route.gpx" is not read as a pattern
+            paths.update(glob.glob(item))
+    return sorted(paths)
+
+
+def output_path(gpx_path, output_dir):
+    name = os.path.splitext(os.path.basename(gpx_path))[0]
+    return os.path.join(output_dir, name + ".pdf")
+
+
+def layout_tiles(pages, gpx_points=None, corridor=None):
+    """Set of (col, row) tiles of a layout, only those fetched at full resolution with a corridor."""
+    return set(page_tiles(pages, gpx_points=gpx_points, corridor=corridor))
+
+
+async def prefetch_tiles(tiles, tile_source, fetcher, concurrency=BATCH_FETCH_CONCURRENCY):
+    """
+    Fetch tiles into the tile cache of fetcher.
+
+    Returns:
+        int: Number of tiles that could not be fetched.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(col_row):
+        async with semaphore:
+            try:
+                return await fetcher.fetch_tile_bytes(col_row, tile_source)
+            except Exception as e:
+                print(f"Error fetching tile {col_row}: {e}")
+                return None
+
+    results = await asyncio.gather(*(fetch(col_row) for col_row in sorted(tiles)))
+    return sum(1 for data in results if data is None)
+
+
+async def render_file(job, tile_source, line_color, map_chunks, workers, corridor=None, overview=False):
+    """Render one laid out file to its output path, return its render time."""
+    start = time.time()
+    if map_chunks is not None:
+        chunks = render_atlas_distributed(job["gpx"], tile_source, line_color, layout=job["layout"],
+                                          map_chunks=map_chunks, workers=workers, corridor=corridor, overview=overview)
+    else:
+        chunks = render_atlas(job["gpx"], tile_source, line_color, layout=job["layout"], corridor=corridor,
+                              overview=overview)
+    with open(job["output"], "wb") as f:
+        async for chunk in chunks:
+            f.write(chunk)
+    return time.time() - start
+
+
+async def run_batch(gpx_paths, output_dir, tile_source=TILE_SOURCE, line_color=LINE_COLOR,
+                    workers=RENDER_WORKERS, concurrency=BATCH_CONCURRENCY, use_result_cache=True, corridor=None,
+                    overview=False):
+    """
+    Render every GPX file of gpx_paths into output_dir.
+
+    Args:
+        gpx_paths: GPX files to render
+        output_dir: Directory the PDFs are written to
+        tile_source: "IGN", "OSM" or "TOPO"
+        line_color: Colour of the track lines
+        workers: Worker processes rendering pages, 1 renders in this process
+        concurrency: Files rendered at the same time
+        use_result_cache: Reuse atlases already rendered with the same track and settings
+        corridor: Optional distance in tiles to the track, only the tiles this
+            close are fetched at full resolution (see utils.render_page)
+        overview: Add an overview page of the route in front of each atlas
+
+    Returns:
+        dict: Summary with one entry per file and the totals of the batch.
+    """
+    batch_start = time.time()
+    os.makedirs(output_dir, exist_ok=True)
+    fetcher = get_default_fetcher()
+    result_cache = get_default_cache() if use_result_cache else None
+    settings = render_settings(tile_source, line_color, corridor, overview)
+
+    jobs = []
+    for path in gpx_paths:
+        job = {"file": path, "output": output_path(path, output_dir), "error": None}
+        jobs.append(job)
+        start = time.time()
+        try:
+            with open(path, "rb") as f:
+                job["gpx"] = parse_gpx(f.read())
+            job["layout"] = layout_atlas(job["gpx"], tile_source)
+        except Exception as e:
+            job["error"] = f"{type(e).__name__}: {e}"
+            continue
+        job["layout_s"] = time.time() - start
+        job["pages"] = len(job["layout"][0])
+        job["tiles"] = layout_tiles(job["layout"][0], job["layout"][1], corridor)
+        job["key"] = render_key(job["gpx"], settings)
+
+    # Atlases already rendered with the same track and settings are copied from the cache
+    pending = []
+    for job in jobs:
+        if job["error"] is not None:
+            continue
+        pdf = result_cache.get(job["key"]) if result_cache is not None else None
+        job["result_cache_hit"] = pdf is not None
+        if pdf is not None:
+            with open(job["output"], "wb") as f:
+                f.write(pdf)
+            job["render_s"] = 0.0
+        elif job["pages"] == 0:
+            job["error"] = "No track points found in the GPX file"
+        else:
+            pending.append(job)
+
+    # Every tile of the batch once, whichever routes share it
+    tiles = set().union(*(job["tiles"] for job in pending))
+    tiles_requested = sum(len(job["tiles"]) for job in pending)
+    cache_hits = fetcher.cache.hits if fetcher.cache is not None else 0
+    prefetch_start = time.time()
+    failed_tiles = await prefetch_tiles(tiles, tile_source, fetcher)
+    prefetch_s = time.time() - prefetch_start
+    tile_cache_hits = (fetcher.cache.hits - cache_hits) if fetcher.cache is not None else 0
+
+    executor = None
+    map_chunks = None
+    if workers > 1 and pending:
+        # Workers read the tiles prefetched above from the tile cache
+        executor = render_process_pool(workers)
+        map_chunks = process_pool_mapper(executor)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def render(job):
+        async with semaphore:
+            try:
+                with recording(RenderReport()) as report:
+                    job["render_s"] = await render_file(job, tile_source, line_color, map_chunks, workers, corridor,
+                                                          overview)
+            except Exception as e:
+                job["error"] = f"{type(e).__name__}: {e}"
+                return
+            job["complete"] = report.complete
+            # An atlas with missing tiles is not kept: they are retried on the next batch
+            if result_cache is not None and report.complete:
+                result_cache.put_file(job["key"], job["output"])
+
+    try:
+        await asyncio.gather(*(render(job) for job in pending))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        await fetcher.close()
+
+    files = []
+    for job in jobs:
+        entry = {"file": job["file"], "output": None if job["error"] else job["output"], "error": job["error"]}
+        for name in ("pages", "layout_s", "render_s", "result_cache_hit", "complete"):
+            if name in job:
+                entry[name] = round(job[name], 3) if isinstance(job[name], float) else job[name]
+        if "tiles" in job:
+            entry["tiles"] = len(job["tiles"])
+        files.append(entry)
+
+    return {
+        "tile_source": tile_source.upper(),
+        "line_color": line_color,
+        "workers": workers,
+        "concurrency": concurrency,
+        "corridor": corridor,
+        "overview": overview,
+        "files": files,
+        "totals": {
+            "files": len(jobs),
+            "failed": sum(1 for job in jobs if job["error"]),
+            "pages": sum(job.get("pages", 0) for job in jobs),
+            "result_cache_hits": sum(1 for job in jobs if job.get("result_cache_hit")),
+            "tiles_requested": tiles_requested,
+            "tiles_unique": len(tiles),
+            "tile_cache_hits": tile_cache_hits,
+            "tiles_failed": failed_tiles,
+            "prefetch_s": round(prefetch_s, 3),
+            "total_s": round(time.time() - batch_start, 3),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("inputs", nargs="+", help="GPX files, directories or glob patterns")
+    parser.add_argument("--output-dir", default="atlases")
+    parser.add_argument("--tile-source", default=TILE_SOURCE, choices=["IGN", "OSM", "TOPO"], type=str.upper)
+    parser.add_argument("--line-color", default=LINE_COLOR)
+    parser.add_argument("--workers", type=int, default=RENDER_WORKERS)
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--no-result-cache", action="store_true", help="Render even atlases already cached")
+    parser.add_argument("--corridor", type=int, help="Only fetch the tiles within this many tiles of the track")
+    parser.add_argument("--overview", action="store_true", help="Add an overview page in front of each atlas")
+    parser.add_argument("--summary", help="Summary path, defaults to <output-dir>/summary.json")
+    parser.add_argument("--bundle", help="Render from this tile bundle only (see tile_bundle.py), without network")
+    args = parser.parse_args()
+
+    if args.bundle:
+        # Through the environment, so worker processes read the bundle too
+        os.environ["TILE_BUNDLE"] = args.bundle
+        tile_fetcher.TILE_BUNDLE = args.bundle
+
+    gpx_paths = find_gpx_files(args.inputs)
+    if not gpx_paths:
+        print("No GPX file found")
+        sys.exit(1)
+
+    print(f"Rendering {len(gpx_paths)} GPX file(s) to {args.output_dir}")
+    summary = asyncio.run(run_batch(
+        gpx_paths, args.output_dir, args.tile_source, args.line_color,
+        workers=args.workers, concurrency=args.concurrency, use_result_cache=not args.no_result_cache,
+        corridor=args.corridor, overview=args.overview,
+    ))
+
+    summary_path = args.summary or os.path.join(args.output_dir, "summary.json")
+    with open(summary_path, "w") as f:
+        json.dump(summary, f, indent=2)
+
+    totals = summary["totals"]
+    for entry in summary["files"]:
+        status = f"✗ {entry['error']}" if entry["error"] else f"✓ {entry.get('pages', 0)} pages"
+        print(f"  {status}  {entry['file']}")
+    print(f"{totals['files']} files, {totals['pages']} pages, "
+          f"{totals['tiles_unique']} unique tiles for {totals['tiles_requested']} requested, "
+          f"{totals['total_s']} s. Summary: {summary_path}")
+
+    sys.exit(1 if totals["failed"] else 0)
+
+
+if __name__ == '__main__':
+    main()
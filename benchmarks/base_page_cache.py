@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Base page cache benchmark: what a miss costs and what a hit saves.
+
+Stitches the first pages of a GPX file from generated tiles (see
+benchmarks/compositor.py), with `--noise` added so they compress about
+as badly as decoded map tiles, then for each format of the cached pages:
+
+- png: PNG at compress_level=1, the format before BASE_PAGE_CACHE_VERSION 2
+- raw: encode_base_page, raw RGB rows behind a small header
+
+reports per page the cold-miss overhead (encode and write to a cache in
+a temporary directory), the hit (read, decode and copy into a
+PageCanvas) and the bytes on disk. A hit replaces the rebuild of the
+page, also reported: decoding its PNG tiles, as they come out of the
+tile cache, and stitching them. Fetching the tiles is not measured here
+(see benchmarks/pipeline.py).
+
+The longest event loop stall while a raw page is written through
+utils._cache_base_page is reported too: the write runs in a thread, so
+the loop keeps serving other pages.
+
+Usage:
+    python benchmarks/base_page_cache.py [--gpx gpx_files/route.gpx] [--pages 3] [--runs 3] [--noise 24]
+"""
+
+import argparse
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import utils  # noqa: E402
+from benchmarks.compositor import DEFAULT_GPX, generated_tiles  # noqa: E402
+from page_compositor import PageCanvas  # noqa: E402
+from result_cache import LocalDirectoryStore, ResultCache  # noqa: E402
+
+
+def encode_png(image):
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+def decode_png(data):
+    image = Image.open(io.BytesIO(data))
+    image.load()
+    return image
+
+
+FORMATS = {
+    "png": (encode_png, decode_png),
+    "raw": (utils.encode_base_page, utils.decode_base_page),
+}
+
+
+def noisy_tiles(page, noise, seed=0):
+    """generated_tiles with uniform noise of amplitude noise added to every pixel, PNG-encoded."""
+    rng = np.random.default_rng(seed)
+    tiles = []
+    for tile in generated_tiles(page):
+        pixels = np.asarray(tile, dtype=np.int16) + rng.integers(0, noise + 1, (256, 256, 3), dtype=np.int16)
+        buffer = io.BytesIO()
+        Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format="PNG")
+        tiles.append(buffer.getvalue())
+    return tiles
+
+
+def rebuild(page, tiles):
+    """Decode the PNG tiles of a page and stitch them, what a hit replaces."""
+    rows = len(page[0])
+    canvas = PageCanvas(len(page), rows)
+    for index, data in enumerate(tiles):
+        tile = Image.open(io.BytesIO(data))
+        tile.load()
+        canvas.place_tile(index // rows, index % rows, tile)
+    return canvas
+
+
+async def loop_stall(cache, key, canvas):
+    """Longest gap between 1 ms ticks of the event loop while the page is written, in seconds."""
+    stalls, done = [], asyncio.Event()
+
+    async def ticker():
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            stalls.append(now - last)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    await utils._cache_base_page(cache, key, canvas.image(), [])
+    done.set()
+    await task
+    return max(stalls)
+
+
+def run_benchmark(gpx_path=DEFAULT_GPX, page_count=3, runs=3, noise=24, tile_source="OSM"):
+    """
+    Write and read the first page_count pages of the route in every format, `runs` times.
+
+    Returns:
+        dict: Best seconds per page of a miss and a hit of each format, the rebuild and the loop stall.
+    """
+    with open(gpx_path, "rb") as f:
+        pages, _ = utils.layout_atlas(utils.parse_gpx(f.read()), tile_source)
+    pages = pages[:page_count]
+    tiles = [noisy_tiles(page, noise, seed) for seed, page in enumerate(pages)]
+
+    rebuild_s = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        canvases = [rebuild(page, page_tiles) for page, page_tiles in zip(pages, tiles)]
+        rebuild_s.append(time.perf_counter() - start)
+
+    report = {
+        "gpx": os.path.basename(gpx_path),
+        "pages": len(pages),
+        "runs": runs,
+        "noise": noise,
+        "rebuild_s_per_page": round(min(rebuild_s) / len(pages), 4),
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        for name, (encode, decode) in FORMATS.items():
+            cache = ResultCache(LocalDirectoryStore(os.path.join(directory, name)))
+            keys = [f"{name}_{number}" for number in range(len(pages))]
+            miss_s, hit_s = [], []
+            for _ in range(runs):
+                start = time.perf_counter()
+                for key, canvas in zip(keys, canvases):
+                    cache.put(key, encode(canvas.image()))
+                miss_s.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                for key in keys:
+                    PageCanvas.from_image(decode(cache.get(key)))
+                hit_s.append(time.perf_counter() - start)
+            report[name] = {
+                "miss_s_per_page": round(min(miss_s) / len(pages), 4),
+                "hit_s_per_page": round(min(hit_s) / len(pages), 4),
+                "mb_per_page": round(cache.total_bytes / len(pages) / 1024 / 1024, 1),
+            }
+
+        cache = ResultCache(LocalDirectoryStore(os.path.join(directory, "stall")))
+        report["raw"]["loop_stall_s"] = round(
+            max(asyncio.run(loop_stall(cache, "stall", canvas)) for canvas in canvases),
+            4,
+        )
+    report["hit_saves_s_per_page"] = round(report["rebuild_s_per_page"] - report["raw"]["hit_s_per_page"], 4)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gpx", default=DEFAULT_GPX)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--noise", type=int, default=24, help="Amplitude of the noise added to the tiles, 0 for none")
+    parser.add_argument("--tile-source", default="OSM", choices=["IGN", "OSM", "TOPO"], type=str.upper)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.gpx, args.pages, args.runs, args.noise, args.tile_source)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['gpx']}: {report['pages']} pages, best of {report['runs']}, noise {report['noise']}")
+        print(f"  rebuild from PNG tiles: {report['rebuild_s_per_page'] * 1000:7.1f} ms/page")
+        for name in FORMATS:
+            print(f"  {name:>4}: miss +{report[name]['miss_s_per_page'] * 1000:7.1f} ms/page, "
+                  f"hit {report[name]['hit_s_per_page'] * 1000:7.1f} ms/page, {report[name]['mb_per_page']} MB/page")
+        print(f"  raw hit saves {report['hit_saves_s_per_page'] * 1000:.1f} ms/page over the rebuild, plus the fetching;"
+              f" longest event loop stall while writing: {report['raw']['loop_stall_s'] * 1000:.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
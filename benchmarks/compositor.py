@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Page compositor benchmark: assemble pages from decoded tiles, both ways.
+
+Lays out a GPX file, then assembles its first pages from generated tiles,
+already decoded as the tile fetcher hands them over, with each compositor
+of utils.PAGE_COMPOSITOR:
+
+- pil: columns stitched with get_concat_v/h_blank_gpt, the track drawn
+  with draw_line on an image of the page size and pasted through a mask
+- canvas: tiles pasted into one preallocated image (page_compositor.py),
+  the track blended in place from a coverage buffer of its bounding box
+
+Both draw the tracks, scale and page number with the overlay helpers
+render_page uses (draw_overlay and draw_canvas_overlay), and add the
+navigation markers. The best of
+`--runs` is reported for the assembly alone and with the JPEG encoding,
+and the encoded pages of both compositors are checked to be identical.
+
+Usage:
+    python benchmarks/compositor.py [--gpx gpx_files/route.gpx] [--pages 5] [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from PIL import Image
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import utils  # noqa: E402
+from page_compositor import PageCanvas  # noqa: E402
+from pdf_writer import encode_page  # noqa: E402
+
+DEFAULT_GPX = os.path.join(REPO_ROOT, "gpx_files", "[Hard]viarhona.gpx")
+
+
+def generated_tiles(page):
+    """Decoded tiles of a page, column after column, a different gradient each."""
+    gradient = np.zeros((256, 256, 3), dtype=np.uint16)
+    gradient[:, :, 0] = np.arange(256)[None, :]
+    gradient[:, :, 1] = np.arange(256)[:, None]
+    return [
+        Image.fromarray(((gradient + (int(col) * 37, int(row) * 59, 90)) % 256).astype(np.uint8))
+        for column in page for col, row in column
+    ]
+
+
+def compose_pil(pages, number, tiles, tracks):
+    rows = len(pages[number][0])
+    grid = [tiles[i:i + rows] for i in range(0, len(tiles), rows)]
+    image = utils.get_concat_h_blank_gpt(*[utils.get_concat_v_blank_gpt(*column) for column in grid])
+    image = utils.draw_overlay(image, number, tracks)
+    return utils.add_navigation_markers(image, number, pages)
+
+
+def compose_canvas(pages, number, tiles, tracks):
+    rows = len(pages[number][0])
+    canvas = PageCanvas(len(pages[number]), rows)
+    for index, tile in enumerate(tiles):
+        canvas.place_tile(index // rows, index % rows, tile)
+    utils.draw_canvas_overlay(canvas, number, tracks)
+    return utils.add_canvas_navigation_markers(canvas, number, pages).image()
+
+
+COMPOSITORS = {"pil": compose_pil, "canvas": compose_canvas}
+
+
+def run_benchmark(gpx_path=DEFAULT_GPX, page_count=5, runs=5, tile_source="OSM"):
+    """
+    Assemble the first page_count pages of the route with each compositor, `runs` times.
+
+    Returns:
+        dict: Best seconds per page of each compositor, without and with encoding.
+    """
+    with open(gpx_path, "rb") as f:
+        pages, gpx_points = utils.layout_atlas(utils.parse_gpx(f.read()), tile_source)
+    numbers = range(min(page_count, len(pages)))
+    inputs = [(generated_tiles(pages[n]), utils.get_page_tracks_in_px(pages[n], gpx_points)) for n in numbers]
+
+    report = {"gpx": os.path.basename(gpx_path), "pages": len(numbers), "runs": runs}
+    encoded = {}
+    for name, compose in COMPOSITORS.items():
+        compose_s, total_s = [], []
+        for _ in range(runs):
+            images, start = [], time.perf_counter()
+            for n, (tiles, tracks) in zip(numbers, inputs):
+                images.append(compose(pages, n, tiles, tracks))
+            composed = time.perf_counter()
+            encoded[name] = [encode_page(image).data for image in images]
+            compose_s.append(composed - start)
+            total_s.append(time.perf_counter() - start)
+        report[name] = {
+            "compose_s_per_page": round(min(compose_s) / len(numbers), 4),
+            "with_encode_s_per_page": round(min(total_s) / len(numbers), 4),
+        }
+    report["compose_speedup"] = round(report["pil"]["compose_s_per_page"] / report["canvas"]["compose_s_per_page"], 2)
+    report["identical"] = encoded["pil"] == encoded["canvas"]
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gpx", default=DEFAULT_GPX)
+    parser.add_argument("--pages", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--tile-source", default="OSM", choices=["IGN", "OSM", "TOPO"], type=str.upper)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.gpx, args.pages, args.runs, args.tile_source)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['gpx']}: {report['pages']} pages, best of {report['runs']}")
+        for name in COMPOSITORS:
+            print(f"  {name:>6}: {report[name]['compose_s_per_page'] * 1000:7.1f} ms/page assembled, "
+                  f"{report[name]['with_encode_s_per_page'] * 1000:7.1f} ms/page with JPEG encoding")
+        print(f"  assembly {report['compose_speedup']}x faster with the canvas")
+        print("✓ Identical pages" if report["identical"] else "✗ Pages differ")
+
+    sys.exit(0 if report["identical"] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Page encoding benchmark: JPEG-compress finished pages on 1 to N threads.
+
+Assembles the first pages of a GPX file from generated tiles (see
+benchmarks/compositor.py), then encodes them all with encode_page on a
+thread pool of each size, in page order as render_encoded_pages does.
+JPEG encoding releases the GIL, so the time should drop with the number
+of threads up to the number of cores.
+
+Usage:
+    python benchmarks/encoding.py [--gpx gpx_files/route.gpx] [--pages 8] [--workers 1 2 4] [--runs 3]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import utils  # noqa: E402
+from benchmarks.compositor import DEFAULT_GPX, compose_canvas, generated_tiles  # noqa: E402
+from pdf_writer import encode_page  # noqa: E402
+
+
+def run_benchmark(gpx_path=DEFAULT_GPX, page_count=8, workers=(1, 2, 4), runs=3, tile_source="OSM"):
+    """
+    Encode the first page_count pages of the route on pools of each size in workers.
+
+    Returns:
+        dict: Best seconds per pool size and the speedup over one thread.
+    """
+    with open(gpx_path, "rb") as f:
+        pages, gpx_points = utils.layout_atlas(utils.parse_gpx(f.read()), tile_source)
+    numbers = range(min(page_count, len(pages)))
+    images = [
+        compose_canvas(pages, n, generated_tiles(pages[n]), utils.get_page_tracks_in_px(pages[n], gpx_points))
+        for n in numbers
+    ]
+
+    seconds = {}
+    for count in workers:
+        timings = []
+        with ThreadPoolExecutor(count) as executor:
+            for _ in range(runs):
+                start = time.perf_counter()
+                list(executor.map(encode_page, images))
+                timings.append(time.perf_counter() - start)
+        seconds[count] = min(timings)
+    return {
+        "gpx": os.path.basename(gpx_path),
+        "pages": len(images),
+        "cores": os.cpu_count(),
+        "seconds": {str(count): round(value, 4) for count, value in seconds.items()},
+        "speedup": {str(count): round(seconds[workers[0]] / value, 2) for count, value in seconds.items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--gpx", default=DEFAULT_GPX)
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--tile-source", default="OSM", choices=["IGN", "OSM", "TOPO"], type=str.upper)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.gpx, args.pages, args.workers, args.runs, args.tile_source)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"{report['gpx']}: {report['pages']} pages, {report['cores']} cores")
+        for count, value in report["seconds"].items():
+            print(f"  {count:>3} threads: {value:.3f} s ({report['speedup'][count]}x)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Offline pipeline benchmark: render GPX files against a local tile server.
+
+Starts a MockTileServer (benchmarks/tile_server.py) with the given
+latency, jitter and error rate and renders every route with utils.main,
+cold (no tile or base page cache). The best of `--runs` renders of each
+route is reported with its stage breakdown from the render report.
+
+--synthetic adds the standard synthetic routes of synthetic_routes.py
+(straight east-west and north-south, out-and-back, loop, city), with
+lengths multiplied by --synthetic-scale.
+
+--corridor renders every route a second time in corridor mode, only the
+tiles that many tiles from the track at full resolution, and reports its
+tiles and time next to the full resolution pages.
+
+Results can be saved as a JSON baseline and later runs compared to it:
+the benchmark fails if a route got slower than the baseline by more than
+the threshold, or needs more pages or tiles than before.
+
+Usage:
+    python benchmarks/pipeline.py [--routes "gpx_files/*.gpx"] [--runs 3] [--latency-ms 20] [--synthetic]
+        [--corridor 2] [--save-baseline benchmarks/baseline.json | --baseline benchmarks/baseline.json --threshold 0.2]
+"""
+
+import argparse
+import asyncio
+import glob
+import json
+import os
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+import utils  # noqa: E402
+from instrumentation import RenderReport  # noqa: E402
+from tile_fetcher import TileFetcher, set_default_fetcher  # noqa: E402
+from benchmarks.tile_server import MockTileServer  # noqa: E402
+from synthetic_routes import write_standard_routes  # noqa: E402
+
+# Bundled GPX files, plus the generated routes of benchmarks/routes if present
+DEFAULT_ROUTES = [
+    os.path.join(REPO_ROOT, "gpx_files", "*.gpx"),
+    os.path.join(REPO_ROOT, "benchmarks", "routes", "*.gpx"),
+]
+DEFAULT_THRESHOLD = float(os.getenv("BENCHMARK_THRESHOLD", "0.2"))
+
+
+def find_routes(patterns):
+    paths = set()
+    for pattern in patterns:
+        paths.update(glob.glob(pattern))
+    return sorted(paths)
+
+
+async def render_route(gpx, tile_source, server, corridor=None):
+    """One cold render against server, returns (wall seconds, RenderReport)."""
+    # A fresh fetcher without cache: every tile goes through the server
+    fetcher = TileFetcher(sources=server.sources(), cache=None)
+    set_default_fetcher(fetcher)
+    report = RenderReport()
+    start = time.perf_counter()
+    try:
+        await utils.main(gpx, tile_source, report=report, corridor=corridor)
+    finally:
+        await fetcher.close()
+    return time.perf_counter() - start, report
+
+
+def best_of(gpx, tile_source, server, runs, corridor=None):
+    """Render the route `runs` times, returns (all wall times, RenderReport of the fastest run)."""
+    timings = []
+    best_report = None
+    for _ in range(runs):
+        seconds, report = asyncio.run(render_route(gpx, tile_source, server, corridor))
+        if not timings or seconds < min(timings):
+            best_report = report
+        timings.append(seconds)
+    return timings, best_report
+
+
+def bench_route(path, tile_source, server, runs, corridor=None):
+    """
+    Render the route `runs` times, then `runs` times in corridor mode if corridor is set.
+
+    Returns:
+        dict: Best wall time, all runs, pages, tiles and the stages of the best run,
+            and the best time and tiles of the corridor renders under "corridor".
+    """
+    with open(path, "rb") as f:
+        gpx = utils.parse_gpx(f.read())
+
+    timings, best_report = best_of(gpx, tile_source, server, runs)
+    data = best_report.to_dict()
+    result = {
+        "best_s": round(min(timings), 3),
+        "runs_s": [round(seconds, 3) for seconds in timings],
+        "pages": data["pages"],
+        "tiles_requested": data["tiles"]["requested"],
+        "tiles_failed": data["tiles"]["failed"],
+        "peak_rss_bytes": data["peak_rss_bytes"],
+        "stages_s": {name: stage["wall_s"] for name, stage in data["stages"].items()},
+    }
+
+    if corridor is not None:
+        corridor_timings, corridor_report = best_of(gpx, tile_source, server, runs, corridor)
+        corridor_data = corridor_report.to_dict()
+        result["corridor"] = {
+            "tiles": corridor,
+            "best_s": round(min(corridor_timings), 3),
+            "tiles_requested": corridor_data["tiles"]["requested"],
+            "tiles_fill": corridor_data["tiles"]["fill"],
+            "tiles_saved": corridor_data["tiles_saved"],
+            "speedup": round(min(timings) / min(corridor_timings), 2),
+        }
+    return result
+
+
+def run_benchmark(routes, tile_source="OSM", runs=3, latency_ms=20.0, jitter_ms=10.0, error_rate=0.0, seed=0,
+                  corridor=None):
+    """
+    Benchmark every route against a local tile server.
+
+    Args:
+        corridor: Optional distance in tiles to the track, also renders
+            every route in corridor mode for comparison
+
+    Returns:
+        dict: Report with the server settings and one entry per route.
+    """
+    # Cold renders: stitched pages are not reused between runs
+    base_page_cache_mb = utils.BASE_PAGE_CACHE_MAX_MB
+    utils.BASE_PAGE_CACHE_MAX_MB = 0
+
+    results = {}
+    try:
+        with MockTileServer(latency_ms, jitter_ms, error_rate, seed) as server:
+            for path in routes:
+                name = os.path.basename(path)
+                print(f"Rendering {name}...", file=sys.stderr)
+                results[name] = bench_route(path, tile_source, server, runs, corridor)
+    finally:
+        utils.BASE_PAGE_CACHE_MAX_MB = base_page_cache_mb
+        # Back to the real tile servers
+        set_default_fetcher(None)
+
+    return {
+        "tile_source": tile_source,
+        "runs": runs,
+        "server": {"latency_ms": latency_ms, "jitter_ms": jitter_ms, "error_rate": error_rate, "seed": seed},
+        "routes": results,
+    }
+
+
+def compare_to_baseline(report, baseline, threshold=DEFAULT_THRESHOLD):
+    """
+    Compare a benchmark report to a baseline report.
+
+    Returns:
+        list of str: Regressions, empty if none.
+    """
+    regressions = []
+    if report["server"] != baseline["server"] or report["tile_source"] != baseline["tile_source"]:
+        regressions.append("Settings differ from the baseline, timings are not comparable")
+        return regressions
+
+    for name, result in report["routes"].items():
+        base = baseline["routes"].get(name)
+        if base is None:
+            continue
+        if result["best_s"] > base["best_s"] * (1 + threshold):
+            regressions.append(
+                f"{name}: {result['best_s']}s vs {base['best_s']}s baseline "
+                f"(+{(result['best_s'] / base['best_s'] - 1) * 100:.0f}%, threshold {threshold * 100:.0f}%)"
+            )
+        # Layout and tiles are deterministic, any increase is a regression
+        for field in ("pages", "tiles_requested"):
+            if result[field] > base[field]:
+                regressions.append(f"{name}: {result[field]} {field} vs {base[field]} baseline")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--routes", nargs="+", default=DEFAULT_ROUTES, help="GPX files or glob patterns")
+    parser.add_argument("--tile-source", default="OSM", choices=["IGN", "OSM", "TOPO"], type=str.upper)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=10.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--synthetic", action="store_true", help="Also render the standard synthetic routes")
+    parser.add_argument("--synthetic-scale", type=float, default=1.0)
+    parser.add_argument("--corridor", type=int, help="Also render in corridor mode, this many tiles from the track")
+    parser.add_argument("--baseline", help="Baseline JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown over the baseline, 0.2 = 20%%")
+    parser.add_argument("--save-baseline", help="Write the results as a baseline JSON")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as synthetic_dir:
+        routes = find_routes(args.routes)
+        if args.synthetic:
+            routes += write_standard_routes(synthetic_dir, args.synthetic_scale)
+        if not routes:
+            print("No route found")
+            sys.exit(1)
+
+        report = run_benchmark(routes, args.tile_source, args.runs, args.latency_ms, args.jitter_ms,
+                               args.error_rate, args.seed, args.corridor)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare_to_baseline(report, json.load(f), args.threshold)
+    report["regressions"] = regressions
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for name, result in report["routes"].items():
+            print(f"{result['best_s']:>9.3f} s  {result['pages']:>4} pages  "
+                  f"{result['tiles_requested']:>6} tiles  {name}")
+            if "corridor" in result:
+                corridor = result["corridor"]
+                print(f"{corridor['best_s']:>9.3f} s  {'':>10}  {corridor['tiles_requested']:>6} tiles  "
+                      f"corridor {corridor['tiles']}, {corridor['tiles_saved']} tiles saved, x{corridor['speedup']}")
+        for regression in regressions:
+            print(f"✗ {regression}")
+        print("✗ FAIL" if regressions else "✓ PASS")
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark: measure the import time of the backend modules.
+
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter,
+reports the slowest imports and fails if the total is over budget or if a
+module the backend must not pull in gets imported.
+
+Usage:
+    python benchmarks/startup.py [--module utils] [--budget-ms 400] [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MODULE = "utils"
+# Generous enough for a cold container, tight enough to catch pandas/streamlit coming back
+DEFAULT_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "400"))
+# Frontend-only or unused packages, never needed to render an atlas on the backend
+FORBIDDEN_MODULES = ["streamlit", "stqdm", "pandas"]
+
+
+def measure_imports(module, python=sys.executable):
+    """
+    Import module in a fresh interpreter with -X importtime.
+
+    Returns:
+        dict: imported module name -> (self_us, cumulative_us)
+    """
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def forbidden_imports(timings, forbidden=FORBIDDEN_MODULES):
+    """Top-level packages of `forbidden` that were imported."""
+    imported = {name.split(".")[0] for name in timings}
+    return sorted(imported.intersection(forbidden))
+
+
+def run_benchmark(module=DEFAULT_MODULE, budget_ms=DEFAULT_BUDGET_MS, runs=5, top=10):
+    """
+    Measure the import of module `runs` times and compare the best run to the budget.
+
+    Returns:
+        dict: Report with the timings, slowest imports and verdict.
+    """
+    totals_ms = []
+    timings = {}
+    for _ in range(runs):
+        timings = measure_imports(module)
+        totals_ms.append(timings[module][1] / 1000)
+
+    # The best run is the least affected by noise from the machine
+    best_ms = min(totals_ms)
+    forbidden = forbidden_imports(timings)
+    slowest = sorted(timings.items(), key=lambda item: item[1][0], reverse=True)[:top]
+    return {
+        "module": module,
+        "budget_ms": budget_ms,
+        "best_ms": round(best_ms, 1),
+        "runs_ms": [round(total, 1) for total in totals_ms],
+        "forbidden_imports": forbidden,
+        "slowest_self_ms": {name: round(self_us / 1000, 1) for name, (self_us, _) in slowest},
+        "passed": best_ms <= budget_ms and not forbidden,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default=DEFAULT_MODULE)
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.module, args.budget_ms, args.runs)
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print(f"import {report['module']}: best {report['best_ms']} ms "
+              f"(budget {report['budget_ms']} ms, runs {report['runs_ms']})")
+        print("Slowest imports (self time):")
+        for name, self_ms in report["slowest_self_ms"].items():
+            print(f"  {self_ms:>8.1f} ms  {name}")
+        if report["forbidden_imports"]:
+            print(f"✗ Forbidden imports: {', '.join(report['forbidden_imports'])}")
+        print("✓ PASS" if report["passed"] else "✗ FAIL")
+
+    sys.exit(0 if report["passed"] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Local map tile server for offline benchmarks and tests.
+
+Serves deterministic tiles for any zoom, column and row, PNG for OSM/TOPO
+and JPEG for IGN, with configurable latency, jitter and error rate. Tiles
+depend only on their coordinates, so renders are reproducible.
+
+Usage:
+    python benchmarks/tile_server.py [--port 8765] [--latency-ms 50] [--jitter-ms 20] [--error-rate 0.01]
+"""
+
+import argparse
+import functools
+import hashlib
+import io
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from PIL import Image, ImageDraw
+
+TILE_PATH = re.compile(r"^/(?P<source>[A-Za-z]+)/(?P<zoom>\d+)/(?P<col>\d+)/(?P<row>\d+)\.(?P<ext>png|jpg)$")
+FORMATS = {"png": ("PNG", "image/png"), "jpg": ("JPEG", "image/jpeg")}
+# Same formats and zoom levels as the real servers in tile_fetcher.TILE_SOURCES
+SOURCE_EXTENSIONS = {"IGN": "jpg", "OSM": "png", "TOPO": "png"}
+SOURCE_ZOOMS = {"IGN": 16, "OSM": 15, "TOPO": 15}
+
+
+@functools.lru_cache(maxsize=4096)
+def render_tile(col, row, ext="png", zoom=15):
+    """
+    Deterministic tile: a colour from the coordinates, a grid and a few roads.
+
+    Returns:
+        bytes: Encoded tile.
+    """
+    digest = hashlib.sha256(f"{zoom}/{col}/{row}".encode()).digest()
+    image = Image.new("RGB", (256, 256), (200 + digest[0] % 56, 200 + digest[1] % 56, 180 + digest[2] % 76))
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((0, 0, 255, 255), outline=(150, 150, 150))
+    # Some detail so encoders and compressors have realistic work to do
+    for i in range(4):
+        start = (digest[3 + i] % 256, 0)
+        end = (digest[7 + i] % 256, 255)
+        draw.line((start, end), fill=(90 + digest[11 + i] % 100, 90, 90), width=1 + digest[15 + i] % 5)
+    draw.text((8, 8), f"{col},{row}", fill=(60, 60, 60))
+    buffer = io.BytesIO()
+    image_format = FORMATS[ext][0]
+    if image_format == "JPEG":
+        image.save(buffer, image_format, quality=85)
+    else:
+        image.save(buffer, image_format)
+    return buffer.getvalue()
+
+
+class MockTileServer:
+    """
+    Threaded HTTP tile server running in the background.
+
+    Tiles are served at /<SOURCE>/<zoom>/<col>/<row>.<png|jpg>. Latency and
+    errors are drawn from a generator seeded with `seed` and the tile path,
+    so the same tiles fail and the same delays apply on every run.
+
+    Args:
+        latency_ms: Base delay before each response
+        jitter_ms: Extra delay, uniform between 0 and jitter_ms
+        error_rate: Share of tiles answered with a 503
+        seed: Seed of the latency and error draws
+        port: Port to listen on, 0 picks a free one
+    """
+
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=0, host="127.0.0.1", port=0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.seed = seed
+        self.requests = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def sources(self):
+        """TileFetcher sources pointing at this server."""
+        return {
+            source: {
+                "url": f"{self.url}/{source}/{{zoom}}/{{col}}/{{row}}.{ext}",
+                "headers": {},
+                "zoom": SOURCE_ZOOMS[source],
+                "format": FORMATS[ext][0],
+            }
+            for source, ext in SOURCE_EXTENSIONS.items()
+        }
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def _handle(self, request):
+        match = TILE_PATH.match(request.path)
+        if match is None:
+            request.send_error(404)
+            return
+
+        draw = random.Random(f"{self.seed}:{request.path}")
+        delay = self.latency_ms + draw.uniform(0, self.jitter_ms)
+        failing = draw.random() < self.error_rate
+        with self._lock:
+            self.requests += 1
+            self.errors += failing
+        if delay > 0:
+            time.sleep(delay / 1000)
+        if failing:
+            request.send_error(503)
+            return
+
+        data = render_tile(int(match["col"]), int(match["row"]), match["ext"], int(match["zoom"]))
+        request.send_response(200)
+        request.send_header("Content-Type", FORMATS[match["ext"]][1])
+        request.send_header("Content-Length", str(len(data)))
+        request.end_headers()
+        request.wfile.write(data)
+
+    def serve_forever(self):
+        self._server.serve_forever()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockTileServer(args.latency_ms, args.jitter_ms, args.error_rate, args.seed, port=args.port)
+    print(f"Serving tiles at {server.url}/<SOURCE>/<zoom>/<col>/<row>.png")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
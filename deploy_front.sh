@@ -9,7 +9,7 @@ echo
 
 # Create archive of all necessary files
 echo "Creating archive..."
-tar -czf atlas.tar.gz Dockerfile requirements.txt .env frontend.py .streamlit/ fonts/
+tar -czf atlas.tar.gz Dockerfile requirements.txt .env frontend.py preview_image.py .streamlit/ fonts/
 
 # Send archive to server
 echo "Sending files to server..."
@@ -0,0 +1,227 @@
+import asyncio
+import os
+
+import utils
+from utils import (
+    LINE_COLOR, TILE_SOURCE, base_page_cache_fits, debug_print, layout_atlas, parse_page_selection,
+    render_encoded_pages,
+)
+from pdf_writer import PDF_RESOLUTION, PdfStreamWriter
+from instrumentation import RenderReport, current_report, recording, stage
+
+# Worker processes of the local pool
+RENDER_WORKERS = int(os.getenv("RENDER_WORKERS", str(os.cpu_count() or 1)))
+# Ranges handed out per worker: more, smaller ranges even out slow pages
+CHUNKS_PER_WORKER = int(os.getenv("CHUNKS_PER_WORKER", "2"))
+
+
+def split_page_ranges(page_numbers, chunk_count):
+    """
+    Split page numbers into at most chunk_count contiguous ranges of similar size.
+
+    Contiguous pages share tiles (pages overlap), so each worker's tile
+    cache and single-flight deduplication stay useful.
+
+    Returns:
+        list of lists of page numbers, in page order.
+    """
+    page_numbers = list(page_numbers)
+    chunk_count = max(1, min(chunk_count, len(page_numbers)))
+    size, extra = divmod(len(page_numbers), chunk_count)
+    chunks = []
+    start = 0
+    for index in range(chunk_count):
+        end = start + size + (1 if index < extra else 0)
+        chunks.append(page_numbers[start:end])
+        start = end
+    return chunks
+
+
+def chunk_track_points(pages, page_numbers, gpx_points):
+    """Track points of the tiles of the given pages only, to keep worker payloads small."""
+    tiles = {tile for number in page_numbers for column in pages[number] for tile in column}
+    return {tile: points for tile, points in gpx_points.items() if tile in tiles}
+
+
+def render_page_chunk(pages, page_numbers, gpx_points, tile_source=TILE_SOURCE, line_color=LINE_COLOR, corridor=None,
+                      cache_base_pages=True, thumbnail_levels=None):
+    """
+    Worker entry point: render some pages of a layout.
+
+    Runs in a worker process (or a Modal container), with its own event
+    loop and tile fetcher.
+
+    Args:
+        pages: Full layout from layout_atlas, needed for the navigation markers
+        page_numbers: Pages to render
+        gpx_points: Track points per tile, see chunk_track_points
+        corridor: Optional distance in tiles to the track, see utils.render_page
+        cache_base_pages: Write the stitched pages to the base page cache,
+            False when the whole render does not fit in it (see
+            utils.base_page_cache_fits)
+        thumbnail_levels: Also reduce the stitched pages by 2 ** thumbnail_levels
+            for an overview page, see overview.page_thumbnail
+
+    Returns:
+        (list of EncodedPage in the order of page_numbers, RenderReport.to_dict() of the worker,
+        list of the page thumbnails in the same order, empty without thumbnail_levels)
+    """
+    thumbnails = []
+    on_base_page = None
+    if thumbnail_levels is not None:
+        from overview import page_thumbnail
+
+        def on_base_page(page_number, image):
+            thumbnails.append(page_thumbnail(image, thumbnail_levels))
+
+    async def run():
+        try:
+            return [
+                encoded async for _, encoded in render_encoded_pages(pages, page_numbers, gpx_points, tile_source,
+                                                                     line_color, corridor, cache_base_pages,
+                                                                     on_base_page)
+            ]
+        finally:
+            # The fetcher the pages were rendered with
+            await utils.get_default_fetcher().close()
+
+    with recording(RenderReport()) as report:
+        encoded_pages = asyncio.run(run())
+    return encoded_pages, report.finish().to_dict(), thumbnails
+
+
+def render_process_pool(workers=RENDER_WORKERS, initializer=None, initargs=()):
+    """
+    Local pool of worker processes for render_page_chunk.
+
+    Workers are started by a fork server, not forked from this process:
+    it runs threads (page encoders, cache preloads, asyncio.to_thread) and
+    forking a process with threads can deadlock. Nothing set up here is
+    inherited, workers read their settings from the environment and make
+    their own tile fetcher and caches.
+
+    Args:
+        workers: Number of processes
+        initializer: Optional callable run first in every worker, e.g. to
+            install another tile fetcher, with the arguments initargs
+
+    Returns:
+        concurrent.futures.ProcessPoolExecutor
+    """
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("forkserver"),
+                               initializer=initializer, initargs=initargs)
+
+
+def process_pool_mapper(executor):
+    """
+    Map render_page_chunk over a concurrent.futures executor.
+
+    Returns:
+        Callable taking a list of render_page_chunk argument tuples and
+        returning an async iterator of their results, in order.
+    """
+    async def map_chunks(tasks):
+        loop = asyncio.get_running_loop()
+        futures = [loop.run_in_executor(executor, render_page_chunk, *task) for task in tasks]
+        try:
+            for future in futures:
+                yield await future
+        finally:
+            for future in futures:
+                future.cancel()
+
+    return map_chunks
+
+
+async def render_atlas_distributed(gpx, tile_source=TILE_SOURCE, line_color=LINE_COLOR, layout=None,
+                                   page_numbers=None, map_chunks=None, workers=RENDER_WORKERS, corridor=None,
+                                   overview=False):
+    """
+    Render the atlas of a GPX track on a pool of workers, as a stream of PDF chunks.
+
+    The layout is computed once, here. Page ranges are rendered and
+    JPEG-encoded by the workers, then written to the PDF in page order
+    without being decoded again. Pages are streamed as soon as the ranges
+    before them are done.
+
+    Args:
+        gpx: gpxpy.gpx.GPX object
+        tile_source: "IGN", "OSM" or "TOPO"
+        line_color: Colour of the track line
+        layout: Optional (pages, gpx_points) already computed by layout_atlas
+        page_numbers: Optional page selection (see parse_page_selection)
+        map_chunks: Callable mapping render_page_chunk over argument tuples,
+            see process_pool_mapper. Defaults to a local process pool, see
+            render_process_pool.
+        workers: Size of the default process pool, also sets the number of ranges
+        corridor: Optional distance in tiles to the track, see utils.render_page
+        overview: Add an overview page in front of the atlas, built here from
+            the pages of the workers (see overview.py). Not added to a page
+            selection.
+
+    Yields:
+        bytes: Consecutive parts of the PDF. Nothing if the track produced no pages.
+    """
+    pages, gpx_points = layout if layout is not None else layout_atlas(gpx, tile_source)
+
+    if len(pages) == 0:
+        return
+
+    overview_page = None
+    if overview and page_numbers is None:
+        from overview import OverviewPage
+
+        overview_page = OverviewPage(pages, gpx_points, tile_source, line_color)
+
+    if page_numbers is None:
+        page_numbers = range(len(pages))
+    else:
+        page_numbers = parse_page_selection(page_numbers, len(pages))
+
+    chunks = split_page_ranges(page_numbers, workers * CHUNKS_PER_WORKER)
+    # Decided for the whole render, each worker only sees its range
+    cache_base_pages = base_page_cache_fits(len(page_numbers))
+    thumbnail_levels = overview_page.levels if overview_page is not None else None
+    tasks = [
+        (pages, chunk, chunk_track_points(pages, chunk, gpx_points), tile_source, line_color, corridor,
+         cache_base_pages, thumbnail_levels)
+        for chunk in chunks
+    ]
+    debug_print(f"[DEBUG] Rendering {len(page_numbers)} pages in {len(tasks)} ranges on {workers} workers")
+
+    executor = None
+    if map_chunks is None:
+        executor = render_process_pool(workers)
+        map_chunks = process_pool_mapper(executor)
+
+    # Stages and tiles of the workers are added to the report of this render
+    report = current_report()
+    try:
+        writer = PdfStreamWriter(resolution=PDF_RESOLUTION)
+        yield writer.begin()
+        # Ranges come back in page order
+        numbers = iter(page_numbers)
+        async for encoded_pages, worker_report, thumbnails in map_chunks(tasks):
+            if report is not None:
+                report.merge(worker_report)
+            for index, encoded in enumerate(encoded_pages):
+                page_number = next(numbers)
+                if overview_page is not None:
+                    overview_page.add_thumbnail(page_number, thumbnails[index])
+                with stage("write"):
+                    chunk = writer.add_page(encoded)
+                yield chunk
+        if overview_page is not None:
+            encoded = await overview_page.render()
+            with stage("write"):
+                chunk = writer.add_page(encoded, position=0)
+            yield chunk
+        with stage("write"):
+            chunk = writer.close()
+        yield chunk
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
@@ -4,6 +4,8 @@ import streamlit_analytics2 as streamlit_analytics
 import requests
 from io import BytesIO
 
+from preview_image import render_preview_image
+
 from dotenv import load_dotenv
 # Set page configuration
 st.set_page_config(layout="wide", page_title="Atlas Generator", page_icon="./icon.ico")
@@ -39,6 +41,38 @@ line_color = st.sidebar.color_picker(
 if tile_source == "IGN":
     st.sidebar.info("IGN maps are optimized for France. For other regions, consider using OSM or TOPO.")
 
+
+
+@st.cache_data(show_spinner=False)
+def get_preview(file_content, file_name, tile_source):
+    """Page layout of the atlas from the backend, computed without downloading any tile."""
+    response = requests.post(
+        SERVERLESS_ADDRESS.rstrip("/") + "/preview",
+        files={'gpx_file': (file_name, file_content, 'application/gpx+xml')},
+        params={'_tile_source': tile_source},
+    )
+    response.raise_for_status()
+    return response.json()
+
+
+# Show how the atlas will be laid out before generating it
+if uploaded_file:
+    try:
+        preview = get_preview(uploaded_file.getvalue(), uploaded_file.name, tile_source)
+    except Exception as e:
+        preview = None
+        st.warning(f"Could not preview this GPX file: {e}")
+    if preview is not None and preview["page_count"] > 0:
+        st.subheader(f"Preview: {preview['page_count']} page(s)")
+        st.image(render_preview_image(preview, line_color=line_color),
+                 caption="Page layout, numbered as printed on the pages")
+    elif preview is not None:
+        st.warning("No track points found in this GPX file.")
+
+# Regenerate only some pages of an atlas already printed, e.g. after editing the route
+pages_selection = st.text_input("Pages to generate (optional)", placeholder="All pages, or e.g. 0-3,7",
+                                help="Page numbers as printed on the pages and shown in the preview")
+
 # Button to trigger the generation
 button_pressed = st.button("Generate !")
 
@@ -59,6 +93,8 @@ if uploaded_file and button_pressed:
             '_tile_source': tile_source,
             '_line_color': line_color
         }
+        if pages_selection.strip():
+            params['_pages'] = pages_selection
 
         # Sending the POST request
         response = requests.post(url, files=files, params=params)
@@ -75,6 +111,8 @@ if uploaded_file and button_pressed:
             st.success("Atlas generated successfully!")
             st.download_button(label="Download PDF", data=response.content, file_name="atlas.pdf", mime="application/pdf")
 
+        elif response.status_code == 422:
+            st.error(response.text)
         else:
             st.error(f"Failed to generate the PDF. Status code: {response.status_code}")
             st.error("Please try again or try with a different tile source.")
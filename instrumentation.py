@@ -0,0 +1,278 @@
+import contextlib
+import contextvars
+import json
+import sys
+import threading
+import time
+
+from metrics import REGISTRY, MetricsRegistry
+
+# Pipeline stages, in the order they run
+STAGES = ["parse", "project", "layout", "fetch", "stitch", "draw", "annotate", "encode", "overview", "write"]
+# Requested tiles are fetched, cached, derived or failed. Skipped tiles (corridor mode)
+# are not requested, they are filled from "fill" tiles requested at a lower zoom.
+# A "placeholder" is drawn instead of a tile missing or unreadable.
+TILE_RESULTS = ["requested", "fetched", "cached", "derived", "failed", "skipped", "fill", "placeholder"]
+TILES_HELP = "Tiles by result: " + ", ".join(TILE_RESULTS)
+# Tiles decoded, or shared with an identical tile decoded before
+DECODE_RESULTS = ["decoded", "shared"]
+
+stage_seconds = REGISTRY.counter("render_stage_seconds_total", "Wall time spent in each render stage")
+stage_cpu_seconds = REGISTRY.counter("render_stage_cpu_seconds_total", "Process CPU time spent in each render stage")
+tiles_total = REGISTRY.counter("tiles_total", TILES_HELP)
+tile_bytes_total = REGISTRY.counter("tile_bytes_downloaded_total", "Bytes of tiles downloaded")
+tile_decodes_total = REGISTRY.counter("tile_decodes_total", "Tiles decoded, or shared with an identical decoded tile")
+pages_total = REGISTRY.counter("render_pages_total", "Pages rendered")
+
+# Report of the render running in the current task, if any
+_current_report = contextvars.ContextVar("render_report", default=None)
+
+
+def peak_rss_bytes():
+    """Peak resident set size of this process, 0 where it cannot be measured."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class RenderReport:
+    """
+    Timings and counters of one render.
+
+    Stages are timed in wall and process CPU time. Renders interleave on
+    the event loop, so while a stage is awaiting (mostly "fetch"), CPU
+    time spent by other tasks of the process is counted in it too.
+    """
+
+    def __init__(self):
+        self.stages = {}
+        self.tiles = dict.fromkeys(TILE_RESULTS, 0)
+        self.decodes = dict.fromkeys(DECODE_RESULTS, 0)
+        self.bytes_downloaded = 0
+        self.page_seconds = []
+        self.peak_rss_bytes = 0
+        self.providers = {}
+        self._lock = threading.Lock()
+
+    def _provider(self, name):
+        return self.providers.setdefault(name, {
+            "requests": 0, "status": {}, "bytes": 0, "fetch_s": 0.0, "fetch_max_s": 0.0,
+            "decodes": 0, "decode_s": 0.0, "health": 1.0,
+        })
+
+    def add_stage(self, name, wall, cpu):
+        with self._lock:
+            stage = self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "calls": 0})
+            stage["wall_s"] += wall
+            stage["cpu_s"] += cpu
+            stage["calls"] += 1
+
+    def count_tile(self, result):
+        with self._lock:
+            self.tiles[result] += 1
+
+    def count_decode(self, result):
+        with self._lock:
+            self.decodes[result] += 1
+
+    def add_bytes_downloaded(self, nbytes):
+        with self._lock:
+            self.bytes_downloaded += nbytes
+
+    def add_response(self, provider, status, seconds, nbytes, health):
+        with self._lock:
+            stats = self._provider(provider)
+            stats["requests"] += 1
+            stats["status"][str(status)] = stats["status"].get(str(status), 0) + 1
+            stats["bytes"] += nbytes
+            stats["fetch_s"] += seconds
+            stats["fetch_max_s"] = max(stats["fetch_max_s"], seconds)
+            # Latest rolling score of the provider when the render used it
+            stats["health"] = health
+
+    def add_decode(self, provider, seconds):
+        with self._lock:
+            stats = self._provider(provider)
+            stats["decodes"] += 1
+            stats["decode_s"] += seconds
+
+    def add_page(self, seconds):
+        with self._lock:
+            self.page_seconds.append(seconds)
+
+    def finish(self):
+        """Record the peak memory, call once the render is done."""
+        self.peak_rss_bytes = max(self.peak_rss_bytes, peak_rss_bytes())
+        return self
+
+    def merge(self, other):
+        """Add a report (or its to_dict()) from another worker into this one."""
+        if isinstance(other, RenderReport):
+            other = other.to_dict()
+        for name, stage in other["stages"].items():
+            with self._lock:
+                mine = self.stages.setdefault(name, {"wall_s": 0.0, "cpu_s": 0.0, "calls": 0})
+                for field in ("wall_s", "cpu_s", "calls"):
+                    mine[field] += stage[field]
+        with self._lock:
+            for result, count in other["tiles"].items():
+                self.tiles[result] += count
+            for result, count in other.get("decodes", {}).items():
+                self.decodes[result] += count
+            self.bytes_downloaded += other["bytes_downloaded"]
+            self.page_seconds.extend(other["page_seconds"])
+            # Workers are separate processes, the largest one sizes the container
+            self.peak_rss_bytes = max(self.peak_rss_bytes, other["peak_rss_bytes"])
+            for name, theirs in other.get("providers", {}).items():
+                mine = self._provider(name)
+                for field in ("requests", "bytes", "fetch_s", "decodes", "decode_s"):
+                    mine[field] += theirs[field]
+                mine["fetch_max_s"] = max(mine["fetch_max_s"], theirs["fetch_max_s"])
+                mine["health"] = min(mine["health"], theirs["health"])
+                for status, count in theirs["status"].items():
+                    mine["status"][status] = mine["status"].get(status, 0) + count
+
+    @property
+    def complete(self):
+        """True if every tile was drawn: nothing failed, no placeholder. Only complete atlases are worth caching."""
+        return self.tiles["failed"] == 0 and self.tiles["placeholder"] == 0
+
+    @property
+    def decode_dedup_ratio(self):
+        """Tiles decoded or shared per actual decode, 1.0 if every tile was different."""
+        decoded = self.decodes["decoded"]
+        return round((decoded + self.decodes["shared"]) / decoded, 3) if decoded else 1.0
+
+    def to_dict(self):
+        ordered = sorted(self.stages, key=lambda name: STAGES.index(name) if name in STAGES else len(STAGES))
+        return {
+            "stages": {
+                name: {
+                    "wall_s": round(self.stages[name]["wall_s"], 4),
+                    "cpu_s": round(self.stages[name]["cpu_s"], 4),
+                    "calls": self.stages[name]["calls"],
+                }
+                for name in ordered
+            },
+            "tiles": dict(self.tiles),
+            "tiles_saved": self.tiles["skipped"] - self.tiles["fill"],
+            "decodes": dict(self.decodes),
+            "decode_dedup_ratio": self.decode_dedup_ratio,
+            "bytes_downloaded": self.bytes_downloaded,
+            "pages": len(self.page_seconds),
+            "page_seconds": [round(seconds, 4) for seconds in self.page_seconds],
+            "peak_rss_bytes": self.peak_rss_bytes,
+            "providers": {
+                name: dict(
+                    stats,
+                    status=dict(stats["status"]),
+                    fetch_s=round(stats["fetch_s"], 4),
+                    fetch_max_s=round(stats["fetch_max_s"], 4),
+                    decode_s=round(stats["decode_s"], 4),
+                )
+                for name, stats in sorted(self.providers.items())
+            },
+        }
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self):
+        """The report in Prometheus text format, for a push gateway or a textfile collector."""
+        registry = MetricsRegistry()
+        wall = registry.counter("render_stage_seconds_total", "Wall time spent in each render stage")
+        cpu = registry.counter("render_stage_cpu_seconds_total", "Process CPU time spent in each render stage")
+        for name, stage in self.stages.items():
+            wall.inc(stage["wall_s"], stage=name)
+            cpu.inc(stage["cpu_s"], stage=name)
+        tiles = registry.counter("tiles_total", TILES_HELP)
+        for result, count in self.tiles.items():
+            tiles.inc(count, result=result)
+        decodes = registry.counter("tile_decodes_total", "Tiles decoded, or shared with an identical decoded tile")
+        for result, count in self.decodes.items():
+            decodes.inc(count, result=result)
+        registry.counter("tile_bytes_downloaded_total", "Bytes of tiles downloaded").inc(self.bytes_downloaded)
+        registry.counter("render_pages_total", "Pages rendered").inc(len(self.page_seconds))
+        registry.gauge("render_page_seconds_max", "Slowest page render").set(max(self.page_seconds, default=0))
+        registry.gauge("process_peak_rss_bytes", "Peak resident memory of the render").set(self.peak_rss_bytes)
+        responses = registry.counter("tile_responses_total", "Tile responses by provider and HTTP status, error if none")
+        provider_bytes = registry.counter("tile_provider_bytes_total", "Bytes of tiles downloaded by provider")
+        fetch = registry.counter("tile_fetch_seconds_total", "Time spent downloading tiles by provider")
+        decode = registry.counter("tile_decode_seconds_total", "Time spent decoding tiles by provider")
+        health = registry.gauge("tile_provider_health", "Rolling health by provider, 1 healthy, 0 failing")
+        for name, stats in self.providers.items():
+            for status, count in stats["status"].items():
+                responses.inc(count, provider=name, status=status)
+            provider_bytes.inc(stats["bytes"], provider=name)
+            fetch.inc(stats["fetch_s"], provider=name)
+            decode.inc(stats["decode_s"], provider=name)
+            health.set(stats["health"], provider=name)
+        return registry.render_prometheus()
+
+
+def current_report():
+    """RenderReport of the render running in this task, or None."""
+    return _current_report.get()
+
+
+@contextlib.contextmanager
+def recording(report):
+    """Attribute the stages and tiles of the code run inside (and its tasks) to report."""
+    token = _current_report.set(report)
+    try:
+        yield report
+    finally:
+        _current_report.reset(token)
+
+
+@contextlib.contextmanager
+def stage(name):
+    """Time a pipeline stage into the process metrics and the current report."""
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        stage_seconds.inc(wall, stage=name)
+        stage_cpu_seconds.inc(cpu, stage=name)
+        report = _current_report.get()
+        if report is not None:
+            report.add_stage(name, wall, cpu)
+
+
+def count_tile(result):
+    """Count a tile result, one of TILE_RESULTS."""
+    tiles_total.inc(result=result)
+    report = _current_report.get()
+    if report is not None:
+        report.count_tile(result)
+
+
+def count_decode(result):
+    """Count a tile "decoded", or "shared" with an identical tile decoded before."""
+    tile_decodes_total.inc(result=result)
+    report = _current_report.get()
+    if report is not None:
+        report.count_decode(result)
+
+
+def count_bytes_downloaded(nbytes):
+    """Count bytes actually downloaded, once per download however many renders share it."""
+    tile_bytes_total.inc(nbytes)
+    report = _current_report.get()
+    if report is not None:
+        report.add_bytes_downloaded(nbytes)
+
+
+def record_page(seconds):
+    """Count a rendered page and its render time."""
+    pages_total.inc()
+    report = _current_report.get()
+    if report is not None:
+        report.add_page(seconds)
@@ -1,16 +1,27 @@
+import os
 import shlex
 import subprocess
 from pathlib import Path
 
 import asyncio
 
-import gpxpy
-
-from utils import main
+from utils import (
+    CORRIDOR_TILES, NUMBER_COLUMNS, NUMBER_ROWS, OVERVIEW_PAGE, PREFETCH_TILES, parse_gpx, parse_page_selection,
+    merge_gpx, render_atlas, render_settings,
+)
+from prefetch import TilePrefetcher, layout_atlas_prefetching, parse_gpx_prefetching
+from result_cache import RESULT_CACHE_DIR, get_default_cache, render_key
+from instrumentation import RenderReport, recording
+from single_flight import SingleFlightStream
+from distributed_render import render_atlas_distributed, render_page_chunk
+from admission import AdmissionController, AdmissionRejected, estimate_job_bytes
+from metrics import REGISTRY
+from provider_health import PROVIDERS
+from preview import build_preview
 import modal
-from modal import App, web_endpoint
+from modal import App
 from fastapi import Response
-from fastapi.responses import FileResponse
+from fastapi.responses import StreamingResponse
 from fastapi import FastAPI, File, UploadFile
 
 streamlit_script_local_path = Path(__file__).parent / "utils.py"
@@ -22,10 +33,26 @@ if not streamlit_script_local_path.exists():
 
 image = (
     modal.Image.debian_slim()
-    .pip_install("streamlit", "numpy", "pandas", "gpxpy", "python-dotenv", "Pillow",
-                 "asyncio", "aiohttp", "stqdm", "pyproj", "fastapi")
+    # Backend only: no streamlit/stqdm/pandas, they slow down container cold starts
+    .pip_install("numpy", "gpxpy", "python-dotenv", "Pillow",
+                 "aiohttp", "tqdm", "pyproj", "fastapi")
     .add_local_file(str(streamlit_script_local_path), "/root/utils.py")
     .add_local_file("page_generation.py", "/root/page_generation.py")
+    .add_local_file("result_cache.py", "/root/result_cache.py")
+    .add_local_file("single_flight.py", "/root/single_flight.py")
+    .add_local_file("tile_fetcher.py", "/root/tile_fetcher.py")
+    .add_local_file("pdf_writer.py", "/root/pdf_writer.py")
+    .add_local_file("admission.py", "/root/admission.py")
+    .add_local_file("metrics.py", "/root/metrics.py")
+    .add_local_file("preview.py", "/root/preview.py")
+    .add_local_file("preview_image.py", "/root/preview_image.py")
+    .add_local_file("distributed_render.py", "/root/distributed_render.py")
+    .add_local_file("instrumentation.py", "/root/instrumentation.py")
+    .add_local_file("provider_health.py", "/root/provider_health.py")
+    .add_local_file("prefetch.py", "/root/prefetch.py")
+    .add_local_file("overview.py", "/root/overview.py")
+    .add_local_file("page_compositor.py", "/root/page_compositor.py")
+    .add_local_file("tile_bundle.py", "/root/tile_bundle.py")
     .add_local_file(".env", "/root/.env")
     .add_local_file("icon.ico", "/root/icon.ico")
     .add_local_file("fonts/FreeMono.ttf", "/usr/share/fonts/truetype/freefont/FreeMono.ttf")
@@ -36,18 +63,166 @@ app = modal.App(
     name="serve-atlas", image=image
 )
 
+web_app = FastAPI()
+
+# Identical requests running at the same time in this container share one render.
+# Spooled next to the cached atlases: a complete atlas is linked into the cache, not copied
+render_streams = SingleFlightStream(spool_dir=RESULT_CACHE_DIR)
+# Keeps the sum of the estimated peak memory of running renders within budget
+admission = AdmissionController()
+
+PDF_HEADERS = {"Content-Disposition": 'attachment; filename="map.pdf"'}
+# Cached atlases are streamed in reads of this size
+CACHED_CHUNK_BYTES = 1024 * 1024
+
+# Atlases with at least this many pages are split into page ranges rendered by other containers
+DISTRIBUTED_MIN_PAGES = int(os.getenv("DISTRIBUTED_MIN_PAGES", "8"))
+DISTRIBUTED_WORKERS = int(os.getenv("DISTRIBUTED_WORKERS", "16"))
+
+
+@app.function(timeout=600)
+def render_chunk(pages, page_numbers, gpx_points, tile_source, line_color, corridor=None, cache_base_pages=True,
+                 thumbnail_levels=None):
+    # JPEG-encoded pages, the worker's report and overview thumbnails, merged into the PDF by the web container
+    return render_page_chunk(pages, page_numbers, gpx_points, tile_source, line_color, corridor, cache_base_pages,
+                             thumbnail_levels)
+
+
+async def modal_mapper(tasks):
+    """Map render_chunk over containers, results in the order of tasks."""
+    async for result in render_chunk.starmap.aio(tasks):
+        yield result
+
+
+def is_distributed(page_count):
+    return page_count >= DISTRIBUTED_MIN_PAGES
+
+
+async def admitted_render(nbytes, gpx, tile_source, line_color, layout, page_numbers=None, prefetcher=None):
+    """render_atlas, giving back the admitted memory and stopping the prefetcher once done."""
+    page_count = len(page_numbers) if page_numbers is not None else len(layout[0])
+    if is_distributed(page_count):
+        chunks = render_atlas_distributed(gpx, tile_source, line_color, layout=layout, page_numbers=page_numbers,
+                                          map_chunks=modal_mapper, workers=DISTRIBUTED_WORKERS,
+                                          corridor=CORRIDOR_TILES, overview=OVERVIEW_PAGE)
+    else:
+        chunks = render_atlas(gpx, tile_source, line_color, layout=layout, page_numbers=page_numbers,
+                              corridor=CORRIDOR_TILES, overview=OVERVIEW_PAGE)
+    try:
+        async for chunk in chunks:
+            yield chunk
+    finally:
+        admission.release(nbytes)
+        if prefetcher is not None:
+            await prefetcher.stop()
+
+
+def read_file(f, chunk_size=CACHED_CHUNK_BYTES):
+    """Chunks of an open binary file, closed once read. Iterated in a thread by StreamingResponse."""
+    with f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+@web_app.post("/")
+async def render(gpx_file: list[UploadFile] = File(...), _tile_source:str = "IGN", _line_color:str = "#B700FF",
+                 _pages:str = ""):
+    # Several files (e.g. one per day of a trip) make one atlas, _line_color then has one colour per file:
+    # "#B700FF,#0080FF"
+    contents = [await upload.read() for upload in gpx_file]
+    gpxs = await asyncio.gather(*(parse_gpx_prefetching(data, _tile_source) for data in contents))
+    gpx, line_color = merge_gpx(gpxs, [color.strip() for color in _line_color.split(",")])
+
+    if gpx.get_track_points_no() == 0:
+        return Response(content="No track points found in the GPX file", status_code=422)
+
+    # Optional page selection, e.g. "3-5,8": only these pages are fetched and rendered
+    page_numbers = None
+    settings = render_settings(_tile_source, line_color, CORRIDOR_TILES, OVERVIEW_PAGE)
+    if _pages.strip():
+        try:
+            page_numbers = parse_page_selection(_pages, None)
+        except ValueError as e:
+            return Response(content=str(e), status_code=422)
+        settings["pages"] = page_numbers
+
+    # Identical track + settings: serve the stored atlas without rendering
+    cache = get_default_cache()
+    cache_key = render_key(gpx, settings)
+    cached = await asyncio.to_thread(cache.open, cache_key)
+    if cached is not None:
+        return StreamingResponse(read_file(cached), media_type="application/pdf", headers=PDF_HEADERS)
+
+    if not render_streams.is_in_flight(cache_key):
+        # The layout needs no tile, its page count sizes the job before any fetching
+        layout = await layout_atlas_prefetching(gpx, _tile_source)
+        page_count = len(layout[0])
+        if page_numbers is not None:
+            try:
+                page_numbers = parse_page_selection(page_numbers, page_count)
+            except ValueError as e:
+                return Response(content=str(e), status_code=422)
+            page_count = len(page_numbers)
+        nbytes = estimate_job_bytes(page_count, NUMBER_COLUMNS, NUMBER_ROWS)
+        try:
+            await admission.acquire(nbytes)
+        except AdmissionRejected as e:
+            return Response(content=f"Server busy, please retry later ({e})", status_code=503,
+                            headers={"Retry-After": "30"})
+
+        if not render_streams.is_in_flight(cache_key):
+            # The tiles of the pages download ahead of the render, stopped by it once done.
+            # Pages rendered in other containers do not read the tiles prefetched here.
+            prefetcher = None
+            if PREFETCH_TILES and not is_distributed(page_count):
+                prefetcher = TilePrefetcher(_tile_source).start()
+                await prefetcher.submit_pages(layout[0], page_numbers, layout[1], CORRIDOR_TILES)
+            def cache_complete(path):
+                # An atlas with missing tiles is not cached: they are retried on the next request
+                if report.complete:
+                    cache.put_file(cache_key, path)
+
+            # Pages are sent as they are rendered; the complete PDF is cached at the end.
+            # The render task records its tiles into report, the context is copied when it starts
+            with recording(RenderReport()) as report:
+                chunks = render_streams.stream(
+                    cache_key, admitted_render, nbytes, gpx, _tile_source, line_color, layout, page_numbers,
+                    prefetcher, on_complete=cache_complete,
+                )
+            return StreamingResponse(chunks, media_type="application/pdf", headers=PDF_HEADERS)
+
+        # An identical request started rendering while this one was queued
+        admission.release(nbytes)
+
+    chunks = render_streams.stream(cache_key, render_atlas, gpx, _tile_source, line_color,
+                                   page_numbers=page_numbers, corridor=CORRIDOR_TILES, overview=OVERVIEW_PAGE)
+    return StreamingResponse(chunks, media_type="application/pdf", headers=PDF_HEADERS)
+
+
+@web_app.post("/preview")
+async def preview(gpx_file: UploadFile = File(...), _tile_source:str = "IGN"):
+    # Layout only: page rectangles and a simplified track, no tile fetched
+    contents = await gpx_file.read()
+    gpx = parse_gpx(contents)
+    return build_preview(gpx, _tile_source)
+
+
+@web_app.get("/metrics")
+async def metrics():
+    return Response(content=REGISTRY.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@web_app.get("/providers")
+async def providers():
+    # Rolling error rate, latency and health score of each tile provider
+    return PROVIDERS.summary()
+
 
 @app.function(
     timeout=600,
     allow_concurrent_inputs=100,
 )
-@web_endpoint(method="POST")
-async def run(gpx_file: UploadFile = File(...), _tile_source:str = "IGN", _line_color:str = "#B700FF"):
-    contents = await gpx_file.read()
-    gpx = gpxpy.parse(contents.decode('utf-8'))
-    file_path = await main(gpx, tile_source=_tile_source, line_color=_line_color)
-
-    return FileResponse(
-        file_path,
-        media_type="application/pdf", filename="map.pdf"
-    )
+@modal.asgi_app()
+def run():
+    # Same function name as the former endpoint, so the deployed URL is unchanged
+    return web_app
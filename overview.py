@@ -0,0 +1,182 @@
+"""
+Overview page of an atlas: the whole route, with the outline and number of every page.
+
+The base map of the overview is made of the pages themselves: each
+stitched page is reduced to the overview scale as it is rendered, before
+the track, page number, scale and markers are drawn on it, so no tile is
+fetched or decoded again for the areas the atlas covers. Tiles at the
+lower zoom of the overview are only fetched for the areas around and
+between the pages.
+
+The overview shows the whole atlas: it is not added to the renders of a
+page selection. It is the first page of the PDF, but rendered last.
+"""
+
+import asyncio
+from collections import Counter
+
+from PIL import Image, ImageDraw
+
+import utils
+from instrumentation import stage
+from pdf_writer import encode_page
+from preview import build_preview
+from utils import (
+    BACKGROUND_COLOR, LINE_COLOR, NUMBER_COLUMNS, NUMBER_ROWS, TILE_SOURCE, debug_print, load_font, split_tracks,
+)
+
+# Page pixels around the pages on the overview
+OVERVIEW_MARGIN = 64
+
+
+def page_thumbnail(image, levels):
+    """A stitched page reduced by 2 ** levels, each pixel the average of the ones it covers."""
+    return image.reduce(2 ** levels)
+
+
+def overview_levels(bounds, margin=OVERVIEW_MARGIN):
+    """Zoom levels below the atlas for the pages in bounds to fit on one page."""
+    width = (bounds["max_col"] - bounds["min_col"]) * 256
+    height = (bounds["max_row"] - bounds["min_row"]) * 256
+    levels = 0
+    while (width >> levels > NUMBER_COLUMNS * 256 - 2 * margin
+           or height >> levels > NUMBER_ROWS * 256 - 2 * margin):
+        levels += 1
+    return levels
+
+
+class OverviewPage:
+    """
+    Overview page of an atlas, built from its rendered pages.
+
+    Args:
+        pages: Filled pages from get_filled_pages
+        gpx_points: Track points per tile, as returned by extract_track
+        tile_source: "IGN", "OSM" or "TOPO"
+        line_color: Colour of the track line, or the colour of each GPX file
+            of a merged atlas (see utils.merge_gpx)
+    """
+
+    def __init__(self, pages, gpx_points, tile_source=TILE_SOURCE, line_color=LINE_COLOR):
+        self.pages = pages
+        self.gpx_points = gpx_points
+        self.tile_source = tile_source
+        self.line_color = line_color
+        self.preview = build_preview(None, tile_source, layout=(pages, gpx_points))
+        bounds = self.preview["bounds"]
+        self.levels = overview_levels(bounds)
+        # Overview pixels per tile of the atlas
+        self.scale = 256 / 2 ** self.levels
+        self.width, self.height = NUMBER_COLUMNS * 256, NUMBER_ROWS * 256
+        # Pixel of the atlas zoom at the top-left corner of the overview, the pages centered
+        span = 2 ** self.levels
+        self.origin = (
+            bounds["min_col"] * 256 - (self.width * span - (bounds["max_col"] - bounds["min_col"]) * 256) / 2,
+            bounds["min_row"] * 256 - (self.height * span - (bounds["max_row"] - bounds["min_row"]) * 256) / 2,
+        )
+        self._thumbnails = {}
+
+    def to_px(self, col, row):
+        """Overview pixel of a tile position of the atlas."""
+        return ((col * 256 - self.origin[0]) / 2 ** self.levels, (row * 256 - self.origin[1]) / 2 ** self.levels)
+
+    def add_base_page(self, page_number, image):
+        """
+        Keep a stitched page, reduced to the overview scale.
+
+        Give it as utils.render_page hands it over, before anything is
+        drawn on it.
+
+        Args:
+            page_number: Index of the page in pages
+            image: The stitched page, not kept
+        """
+        self.add_thumbnail(page_number, page_thumbnail(image, self.levels))
+
+    def add_thumbnail(self, page_number, thumbnail):
+        """Keep a page already reduced by page_thumbnail, e.g. by a worker process."""
+        self._thumbnails[page_number] = thumbnail
+
+    def _tracks(self):
+        """(colour, overview pixels) of the track line of each GPX file."""
+        if isinstance(self.line_color, str):
+            return [(self.line_color, [self.to_px(x, y) for x, y in self.preview["track"]])]
+        points = sorted(
+            (point_index, col + offset_x / 256, row + offset_y / 256)
+            for (col, row), tile_points in self.gpx_points.items()
+            for offset_x, offset_y, _, point_index in tile_points
+        )
+        return [
+            (color, [self.to_px(x, y) for x, y in track])
+            for color, track in split_tracks([(x, y, index) for index, x, y in points], self.line_color)
+        ]
+
+    def _missing_tiles(self):
+        """Tiles of the overview zoom not covered by the added pages."""
+        covered = {
+            (int(col), int(row))
+            for page_number in self._thumbnails
+            for column in self.pages[page_number]
+            for col, row in column
+        }
+        # Covered tiles of the atlas under each tile of the overview zoom
+        children = Counter((col >> self.levels, row >> self.levels) for col, row in covered)
+        size = 2 ** self.levels
+        first_col, first_row = int(self.origin[0] // (256 * size)), int(self.origin[1] // (256 * size))
+        last_col = int((self.origin[0] + self.width * size - 1) // (256 * size))
+        last_row = int((self.origin[1] + self.height * size - 1) // (256 * size))
+        return [
+            (col, row)
+            for col in range(first_col, last_col + 1)
+            for row in range(first_row, last_row + 1)
+            if children[(col, row)] < size * size
+        ]
+
+    async def render(self):
+        """
+        Draw the overview page.
+
+        Returns:
+            EncodedPage ready for PdfStreamWriter.add_page.
+        """
+        image = Image.new("RGB", (self.width, self.height), BACKGROUND_COLOR)
+        missing = self._missing_tiles()
+        if missing:
+            fetcher = utils.get_default_fetcher()
+            zoom = fetcher.tile_key((0, 0), self.tile_source).zoom - self.levels
+            with stage("fetch"):
+                tiles = await asyncio.gather(
+                    *(fetcher.get_tile(col_row, self.tile_source, zoom) for col_row in missing)
+                )
+            for (col, row), tile in tiles:
+                if not tile.info.get("placeholder"):
+                    x, y = self.to_px(col * 2 ** self.levels, row * 2 ** self.levels)
+                    image.paste(tile.convert("RGB"), (round(x), round(y)))
+        debug_print(f"[DEBUG] Overview from {len(self._thumbnails)} pages and {len(missing)} tiles"
+                    f" {self.levels} zoom levels below")
+
+        with stage("overview"):
+            for page_number, thumbnail in self._thumbnails.items():
+                col, row = self.pages[page_number][0][0]
+                x, y = self.to_px(int(col), int(row))
+                image.paste(thumbnail, (round(x), round(y)))
+
+            draw = ImageDraw.Draw(image)
+            for page in self.preview["pages"]:
+                left, top = self.to_px(page["col"], page["row"])
+                right, bottom = self.to_px(page["col"] + page["columns"], page["row"] + page["rows"])
+                draw.rectangle((left, top, right, bottom), outline=(0, 0, 0), width=4)
+
+            for color, track in self._tracks():
+                if len(track) > 1:
+                    draw.line(track, fill=color, width=6)
+
+            # Numbers last so the track never hides them, sized to the page outlines
+            font = load_font("FreeMonoBold.ttf", int(min(60, max(16, self.scale * 3))))
+            for page in self.preview["pages"]:
+                left, top = self.to_px(page["col"], page["row"])
+                draw.text((left + 6, top + 4), str(page["number"]), font=font, fill=(0, 0, 0),
+                          stroke_width=3, stroke_fill=(255, 255, 255))
+
+        with stage("encode"):
+            return encode_page(image)
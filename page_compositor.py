@@ -0,0 +1,79 @@
+from PIL import Image, ImageColor, ImageDraw
+
+TILE_SIZE = 256
+# Coverage above half sets the pixel to the line colour, see PageCanvas.blend_track
+LINE_MASK = [0] * 129 + [255] * 127
+
+
+class PageCanvas:
+    """
+    A page being assembled, in one preallocated RGB image.
+
+    Tiles are pasted into it straight from the decoded tiles, a single
+    copy each, the track is drawn in place, and image() hands the page to
+    the encoder without copying it.
+
+    Args:
+        columns: Page width in tiles
+        rows: Page height in tiles
+        tile_size: Tile side in pixels
+    """
+
+    def __init__(self, columns, rows, tile_size=TILE_SIZE):
+        self.tile_size = tile_size
+        self.width, self.height = columns * tile_size, rows * tile_size
+        # Not initialised, every pixel is covered by a tile
+        self._image = Image.new("RGB", (self.width, self.height), None)
+
+    @classmethod
+    def from_image(cls, image, tile_size=TILE_SIZE):
+        """Canvas holding a copy of a stitched page, e.g. read from the base page cache."""
+        canvas = cls(image.width // tile_size, image.height // tile_size, tile_size)
+        canvas.paste(image, (0, 0))
+        return canvas
+
+    def place_tile(self, column, row, image):
+        """Copy a decoded tile into its place in the page."""
+        self.paste(image, (column * self.tile_size, row * self.tile_size))
+
+    def paste(self, image, position):
+        """Copy a PIL image into the page at position (x, y), converted to RGB if needed."""
+        self._image.paste(image, position)
+
+    def crop(self, box):
+        """RGB PIL image of a (left, top, right, bottom) region, a copy to draw on and paste back."""
+        return self._image.crop(box)
+
+    def blend_track(self, points, line_color, width):
+        """
+        Draw the track line in place.
+
+        The line is drawn into a coverage buffer the size of the track's
+        bounding box only, then its colour is set in the page wherever the
+        coverage is set.
+
+        Args:
+            points: (x, y) track points in page pixels, None entries skipped
+            line_color: Colour of the line
+            width: Line width in pixels
+        """
+        points = [point for point in points if point is not None]
+        if len(points) < 2:
+            return
+        xs = [x for x, _ in points]
+        ys = [y for _, y in points]
+        left, top = max(0, int(min(xs)) - width), max(0, int(min(ys)) - width)
+        right = min(self.width, int(max(xs)) + width + 1)
+        bottom = min(self.height, int(max(ys)) + width + 1)
+        if right <= left or bottom <= top:
+            return
+
+        coverage = Image.new("L", (right - left, bottom - top), 0)
+        draw = ImageDraw.Draw(coverage)
+        for (x0, y0), (x1, y1) in zip(points, points[1:]):
+            draw.line((x0 - left, y0 - top, x1 - left, y1 - top), fill=255, width=width)
+        self._image.paste(ImageColor.getrgb(line_color)[:3], (left, top, right, bottom), coverage.point(LINE_MASK))
+
+    def image(self):
+        """The page as a PIL image, not a copy and read-only: draw through crop() and paste()."""
+        return self._image
@@ -29,11 +29,14 @@ def put_tiles_in_pages(tiles, NUMBER_ROWS, NUMBER_COLUMNS):
     debug_print(f"[DEBUG put_tiles_in_pages] INPUT: {len(tiles)} tiles, NUMBER_ROWS={NUMBER_ROWS}, NUMBER_COLUMNS={NUMBER_COLUMNS}")
     debug_print(f"[DEBUG put_tiles_in_pages] First 5 tiles: {tiles[:5]}")
 
-    full_processed_list = []
+    # A set: membership is checked for every tile of every page
+    processed = set()
     pages = []
+    # Tiles not placed yet, in chronological order; each page only scans these
+    remaining = list(tiles)
 
     for tile_of_ref in tiles:
-        if tile_of_ref not in full_processed_list:
+        if tile_of_ref not in processed:
             # Track the extent of the current page
             min_row = tile_of_ref[1]
             min_col = tile_of_ref[0]
@@ -41,13 +44,15 @@ def put_tiles_in_pages(tiles, NUMBER_ROWS, NUMBER_COLUMNS):
             max_col = tile_of_ref[0]
             page_one = []
 
-            for idx, tile in enumerate(tiles):
-                if tile not in full_processed_list:
+            for tile in remaining:
+                if tile not in processed:
+                    col, row = tile
                     # Calculate what the new extent would be if we add this tile
-                    new_min_row = min(min_row, tile[1])
-                    new_max_row = max(max_row, tile[1])
-                    new_min_col = min(min_col, tile[0])
-                    new_max_col = max(max_col, tile[0])
+                    # (plain comparisons, this loop is the hot path of the layout)
+                    new_min_row = row if row < min_row else min_row
+                    new_max_row = row if row > max_row else max_row
+                    new_min_col = col if col < min_col else min_col
+                    new_max_col = col if col > max_col else max_col
 
                     # Check if the total span would exceed the page limits
                     row_span = new_max_row - new_min_row
@@ -55,7 +60,7 @@ def put_tiles_in_pages(tiles, NUMBER_ROWS, NUMBER_COLUMNS):
 
                     if (col_span < NUMBER_COLUMNS and row_span < NUMBER_ROWS):
                         page_one.append(tile)
-                        full_processed_list.append(tile)
+                        processed.add(tile)
                         # Update the extent to include this tile
                         min_row = new_min_row
                         max_row = new_max_row
@@ -63,6 +68,7 @@ def put_tiles_in_pages(tiles, NUMBER_ROWS, NUMBER_COLUMNS):
                         max_col = new_max_col
 
             pages.append(page_one)
+            remaining = [tile for tile in remaining if tile not in processed]
 
     debug_print(f"[DEBUG put_tiles_in_pages] OUTPUT: {len(pages)} pages, tiles per page: {[len(p) for p in pages]}")
     return pages
@@ -0,0 +1,174 @@
+import io
+import os
+from collections import namedtuple
+
+# Try to load dotenv if available (for production), but don't fail if missing (for tests)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+PDF_RESOLUTION = 100.0
+JPEG_QUALITY = 75  # Same as Pillow's PDF export
+# Each page waiting for an encoding thread holds its bitmap (~33 MB for 9x14 tiles), so few threads by default
+MAX_DEFAULT_ENCODE_WORKERS = 4
+
+
+def default_encode_workers():
+    """Cores this process may run on, at most MAX_DEFAULT_ENCODE_WORKERS."""
+    try:
+        # The CPUs of the container, os.cpu_count() is the host's
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on macOS and Windows
+        cores = os.cpu_count() or 1
+    return min(cores, MAX_DEFAULT_ENCODE_WORKERS)
+
+
+# Threads compressing the finished pages while the next ones render, 0 compresses each page before the next.
+# JPEG encoding releases the GIL, so one per core up to MAX_DEFAULT_ENCODE_WORKERS
+ENCODE_WORKERS = int(os.getenv("ENCODE_WORKERS", str(default_encode_workers())))
+
+# An already compressed page image, ready to be written into a PDF
+EncodedPage = namedtuple("EncodedPage", ["width", "height", "data", "filter", "color_space"])
+
+
+def encode_page(image, quality=JPEG_QUALITY):
+    """
+    Compress a page image the way it is embedded in the PDF.
+
+    Args:
+        image: PIL.Image.Image in RGB mode
+        quality: JPEG quality
+
+    Returns:
+        EncodedPage with the JPEG (DCTDecode) stream.
+    """
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return EncodedPage(image.width, image.height, buffer.getvalue(), "DCTDecode", "DeviceRGB")
+
+
+class PdfStreamWriter:
+    """
+    Write a PDF of full-page images incrementally.
+
+    Each call returns the bytes to append to the output, so pages can be
+    sent as soon as they are rendered. The page tree, cross-reference
+    table and trailer only depend on object offsets and are written last,
+    by close().
+
+    Object 1 is the catalog and object 2 the page tree, both written at
+    the end; each page takes three objects (image, content stream, page).
+
+    Args:
+        resolution: Pixels per inch, sets the physical page size
+    """
+
+    CATALOG_ID = 1
+    PAGES_ID = 2
+
+    def __init__(self, resolution=PDF_RESOLUTION):
+        self.resolution = resolution
+        self._offset = 0
+        self._offsets = {}
+        self._page_ids = []
+        self._next_id = 3
+        self._started = False
+        self._closed = False
+
+    @property
+    def page_count(self):
+        return len(self._page_ids)
+
+    def _object(self, object_id, body, stream=None):
+        self._offsets[object_id] = self._offset
+        chunk = f"{object_id} 0 obj\n".encode("ascii") + body
+        if stream is not None:
+            chunk += b"\nstream\n" + stream + b"\nendstream"
+        chunk += b"\nendobj\n"
+        return self._emit(chunk)
+
+    def _emit(self, chunk):
+        self._offset += len(chunk)
+        return chunk
+
+    def begin(self):
+        """Return the PDF header."""
+        if self._started:
+            return b""
+        self._started = True
+        # The binary comment marks the file as binary for transfer tools
+        return self._emit(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def add_page(self, page, position=None):
+        """
+        Return the bytes of one page.
+
+        Args:
+            page: EncodedPage
+            position: Optional index of the page in the document, e.g. 0 for a
+                page written last but shown first. Appended by default.
+        """
+        if self._closed:
+            raise ValueError("Cannot add a page to a closed PDF")
+        chunk = self.begin()
+
+        image_id, contents_id, page_id = self._next_id, self._next_id + 1, self._next_id + 2
+        self._next_id += 3
+        if position is None:
+            self._page_ids.append(page_id)
+        else:
+            self._page_ids.insert(position, page_id)
+
+        width = page.width * 72.0 / self.resolution
+        height = page.height * 72.0 / self.resolution
+
+        chunk += self._object(
+            image_id,
+            (
+                f"<< /Type /XObject /Subtype /Image /Width {page.width} /Height {page.height}"
+                f" /ColorSpace /{page.color_space} /BitsPerComponent 8"
+                f" /Filter /{page.filter} /Length {len(page.data)} >>"
+            ).encode("ascii"),
+            page.data,
+        )
+        contents = f"q {width:.4f} 0 0 {height:.4f} 0 0 cm /image Do Q".encode("ascii")
+        chunk += self._object(contents_id, f"<< /Length {len(contents)} >>".encode("ascii"), contents)
+        chunk += self._object(
+            page_id,
+            (
+                f"<< /Type /Page /Parent {self.PAGES_ID} 0 R"
+                f" /Resources << /ProcSet [/PDF /ImageC] /XObject << /image {image_id} 0 R >> >>"
+                f" /MediaBox [0 0 {width:.4f} {height:.4f}] /Contents {contents_id} 0 R >>"
+            ).encode("ascii"),
+        )
+        return chunk
+
+    def close(self):
+        """Return the page tree, catalog, cross-reference table and trailer."""
+        if self._closed:
+            return b""
+        self._closed = True
+        chunk = self.begin()
+
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        chunk += self._object(
+            self.PAGES_ID,
+            f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>".encode("ascii"),
+        )
+        chunk += self._object(
+            self.CATALOG_ID,
+            f"<< /Type /Catalog /Pages {self.PAGES_ID} 0 R >>".encode("ascii"),
+        )
+
+        xref_offset = self._offset
+        size = self._next_id
+        lines = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        for object_id in range(1, size):
+            lines.append(f"{self._offsets[object_id]:010d} 00000 n \n")
+        lines.append(f"trailer\n<< /Size {size} /Root {self.CATALOG_ID} 0 R >>\n")
+        lines.append(f"startxref\n{xref_offset}\n%%EOF\n")
+        chunk += self._emit("".join(lines).encode("ascii"))
+        return chunk
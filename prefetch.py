@@ -0,0 +1,224 @@
+import asyncio
+import math
+import os
+import re
+
+import numpy as np
+
+import utils
+from utils import (
+    TILE_SOURCE, corridor_tiles, debug_print, get_page_track_in_px, layout_atlas, parse_gpx,
+    vectorized_get_tile_number_from_coord,
+)
+from instrumentation import recording
+from metrics import REGISTRY
+
+# Tiles downloaded at the same time by a prefetcher, renders have their own requests on top
+PREFETCH_CONCURRENCY = int(os.getenv("PREFETCH_CONCURRENCY", "16"))
+# Seconds a prefetch worker paused by an unhealthy provider waits before checking it again
+PREFETCH_BACKOFF_S = float(os.getenv("PREFETCH_BACKOFF_S", "1"))
+
+TRACK_POINT = re.compile(rb"<trkpt\b([^>]*)>")
+LATITUDE = re.compile(rb"""\blat\s*=\s*["']([-+0-9.eE]+)""")
+LONGITUDE = re.compile(rb"""\blon\s*=\s*["']([-+0-9.eE]+)""")
+
+prefetched_total = REGISTRY.counter("tile_prefetch_total", "Tiles prefetched by result: ok, failed")
+
+
+def scan_track_points(data):
+    """
+    Latitudes and longitudes of the track points of a GPX file, without parsing it.
+
+    A regular expression scan, an order of magnitude faster than gpxpy,
+    only meant to guess the tiles of the track early.
+
+    Returns:
+        (lats, lons): numpy float arrays, in file order.
+    """
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    lats, lons = [], []
+    for match in TRACK_POINT.finditer(data):
+        lat = LATITUDE.search(match[1])
+        lon = LONGITUDE.search(match[1])
+        if lat is not None and lon is not None:
+            lats.append(float(lat[1]))
+            lons.append(float(lon[1]))
+    return np.array(lats, dtype=float), np.array(lons, dtype=float)
+
+
+def scan_track_tiles(data, tile_source=TILE_SOURCE):
+    """Unique (col, row) tiles crossed by the track of a GPX file, in track order, see scan_track_points."""
+    lats, lons = scan_track_points(data)
+    if len(lats) == 0:
+        return []
+    cols, rows, _, _ = vectorized_get_tile_number_from_coord(lats, lons, tile_source)
+    cols = np.asarray(cols).astype(np.int64).tolist()
+    rows = np.asarray(rows).astype(np.int64).tolist()
+    return list(dict.fromkeys(zip(cols, rows)))
+
+
+def page_tiles(pages, page_numbers=None, gpx_points=None, corridor=None):
+    """
+    (col, row) tiles of the pages, page after page, in the order they are rendered.
+
+    Unknown pages are skipped. With a corridor (see utils.corridor_tiles),
+    only the tiles fetched at full resolution are listed.
+    """
+    if page_numbers is None:
+        page_numbers = range(len(pages))
+    tiles = []
+    for number in page_numbers:
+        if not 0 <= number < len(pages):
+            continue
+        page = pages[number]
+        page_list = [(int(col), int(row)) for column in page for col, row in column]
+        if corridor is not None:
+            near = corridor_tiles(page, get_page_track_in_px(page, gpx_points), corridor)
+            page_list = [col_row for col_row in page_list if col_row in near]
+        tiles.extend(page_list)
+    return tiles
+
+
+class TilePrefetcher:
+    """
+    Download tiles into the tile cache in the background, in submission order.
+
+    A render asking for a tile that is being prefetched shares its
+    download, later ones read it from the cache. Downloads are not counted
+    in the report of the render, the render counts them as cache hits when
+    it uses them. Does nothing if the fetcher has no cache to keep the
+    tiles in.
+
+    The downloads at the same time follow the health of the provider (see
+    TileFetcher.provider_health): at a score of 0.5 half the workers
+    pause, down to a single one, so that a failing or slow provider is not
+    hammered ahead of the renders waiting on it.
+
+    Args:
+        tile_source: "IGN", "OSM" or "TOPO"
+        fetcher: TileFetcher, the one of the renders by default
+        concurrency: Tiles downloaded at the same time by a healthy provider
+        backoff_s: Seconds a paused worker waits before checking the health again
+    """
+
+    def __init__(self, tile_source=TILE_SOURCE, fetcher=None, concurrency=PREFETCH_CONCURRENCY,
+                 backoff_s=PREFETCH_BACKOFF_S):
+        self.tile_source = tile_source
+        self.fetcher = fetcher if fetcher is not None else utils.get_default_fetcher()
+        self.concurrency = concurrency
+        self.backoff_s = backoff_s
+        self.submitted = 0
+        self.done = 0
+        self.failed = 0
+        self._queue = None
+        self._seen = set()
+        self._workers = []
+
+    @property
+    def enabled(self):
+        return self.fetcher.cache is not None
+
+    @property
+    def active_workers(self):
+        """Workers downloading, the concurrency scaled by the provider health, at least one."""
+        score = self.fetcher.provider_health(self.tile_source)
+        return max(1, min(self.concurrency, math.ceil(self.concurrency * score)))
+
+    def start(self):
+        """Start the download tasks, call from the event loop."""
+        if self.enabled and not self._workers:
+            self._queue = asyncio.Queue()
+            self._workers = [asyncio.create_task(self._work(index)) for index in range(self.concurrency)]
+        return self
+
+    def submit(self, tiles):
+        """Queue tiles for download, skipping those already submitted."""
+        if self._queue is None:
+            return
+        for col_row in tiles:
+            if col_row not in self._seen:
+                self._seen.add(col_row)
+                self._queue.put_nowait(col_row)
+                self.submitted += 1
+
+    async def submit_pages(self, pages, page_numbers=None, gpx_points=None, corridor=None):
+        """Queue the tiles of the pages, in render order, see page_tiles."""
+        if self._queue is not None:
+            self.submit(await asyncio.to_thread(page_tiles, pages, page_numbers, gpx_points, corridor))
+
+    async def _work(self, index):
+        # Tasks copy the context they are created in: leave the render report alone
+        with recording(None):
+            while True:
+                if index >= self.active_workers:
+                    await asyncio.sleep(self.backoff_s)
+                    continue
+                col_row = await self._queue.get()
+                try:
+                    data = await self.fetcher.fetch_tile_bytes(col_row, self.tile_source)
+                except Exception as e:
+                    debug_print(f"[DEBUG] Prefetch of tile {col_row} failed: {e}")
+                    data = None
+                if data is None:
+                    self.failed += 1
+                    prefetched_total.inc(result="failed")
+                else:
+                    self.done += 1
+                    prefetched_total.inc(result="ok")
+                self._queue.task_done()
+
+    async def join(self):
+        """Wait until every submitted tile is downloaded."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def stop(self):
+        """Cancel the downloads still queued."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+        debug_print(f"[DEBUG] Prefetched {self.done} of {self.submitted} tiles, {self.failed} failed")
+
+    async def __aenter__(self):
+        return self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+
+async def parse_gpx_prefetching(data, tile_source=TILE_SOURCE, prefetcher=None):
+    """
+    Parse a GPX file off the event loop, its track tiles downloading meanwhile.
+
+    The tiles crossed by the track are certain to be on some page of the
+    whole atlas, whatever the layout: they are found by a quick scan of
+    the file and queued on the prefetcher before the slow gpxpy parse
+    starts. Give no prefetcher to a render of a page selection, most of
+    the track is on pages it does not render.
+
+    Returns:
+        gpxpy.gpx.GPX object
+    """
+    if prefetcher is not None:
+        prefetcher.submit(await asyncio.to_thread(scan_track_tiles, data, tile_source))
+    return await asyncio.to_thread(parse_gpx, data)
+
+
+async def layout_atlas_prefetching(gpx, tile_source=TILE_SOURCE, prefetcher=None, page_numbers=None, corridor=None):
+    """
+    layout_atlas off the event loop, then queue the tiles of the pages on the prefetcher.
+
+    Args:
+        corridor: Optional distance in tiles to the track of a corridor
+            render, only the tiles it fetches are queued
+
+    Returns:
+        (pages, gpx_points) as returned by layout_atlas
+    """
+    pages, gpx_points = await asyncio.to_thread(layout_atlas, gpx, tile_source)
+    if prefetcher is not None:
+        await prefetcher.submit_pages(pages, page_numbers, gpx_points, corridor)
+    return pages, gpx_points
@@ -0,0 +1,67 @@
+from utils import NUMBER_COLUMNS, NUMBER_ROWS, TILE_SOURCE, layout_atlas
+# Drawn where the preview is shown, without the rendering modules (see preview_image.py)
+from preview_image import PREVIEW_MAX_SIZE, render_preview_image  # noqa: F401
+
+PREVIEW_MAX_TRACK_POINTS = 2000
+
+
+def build_preview(gpx, tile_source=TILE_SOURCE, max_track_points=PREVIEW_MAX_TRACK_POINTS, layout=None):
+    """
+    Describe the layout of the atlas without fetching any tile.
+
+    Coordinates are in tile units of the selected tile source: page (col,
+    row) is the top-left tile of the page, track points are tile
+    coordinates with their fractional position inside the tile.
+
+    Args:
+        gpx: gpxpy.gpx.GPX object
+        tile_source: "IGN", "OSM" or "TOPO"
+        max_track_points: Track points kept, evenly spaced along the track
+        layout: Optional (pages, gpx_points) already computed by layout_atlas
+
+    Returns:
+        dict: JSON serializable preview with "page_count", "pages", "track" and "bounds".
+    """
+    pages, gpx_points = layout if layout is not None else layout_atlas(gpx, tile_source)
+
+    track = []
+    for (col, row), points in gpx_points.items():
+        for offset_x, offset_y, _, point_index in points:
+            track.append((point_index, float(col) + offset_x / 256, float(row) + offset_y / 256))
+    track.sort()
+    step = max(1, -(-len(track) // max_track_points))
+    sampled = track[::step]
+    # Always end the line where the track ends
+    if track and sampled[-1] is not track[-1]:
+        sampled.append(track[-1])
+
+    preview_pages = []
+    for page_number, page in enumerate(pages):
+        col, row = page[0][0]
+        preview_pages.append({
+            # Same number as printed on the page
+            "number": page_number,
+            "col": int(col),
+            "row": int(row),
+            "columns": len(page),
+            "rows": len(page[0]),
+        })
+
+    bounds = None
+    if preview_pages:
+        bounds = {
+            "min_col": min(p["col"] for p in preview_pages),
+            "min_row": min(p["row"] for p in preview_pages),
+            "max_col": max(p["col"] + p["columns"] for p in preview_pages),
+            "max_row": max(p["row"] + p["rows"] for p in preview_pages),
+        }
+
+    return {
+        "tile_source": tile_source.upper(),
+        "page_count": len(preview_pages),
+        "page_columns": NUMBER_COLUMNS,
+        "page_rows": NUMBER_ROWS,
+        "pages": preview_pages,
+        "track": [[round(x, 3), round(y, 3)] for _, x, y in sampled],
+        "bounds": bounds,
+    }
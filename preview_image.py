@@ -0,0 +1,75 @@
+"""
+Draw the layout preview of an atlas, as returned by preview.build_preview.
+
+Only needs Pillow: the frontend gets the preview as JSON from the
+backend's POST /preview and draws it here, without the rendering modules.
+"""
+
+import functools
+import os
+
+from PIL import Image, ImageDraw, ImageFont
+
+PREVIEW_MAX_SIZE = 1024
+# Same default as utils.LINE_COLOR
+LINE_COLOR = "#B700FF"
+FONT_DIR = os.getenv("FONT_DIR", "/usr/share/fonts/truetype/freefont")
+BUNDLED_FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(name, size):
+    """utils.load_font, for the frontend."""
+    path = os.path.join(FONT_DIR, name)
+    if not os.path.exists(path):
+        path = os.path.join(BUNDLED_FONT_DIR, name)
+    return ImageFont.truetype(path, size)
+
+
+def render_preview_image(preview, max_size=PREVIEW_MAX_SIZE, line_color=LINE_COLOR):
+    """
+    Draw a preview as a single low-resolution image.
+
+    Args:
+        preview: dict returned by build_preview
+        max_size: Size in pixels of the longest side
+        line_color: Colour of the track line
+
+    Returns:
+        PIL.Image.Image or None if the atlas has no page.
+    """
+    bounds = preview["bounds"]
+    if bounds is None:
+        return None
+
+    margin = 10
+    width_tiles = bounds["max_col"] - bounds["min_col"]
+    height_tiles = bounds["max_row"] - bounds["min_row"]
+    scale = (max_size - 2 * margin) / max(width_tiles, height_tiles)
+
+    def to_px(col, row):
+        return (margin + (col - bounds["min_col"]) * scale, margin + (row - bounds["min_row"]) * scale)
+
+    image = Image.new(
+        "RGB",
+        (int(width_tiles * scale) + 2 * margin, int(height_tiles * scale) + 2 * margin),
+        (255, 255, 255),
+    )
+    draw = ImageDraw.Draw(image)
+    font = load_font("FreeMonoBold.ttf", max(12, int(scale * 2)))
+
+    for page in preview["pages"]:
+        left, top = to_px(page["col"], page["row"])
+        right, bottom = to_px(page["col"] + page["columns"], page["row"] + page["rows"])
+        draw.rectangle((left, top, right, bottom), outline=(0, 0, 0), width=2)
+
+    if len(preview["track"]) > 1:
+        draw.line([to_px(x, y) for x, y in preview["track"]], fill=line_color, width=3)
+
+    # Numbers last so the track never hides them
+    for page in preview["pages"]:
+        left, top = to_px(page["col"], page["row"])
+        draw.text((left + 4, top + 2), str(page["number"]), font=font, fill=(0, 0, 0),
+                  stroke_width=2, stroke_fill=(255, 255, 255))
+
+    return image
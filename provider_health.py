@@ -0,0 +1,134 @@
+import os
+import threading
+from collections import deque
+
+from metrics import REGISTRY
+from instrumentation import current_report
+
+# Downloads kept per provider to compute the rolling health
+PROVIDER_HEALTH_WINDOW = int(os.getenv("PROVIDER_HEALTH_WINDOW", "200"))
+# Median latency above which a provider starts losing health
+PROVIDER_LATENCY_TARGET_MS = float(os.getenv("PROVIDER_LATENCY_TARGET_MS", "500"))
+
+fetch_seconds = REGISTRY.histogram("tile_fetch_seconds", "Tile download latency by provider")
+decode_seconds = REGISTRY.histogram(
+    "tile_decode_seconds", "Tile decode time by provider", buckets=(0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1)
+)
+responses_total = REGISTRY.counter("tile_responses_total", "Tile responses by provider and HTTP status, error if none")
+provider_bytes_total = REGISTRY.counter("tile_provider_bytes_total", "Bytes of tiles downloaded by provider")
+health_score = REGISTRY.gauge("tile_provider_health", "Rolling health by provider, 1 healthy, 0 failing")
+
+
+class ProviderHealth:
+    """
+    Rolling health of one tile provider over its last `window` downloads.
+
+    The score is the share of successful downloads, scaled down when the
+    median latency is over `latency_target_ms`: 1.0 is healthy, 0.5 is
+    e.g. half the tiles failing or twice the target latency.
+
+    Args:
+        window: Number of recent downloads considered
+        latency_target_ms: Median latency still considered healthy
+    """
+
+    def __init__(self, window=PROVIDER_HEALTH_WINDOW, latency_target_ms=PROVIDER_LATENCY_TARGET_MS):
+        self.latency_target_ms = latency_target_ms
+        self._recent = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, ok, seconds):
+        with self._lock:
+            self._recent.append((ok, seconds))
+
+    def _latencies(self):
+        return sorted(seconds for _, seconds in self._recent)
+
+    @staticmethod
+    def _percentile(values, fraction):
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(fraction * len(values)))]
+
+    @property
+    def score(self):
+        with self._lock:
+            if not self._recent:
+                return 1.0
+            success = sum(1 for ok, _ in self._recent if ok) / len(self._recent)
+            median_ms = self._percentile(self._latencies(), 0.5) * 1000
+        slowness = min(1.0, self.latency_target_ms / median_ms) if median_ms > 0 else 1.0
+        return round(success * slowness, 3)
+
+    def summary(self):
+        with self._lock:
+            latencies = self._latencies()
+            count = len(self._recent)
+            errors = sum(1 for ok, _ in self._recent if not ok)
+        return {
+            "recent_requests": count,
+            "error_rate": round(errors / count, 3) if count else 0.0,
+            "latency_p50_ms": round(self._percentile(latencies, 0.5) * 1000, 1),
+            "latency_p95_ms": round(self._percentile(latencies, 0.95) * 1000, 1),
+            "score": self.score,
+        }
+
+
+class ProviderStats:
+    """Latency, status codes, bytes, decode time and health of every tile provider of the process."""
+
+    def __init__(self, window=PROVIDER_HEALTH_WINDOW, latency_target_ms=PROVIDER_LATENCY_TARGET_MS):
+        self.window = window
+        self.latency_target_ms = latency_target_ms
+        self._health = {}
+        self._lock = threading.Lock()
+
+    def health(self, provider):
+        """ProviderHealth of provider, created on first use."""
+        with self._lock:
+            health = self._health.get(provider)
+            if health is None:
+                health = ProviderHealth(self.window, self.latency_target_ms)
+                self._health[provider] = health
+            return health
+
+    def record_response(self, provider, status, seconds, nbytes=0):
+        """
+        Record a download attempt.
+
+        Args:
+            provider: Tile source name
+            status: HTTP status code, or "error" if no response was received
+            seconds: Time until the body was read or the request failed
+            nbytes: Bytes of the tile body
+        """
+        ok = status == 200
+        health = self.health(provider)
+        health.record(ok, seconds)
+        score = health.score
+
+        fetch_seconds.observe(seconds, provider=provider)
+        responses_total.inc(provider=provider, status=status)
+        if nbytes:
+            provider_bytes_total.inc(nbytes, provider=provider)
+        health_score.set(score, provider=provider)
+
+        report = current_report()
+        if report is not None:
+            report.add_response(provider, status, seconds, nbytes, score)
+
+    def record_decode(self, provider, seconds):
+        decode_seconds.observe(seconds, provider=provider)
+        report = current_report()
+        if report is not None:
+            report.add_decode(provider, seconds)
+
+    def summary(self):
+        """dict of provider -> recent request count, error rate, latency percentiles and score."""
+        with self._lock:
+            providers = dict(self._health)
+        return {provider: health.summary() for provider, health in sorted(providers.items())}
+
+
+# Process-wide stats, shared by every fetcher and served by the backend
+PROVIDERS = ProviderStats()
@@ -0,0 +1,518 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import struct
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Try to load dotenv if available (for production), but don't fail if missing (for tests)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
+
+DEBUG_LOGGING = os.getenv("DEBUG_LOGGING", "false").lower() == "true"
+
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", "./cache/results")
+RESULT_CACHE_MAX_MB = float(os.getenv("RESULT_CACHE_MAX_MB", "2048"))
+# Bump when the renderer output changes, so stale atlases are never served
+RESULT_CACHE_VERSION = 1
+
+
+def debug_print(message):
+    """Print debug messages only if DEBUG_LOGGING is enabled"""
+    if DEBUG_LOGGING:
+        print(message, flush=True)
+
+
+def track_fingerprint(gpx, precision=7):
+    """
+    Hash the track points of a parsed GPX file.
+
+    Only what the renderer uses is hashed: point coordinates, rounded to
+    `precision` decimals, and the track/segment boundaries. Names,
+    timestamps or elevations do not change the atlas, so they do not
+    change the fingerprint either.
+
+    Args:
+        gpx: gpxpy.gpx.GPX object
+        precision: Number of decimals kept for latitude/longitude
+
+    Returns:
+        str: Hex digest of the normalized points
+    """
+    digest = hashlib.sha256()
+    for track in gpx.tracks:
+        digest.update(b"T")
+        for segment in track.segments:
+            digest.update(b"S")
+            for point in segment.points:
+                digest.update(struct.pack(
+                    "<dd",
+                    round(point.latitude, precision),
+                    round(point.longitude, precision),
+                ))
+    return digest.hexdigest()
+
+
+def render_key(gpx, settings):
+    """
+    Content-addressed key for a rendered atlas.
+
+    Args:
+        gpx: gpxpy.gpx.GPX object
+        settings: dict of every render setting that changes the output
+            (tile source, line colour, page geometry, encoding...)
+
+    Returns:
+        str: Hex digest usable as a cache key
+    """
+    payload = json.dumps(
+        {"version": RESULT_CACHE_VERSION, "track": track_fingerprint(gpx), "settings": settings},
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CacheStore:
+    """
+    Storage backend interface for ResultCache.
+
+    A store maps string keys to bytes and reports, for each entry, its
+    size and last access time so the cache can evict least recently used
+    entries first.
+    """
+
+    def get(self, key):
+        """Return the stored bytes for key (marking it as used), or None."""
+        raise NotImplementedError
+
+    def peek(self, key):
+        """Return the stored bytes for key without marking it as used, or None."""
+        return self.get(key)
+
+    def open(self, key):
+        """Return a binary file object reading the value of key (marking it as used), or None."""
+        data = self.get(key)
+        return io.BytesIO(data) if data is not None else None
+
+    def put(self, key, data):
+        """Store data under key, replacing any previous value."""
+        raise NotImplementedError
+
+    def put_file(self, key, path):
+        """Store the content of the file at path under key."""
+        with open(path, "rb") as f:
+            self.put(key, f.read())
+
+    def delete(self, key):
+        """Remove key if present."""
+        raise NotImplementedError
+
+    def entries(self):
+        """Return a list of (key, size_in_bytes, last_access_timestamp)."""
+        raise NotImplementedError
+
+
+class LocalDirectoryStore(CacheStore):
+    """
+    Store entries as files in a local directory.
+
+    Works unchanged on any mounted filesystem, so a shared volume can be
+    used later by pointing `directory` at its mount path.
+    """
+
+    SUFFIX = ".bin"
+
+    def __init__(self, directory=RESULT_CACHE_DIR):
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, key):
+        data = self.peek(key)
+        if data is not None:
+            self._touch(key)
+        return data
+
+    def open(self, key):
+        try:
+            f = open(self._path(key), "rb")
+        except FileNotFoundError:
+            return None
+        # An open file keeps reading the entry if it is evicted or replaced meanwhile
+        self._touch(key)
+        return f
+
+    def _touch(self, key):
+        try:
+            # The modification time is used as the last access time
+            os.utime(self._path(key), None)
+        except FileNotFoundError:
+            pass
+
+    def peek(self, key):
+        try:
+            with open(self._path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, data):
+        self._write(key, lambda f: f.write(data))
+
+    def put_file(self, key, path):
+        # Hard-linked when on the same filesystem (e.g. a spool file of the directory): nothing is copied
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        os.close(fd)
+        os.remove(tmp_path)
+        try:
+            os.link(path, tmp_path)
+        except OSError:
+            # Another filesystem, or one without hard links: copied in blocks, never loaded in memory
+            def copy(f):
+                with open(path, "rb") as source:
+                    shutil.copyfileobj(source, f)
+            self._write(key, copy)
+            return
+        try:
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+
+    def _write(self, key, write):
+        # Write to a temporary file first so readers never see partial entries
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, self._path(key))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def delete(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            entries.append((name[: -len(self.SUFFIX)], stat.st_size, stat.st_mtime))
+        return entries
+
+
+class DeduplicatingStore(CacheStore):
+    """
+    Keep identical payloads once, on top of another CacheStore.
+
+    Map tiles repeat a lot (open sea, empty fields, out of coverage tiles):
+    each key only holds the SHA-256 of its payload, and payloads are
+    stored once under "blob_<sha256>". Reference counts are rebuilt from
+    the keys on the first write or listing, reading a key does not need
+    them. A payload is deleted with its last key.
+
+    Entries are reported at the size of their payload, so a ResultCache
+    on top of it still bounds the total of every key, and the disk holds
+    at most that much.
+
+    Args:
+        store: CacheStore holding the keys and the payloads
+    """
+
+    BLOB_PREFIX = "blob_"
+
+    def __init__(self, store):
+        self.store = store
+        self._lock = threading.Lock()
+        # sha256 -> [number of keys, payload size]
+        self._blobs = None
+        self._logical_bytes = 0
+        self._stored_bytes = 0
+
+    @staticmethod
+    def _digest(ref):
+        """Payload hash held by a key, None if the key holds something else (e.g. a raw payload)."""
+        if ref is None or len(ref) != 64:
+            return None
+        try:
+            digest = ref.decode("ascii")
+            int(digest, 16)
+        except ValueError:
+            return None
+        return digest
+
+    def _scan(self):
+        """(key, payload hash, payload size, last access time) of every key whose payload is stored."""
+        entries = self.store.entries()
+        sizes = {key[len(self.BLOB_PREFIX):]: size for key, size, _ in entries if key.startswith(self.BLOB_PREFIX)}
+        refs = []
+        for key, _, access_time in entries:
+            if key.startswith(self.BLOB_PREFIX):
+                continue
+            # Peeked, reading every key must not make them all recently used
+            digest = self._digest(self.store.peek(key))
+            if digest in sizes:
+                refs.append((key, digest, sizes[digest], access_time))
+        return refs
+
+    def _load(self, refs=None):
+        if self._blobs is None:
+            self._blobs = {}
+            for _, digest, size, _ in refs if refs is not None else self._scan():
+                self._reference(digest, size)
+        return self._blobs
+
+    def _reference(self, digest, size):
+        blob = self._blobs.setdefault(digest, [0, size])
+        if blob[0] == 0:
+            self._stored_bytes += size
+        blob[0] += 1
+        self._logical_bytes += size
+
+    def _release(self, digest):
+        blob = self._blobs.get(digest)
+        if blob is None:
+            return
+        blob[0] -= 1
+        self._logical_bytes -= blob[1]
+        if blob[0] == 0:
+            del self._blobs[digest]
+            self._stored_bytes -= blob[1]
+            self.store.delete(self.BLOB_PREFIX + digest)
+
+    def get(self, key):
+        digest = self._digest(self.store.get(key))
+        if digest is None:
+            return None
+        return self.store.get(self.BLOB_PREFIX + digest)
+
+    def peek(self, key):
+        digest = self._digest(self.store.peek(key))
+        if digest is None:
+            return None
+        return self.store.peek(self.BLOB_PREFIX + digest)
+
+    def put(self, key, data):
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            blobs = self._load()
+            previous = self._digest(self.store.peek(key))
+            if previous == digest:
+                return
+            if digest not in blobs:
+                # Payload first, so readers never see a key without it
+                self.store.put(self.BLOB_PREFIX + digest, data)
+            self._reference(digest, len(data))
+            self.store.put(key, digest.encode("ascii"))
+            if previous is not None:
+                self._release(previous)
+
+    def delete(self, key):
+        with self._lock:
+            self._load()
+            digest = self._digest(self.store.peek(key))
+            self.store.delete(key)
+            if digest is not None:
+                self._release(digest)
+
+    def entries(self):
+        refs = self._scan()
+        with self._lock:
+            # Reference counts come with the first scan
+            self._load(refs)
+        return [(key, size, access_time) for key, _, size, access_time in refs]
+
+    def stats(self):
+        """Keys, distinct payloads, their total and stored bytes, and the deduplication ratio."""
+        with self._lock:
+            blobs = self._load()
+            keys = sum(count for count, _ in blobs.values())
+            return {
+                "keys": keys,
+                "payloads": len(blobs),
+                "logical_bytes": self._logical_bytes,
+                "stored_bytes": self._stored_bytes,
+                "dedup_ratio": round(self._logical_bytes / self._stored_bytes, 3) if self._stored_bytes else 1.0,
+            }
+
+
+class ResultCache:
+    """
+    Size-bounded LRU cache of bytes (rendered atlases, tiles...) on top of a CacheStore.
+
+    The recency order is kept in memory, seeded once from the access times
+    reported by the store, so lookups and evictions never rescan it. Reads
+    do not wait for it: until the first write or preload() lists the
+    store, the store's own access times keep the order.
+
+    Args:
+        store: CacheStore used to persist the entries
+        max_bytes: Total size above which least recently used entries are evicted
+    """
+
+    def __init__(self, store, max_bytes=int(RESULT_CACHE_MAX_MB * 1024 * 1024)):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._index = None
+        self._total = 0
+        self._preload = None
+
+    def _load_index(self, entries=None):
+        if self._index is None:
+            if entries is None:
+                entries = self.store.entries()
+            self._index = OrderedDict()
+            # Oldest access first
+            for key, size, _ in sorted(entries, key=lambda entry: entry[2]):
+                self._index[key] = size
+            self._total = sum(self._index.values())
+        return self._index
+
+    def preload(self):
+        """
+        List the store in a background thread, so the first write does not list it again.
+
+        Writes started meanwhile wait for it, reads do not.
+
+        Returns:
+            threading.Thread: The started thread.
+        """
+        def load():
+            # Listed without the lock, reads and writes go on meanwhile
+            entries = self.store.entries()
+            with self._lock:
+                self._load_index(entries)
+
+        thread = threading.Thread(target=load, name="cache-index", daemon=True)
+        self._preload = thread
+        thread.start()
+        return thread
+
+    def _wait_for_preload(self):
+        # Writing before the listing ends would list the store again, e.g. a
+        # DeduplicatingStore reading every key to count references
+        thread = self._preload
+        if thread is not None:
+            thread.join()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._load_index())
+
+    @property
+    def total_bytes(self):
+        with self._lock:
+            self._load_index()
+            return self._total
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._load_index()
+
+    def get(self, key):
+        data = self.store.get(key)
+        self._used(key, len(data) if data is not None else None)
+        return data
+
+    def open(self, key):
+        """
+        Open the value of key for reading, without loading it in memory.
+
+        Returns:
+            Binary file object, to be closed by the caller, or None on a miss.
+        """
+        f = self.store.open(key)
+        size = None
+        if f is not None:
+            size = f.seek(0, os.SEEK_END)
+            f.seek(0)
+        self._used(key, size)
+        return f
+
+    def _used(self, key, size):
+        """Count a lookup of key, size None for a miss, and make it the most recently used."""
+        with self._lock:
+            # None until the store is listed, its access times keep the order meanwhile
+            index = self._index
+            if size is None:
+                self.misses += 1
+                # Removed behind our back (e.g. by another container sharing the store)
+                if index is not None and key in index:
+                    self._total -= index.pop(key)
+            else:
+                self.hits += 1
+                if index is not None:
+                    self._total += size - index.get(key, 0)
+                    index[key] = size
+                    index.move_to_end(key)
+        debug_print(f"[DEBUG ResultCache] {'HIT' if size is not None else 'MISS'} {key[:12]}")
+
+    def put(self, key, data):
+        if len(data) > self.max_bytes:
+            debug_print(f"[DEBUG ResultCache] Not caching {key[:12]}: {len(data)} bytes exceeds the cache size")
+            return
+        self._wait_for_preload()
+        with self._lock:
+            self.store.put(key, data)
+            self._add(key, len(data))
+
+    def put_file(self, key, path):
+        """Store the file at path under key, without reading it in memory."""
+        size = os.path.getsize(path)
+        if size > self.max_bytes:
+            debug_print(f"[DEBUG ResultCache] Not caching {key[:12]}: {size} bytes exceeds the cache size")
+            return
+        self._wait_for_preload()
+        # Copied outside the lock, lookups and small writes do not wait for it.
+        # The store replaces entries atomically, only the index needs the lock.
+        self.store.put_file(key, path)
+        with self._lock:
+            self._add(key, size)
+
+    def _add(self, key, size):
+        index = self._load_index()
+        self._total += size - index.get(key, 0)
+        index[key] = size
+        index.move_to_end(key)
+        self._evict()
+
+    def _evict(self):
+        index = self._index
+        while self._total > self.max_bytes and index:
+            key, size = index.popitem(last=False)
+            self.store.delete(key)
+            self._total -= size
+            debug_print(f"[DEBUG ResultCache] Evicted {key[:12]} ({size} bytes)")
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """Return the process-wide ResultCache backed by RESULT_CACHE_DIR."""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ResultCache(LocalDirectoryStore(RESULT_CACHE_DIR))
+    return _default_cache
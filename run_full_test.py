@@ -14,6 +14,7 @@ import json
 from pathlib import Path
 from datetime import datetime
 from utils import main, vectorized_get_tile_number_from_coord
+from instrumentation import RenderReport
 from page_generation import put_tiles_in_pages, get_filled_pages
 import pandas as pd
 import numpy as np
@@ -158,23 +159,27 @@ class TestRunner:
 
         # Step 5: Generate PDF using REAL main function
         print("\nStep 5: Generating PDF (actual full pipeline)...")
-        pdf_path, pdf_time = await self.profile_async_step(
+        report = RenderReport()
+        pdf_bytes, pdf_time = await self.profile_async_step(
             'generate_pdf',
             main,
-            gpx, tile_source, "#B700FF"
+            gpx, tile_source, "#B700FF", report=report
         )
 
+        output_pdf = self.output_dir / f"{gpx_name}_{tile_source}.pdf"
         profile['steps']['generate_pdf'] = {
             'time': pdf_time,
-            'pdf_path': str(pdf_path) if pdf_path else None
+            'pdf_path': str(output_pdf) if pdf_bytes else None,
+            # Per-stage timings, tile counts and peak memory from the pipeline itself
+            'report': report.to_dict(),
         }
+        for stage_name, stage_timing in report.to_dict()['stages'].items():
+            print(f"    {stage_name:<9} {stage_timing['wall_s']:>8.3f}s wall {stage_timing['cpu_s']:>8.3f}s cpu")
 
-        if pdf_path:
-            # Copy PDF to test output
-            import shutil
-            pdf_size = Path(pdf_path).stat().st_size
-            output_pdf = self.output_dir / f"{gpx_name}_{tile_source}.pdf"
-            shutil.copy(pdf_path, output_pdf)
+        if pdf_bytes:
+            # Save PDF to test output
+            pdf_size = len(pdf_bytes)
+            output_pdf.write_bytes(pdf_bytes)
             print(f"  ✓ Generated PDF in {pdf_time:.3f}s")
             print(f"    Size: {pdf_size/1024/1024:.2f} MB")
             print(f"    Saved to: {output_pdf}")
@@ -0,0 +1,174 @@
+import asyncio
+import os
+import tempfile
+
+
+class SingleFlight:
+    """
+    Deduplicate identical concurrent async calls.
+
+    The first caller for a key starts the work; callers arriving with the
+    same key while it is still running wait for that work instead of
+    starting their own, and all of them get the same result (or exception).
+    Once the work finishes the key is forgotten, so later calls run again.
+
+    The work runs in its own task: a caller being cancelled (for example a
+    client disconnecting) does not cancel it for the others.
+    """
+
+    def __init__(self):
+        self._tasks = {}
+        self.started = 0
+        self.shared = 0
+
+    def in_flight(self):
+        """Number of keys currently being computed."""
+        return len(self._tasks)
+
+    async def do(self, key, func, *args, **kwargs):
+        """
+        Await func(*args, **kwargs), sharing the call with identical in-flight keys.
+
+        Args:
+            key: Hashable identifying the work
+            func: Coroutine function doing the work
+
+        Returns:
+            The result of the (possibly shared) call.
+        """
+        task = self._tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func(*args, **kwargs))
+            self._tasks[key] = task
+            task.add_done_callback(lambda done, key=key: self._forget(key, done))
+            self.started += 1
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        # Mark the exception as retrieved when every waiter has gone away
+        if not task.cancelled():
+            task.exception()
+
+
+class _SharedStream:
+    def __init__(self, path):
+        self.path = path
+        self.size = 0
+        self.done = False
+        self.error = None
+        self.changed = asyncio.Condition()
+
+
+class SingleFlightStream:
+    """
+    Deduplicate identical concurrent async generators.
+
+    The first caller for a key starts a producer task that consumes the
+    generator into a spool file on disk; every caller, the first one
+    included, streams the chunks back from that file as they arrive. Late
+    joiners replay from the start, nobody holds the whole output in
+    memory, and a reader going away does not stop the producer.
+
+    The chunks just written are read back from the page cache, not the
+    disk. Once complete, on_complete can keep the spool file without
+    copying it, e.g. LocalDirectoryStore.put_file hard-links it when the
+    spool_dir is on the store's filesystem.
+
+    Args:
+        spool_dir: Directory of the spool files, created if missing, the
+            system temp dir by default
+    """
+
+    def __init__(self, spool_dir=None):
+        self.spool_dir = spool_dir
+        self._streams = {}
+        self.started = 0
+        self.shared = 0
+
+    def in_flight(self):
+        """Number of keys currently being produced."""
+        return len(self._streams)
+
+    def is_in_flight(self, key):
+        """True if a stream() for key would join a running producer."""
+        return key in self._streams
+
+    def stream(self, key, agen_func, *args, on_complete=None, **kwargs):
+        """
+        Iterate agen_func(*args, **kwargs), sharing it with identical in-flight keys.
+
+        Args:
+            key: Hashable identifying the output
+            agen_func: Async generator function yielding bytes
+            on_complete: Optional callable(spool_path) run in a thread once the
+                output is complete, before the spool file is removed (e.g. to
+                cache it)
+
+        Returns:
+            Async iterator of bytes.
+        """
+        shared = self._streams.get(key)
+        if shared is None:
+            if self.spool_dir is not None:
+                os.makedirs(self.spool_dir, exist_ok=True)
+            fd, path = tempfile.mkstemp(dir=self.spool_dir, suffix=".spool")
+            shared = _SharedStream(path)
+            self._streams[key] = shared
+            self.started += 1
+            task = asyncio.ensure_future(
+                self._produce(key, shared, fd, agen_func(*args, **kwargs), on_complete)
+            )
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+        else:
+            self.shared += 1
+        # Opened right away: the spool file is unlinked once production ends,
+        # an already open handle keeps reading it
+        return self._read(shared, open(shared.path, "rb"))
+
+    async def _produce(self, key, shared, fd, agen, on_complete):
+        try:
+            with os.fdopen(fd, "wb") as spool:
+                async for chunk in agen:
+                    spool.write(chunk)
+                    spool.flush()
+                    shared.size += len(chunk)
+                    async with shared.changed:
+                        shared.changed.notify_all()
+            if on_complete is not None:
+                try:
+                    await asyncio.to_thread(on_complete, shared.path)
+                except Exception as e:
+                    # The output itself is complete, readers still get all of it
+                    print(f"Error completing shared stream: {e}")
+        except BaseException as e:
+            shared.error = e
+            raise
+        finally:
+            shared.done = True
+            if self._streams.get(key) is shared:
+                del self._streams[key]
+            os.remove(shared.path)
+            async with shared.changed:
+                shared.changed.notify_all()
+
+    async def _read(self, shared, spool):
+        with spool:
+            position = 0
+            while True:
+                if position < shared.size:
+                    chunk = spool.read(shared.size - position)
+                    position += len(chunk)
+                    yield chunk
+                    continue
+                if shared.done:
+                    if shared.error is not None:
+                        raise RuntimeError("Shared stream failed") from shared.error
+                    return
+                async with shared.changed:
+                    await shared.changed.wait_for(
+                        lambda: shared.done or shared.size > position
+                    )
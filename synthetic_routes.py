@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Generate synthetic GPX routes with a controlled length, point density and shape.
+
+Shapes:
+    east_west     Mostly eastward, with smooth bends
+    north_south   Mostly southward, with smooth bends
+    out_and_back  Out east then back on the same road, every tile visited twice
+    loop          Closed loop, ridden `laps` times
+    city          Dense wandering on a street grid inside a small area
+
+Routes are deterministic for a given seed. They are returned as latitude
+and longitude arrays, as gpxpy objects, or written as GPX files.
+
+Usage:
+    python synthetic_routes.py [--output-dir benchmarks/routes] [--scale 1] [--points-per-km 100]
+"""
+
+import argparse
+import math
+import os
+
+import numpy as np
+
+SHAPES = ["east_west", "north_south", "out_and_back", "loop", "city"]
+# Around Lyon: inside IGN coverage, so every tile source can render the routes
+DEFAULT_START = (45.75, 4.85)
+METERS_PER_DEGREE = 111320.0
+
+# The standard benchmark set at scale 1: (name, shape, length in km, extra arguments)
+STANDARD_ROUTES = [
+    ("synthetic_east_west", "east_west", 150, {}),
+    ("synthetic_north_south", "north_south", 150, {}),
+    ("synthetic_out_and_back", "out_and_back", 120, {}),
+    ("synthetic_loop", "loop", 60, {"laps": 2}),
+    ("synthetic_city", "city", 40, {"area_km": 3}),
+]
+
+
+def _smooth_bends(count, rng, amplitude_deg=35.0, components=4):
+    """Heading offsets in degrees: a few slow sinusoids with random phases."""
+    t = np.linspace(0.0, 1.0, count)
+    offsets = np.zeros(count)
+    for _ in range(components):
+        cycles = rng.uniform(1, 12)
+        offsets += rng.uniform(0.3, 1.0) * np.sin(2 * np.pi * (cycles * t + rng.uniform()))
+    return amplitude_deg * offsets / components
+
+
+def _walk(bearings_deg, step_m):
+    """East and north offsets in meters of a walk with the given headings (0 = north, 90 = east)."""
+    radians = np.radians(bearings_deg)
+    east = np.concatenate([[0.0], np.cumsum(np.sin(radians[:-1]) * step_m)])
+    north = np.concatenate([[0.0], np.cumsum(np.cos(radians[:-1]) * step_m)])
+    return east, north
+
+
+def _to_lat_lon(east, north, start):
+    lat0, lon0 = start
+    lats = lat0 + north / METERS_PER_DEGREE
+    lons = lon0 + east / (METERS_PER_DEGREE * math.cos(math.radians(lat0)))
+    return lats, lons
+
+
+def _fold(values, size):
+    """Reflect values into [0, size], as if bouncing off the edges of the area."""
+    values = np.mod(values, 2 * size)
+    return size - np.abs(values - size)
+
+
+def generate_route(shape="east_west", length_km=100.0, points_per_km=100.0, start=DEFAULT_START, seed=0,
+                   laps=1, area_km=3.0, block_m=120.0):
+    """
+    Generate the points of a synthetic route.
+
+    Args:
+        shape: One of SHAPES
+        length_km: Distance along the route
+        points_per_km: Point density, e.g. 100 for a point every 10 m
+        start: (latitude, longitude) of the first point
+        seed: Seed of the random bends and turns
+        laps: Laps of the "loop" shape
+        area_km: Side of the square area of the "city" shape
+        block_m: Street block length of the "city" shape
+
+    Returns:
+        (lats, lons): numpy float arrays of the same length.
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Unknown shape {shape!r}, expected one of {SHAPES}")
+    rng = np.random.default_rng(seed)
+    count = max(2, int(round(length_km * points_per_km)))
+    step_m = length_km * 1000 / (count - 1)
+
+    if shape in ("east_west", "north_south"):
+        bearing = 90.0 if shape == "east_west" else 180.0
+        east, north = _walk(bearing + _smooth_bends(count, rng), step_m)
+
+    elif shape == "out_and_back":
+        half = (count + 1) // 2
+        east, north = _walk(90.0 + _smooth_bends(half, rng), step_m)
+        # Back on the same road, on the other side of it
+        east = np.concatenate([east, east[::-1][count % 2:] + 3.0])
+        north = np.concatenate([north, north[::-1][count % 2:] + 3.0])
+
+    elif shape == "loop":
+        lap_points = max(2, count // laps)
+        radius = length_km * 1000 / laps / (2 * np.pi)
+        angles = np.linspace(0, 2 * np.pi * laps, lap_points * laps, endpoint=False)
+        # Slightly irregular radius, identical on every lap, so laps overlap
+        wobble = 1 + 0.1 * np.sin(3 * angles + rng.uniform(0, 2 * np.pi))
+        east = radius * wobble * np.sin(angles)
+        north = radius * wobble * (np.cos(angles) - 1)
+
+    else:  # city
+        points_per_block = max(1, int(round(block_m / step_m)))
+        blocks = -(-count // points_per_block)
+        directions = rng.integers(0, 4, blocks) * 90.0
+        bearings = np.repeat(directions, points_per_block)[:count]
+        east, north = _walk(bearings, step_m)
+        area_m = area_km * 1000
+        east = _fold(east + area_m / 2, area_m) - area_m / 2
+        north = _fold(north + area_m / 2, area_m) - area_m / 2
+
+    return _to_lat_lon(east, north, start)
+
+
+def route_to_gpx(lats, lons, name="Synthetic route"):
+    """gpxpy.gpx.GPX with one track and one segment holding the points."""
+    import gpxpy.gpx
+
+    gpx = gpxpy.gpx.GPX()
+    track = gpxpy.gpx.GPXTrack(name=name)
+    segment = gpxpy.gpx.GPXTrackSegment()
+    segment.points = [gpxpy.gpx.GPXTrackPoint(lat, lon) for lat, lon in zip(lats.tolist(), lons.tolist())]
+    track.segments.append(segment)
+    gpx.tracks.append(track)
+    return gpx
+
+
+def write_gpx(path, lats, lons, name="Synthetic route"):
+    """Write the points as a GPX file, without building gpxpy objects (fast for millions of points)."""
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<gpx version="1.1" creator="synthetic_routes" xmlns="http://www.topografix.com/GPX/1/1">\n'
+                f'<trk><name>{name}</name><trkseg>\n')
+        for lat, lon in zip(lats.tolist(), lons.tolist()):
+            f.write(f'<trkpt lat="{lat:.7f}" lon="{lon:.7f}"></trkpt>\n')
+        f.write('</trkseg></trk>\n</gpx>\n')
+
+
+def route_length_km(lats, lons):
+    """Length of the route along its points (haversine)."""
+    lat1, lat2 = np.radians(lats[:-1]), np.radians(lats[1:])
+    dlat = lat2 - lat1
+    dlon = np.radians(lons[1:] - lons[:-1])
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return float(np.sum(2 * 6371.0 * np.arcsin(np.sqrt(a))))
+
+
+def write_standard_routes(output_dir, scale=1.0, points_per_km=100.0, seed=0):
+    """
+    Write the STANDARD_ROUTES set, lengths multiplied by scale.
+
+    Returns:
+        list: Paths of the written files.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    paths = []
+    for name, shape, length_km, kwargs in STANDARD_ROUTES:
+        lats, lons = generate_route(shape, length_km * scale, points_per_km, seed=seed, **kwargs)
+        path = os.path.join(output_dir, f"{name}_x{scale:g}.gpx")
+        write_gpx(path, lats, lons, name)
+        paths.append(path)
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output-dir", default=os.path.join("benchmarks", "routes"))
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply the standard route lengths")
+    parser.add_argument("--points-per-km", type=float, default=100.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shape", choices=SHAPES, help="Write a single route of this shape instead")
+    parser.add_argument("--length-km", type=float, default=100.0)
+    args = parser.parse_args()
+
+    if args.shape:
+        lats, lons = generate_route(args.shape, args.length_km, args.points_per_km, seed=args.seed)
+        os.makedirs(args.output_dir, exist_ok=True)
+        path = os.path.join(args.output_dir, f"synthetic_{args.shape}_{args.length_km:g}km.gpx")
+        write_gpx(path, lats, lons)
+        paths = [path]
+    else:
+        paths = write_standard_routes(args.output_dir, args.scale, args.points_per_km, args.seed)
+
+    for path in paths:
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
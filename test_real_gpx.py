@@ -25,9 +25,12 @@ async def test_hard_gpx():
                 print(f"      Last point: ({last.latitude}, {last.longitude})")
 
     print("\nGenerating PDF...")
-    pdf_path = await main(gpx, tile_source="IGN", line_color="#B700FF")
+    pdf = await main(gpx, tile_source="IGN", line_color="#B700FF")
 
-    if pdf_path:
+    if pdf:
+        pdf_path = 'viarhona.pdf'
+        with open(pdf_path, 'wb') as f:
+            f.write(pdf)
         print(f"✓ PDF generated: {pdf_path}")
     else:
         print("✗ No PDF generated (empty track?)")
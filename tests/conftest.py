@@ -0,0 +1,82 @@
+import io
+import pytest
+from PIL import Image
+import utils
+from tile_fetcher import TileFetcher, tile_cache_key
+
+
+def solid_png(color):
+    """PNG of a plain 256x256 tile."""
+    buffer = io.BytesIO()
+    Image.new("RGB", (256, 256), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def position_tile(key):
+    """Solid tile coloured by position, so that neighbours differ."""
+    return solid_png((key.col % 256, key.row % 256, 128))
+
+
+class FakeFetcher(TileFetcher):
+    """
+    TileFetcher serving generated tiles instead of downloading them.
+
+    Served tiles go to the tile cache, if any, as downloaded ones do.
+
+    Args:
+        tile: Function of the TileKey returning the PNG bytes of the tile,
+            None for a missing tile
+
+    Attributes:
+        downloads: TileKeys of every tile asked for, in order
+        down: While True every tile is missing, as in a provider outage
+    """
+
+    def __init__(self, tile=position_tile, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.tile = tile
+        self.downloads = []
+        self.down = False
+
+    async def _download(self, session, key):
+        self.downloads.append(key)
+        data = None if self.down else self.tile(key)
+        if data is not None and self.cache is not None:
+            self.cache.put(tile_cache_key(key), data)
+        return data
+
+
+def offline_worker(tile=position_tile):
+    """Worker initializer of render_process_pool: the offline fixture, in a worker process."""
+    fetcher = FakeFetcher(tile)
+    utils.get_default_fetcher = lambda: fetcher
+    utils.get_base_page_cache = lambda: None
+
+
+@pytest.fixture
+def tile():
+    """Tiles of the fetchers of new_fetcher and offline, override it in a test module to change them."""
+    return position_tile
+
+
+@pytest.fixture
+def tile_cache():
+    """Tile cache of the offline fetcher, none by default. Override it like tile."""
+    return None
+
+
+@pytest.fixture
+def new_fetcher(monkeypatch, tile):
+    """Make FakeFetchers, the last one made is the one renders use."""
+    def make(**kwargs):
+        fetcher = FakeFetcher(tile, **kwargs)
+        monkeypatch.setattr(utils, 'get_default_fetcher', lambda: fetcher)
+        return fetcher
+    return make
+
+
+@pytest.fixture
+def offline(monkeypatch, new_fetcher, tile_cache):
+    """FakeFetcher used by renders, without base page cache. Worker processes need offline_worker."""
+    monkeypatch.setattr(utils, 'get_base_page_cache', lambda: None)
+    return new_fetcher(cache=tile_cache)
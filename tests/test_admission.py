@@ -0,0 +1,140 @@
+import asyncio
+import pytest
+import admission
+import pdf_writer
+from admission import AdmissionController, AdmissionRejected, estimate_job_bytes, rejected_total
+from pdf_writer import ENCODE_WORKERS, MAX_DEFAULT_ENCODE_WORKERS, default_encode_workers
+from metrics import MetricsRegistry
+
+
+class TestEstimateJobBytes:
+    """Test the peak memory estimate of a render job."""
+
+    def test_streaming_render_does_not_grow_with_pages(self):
+        assert estimate_job_bytes(admission.PAGES_IN_FLIGHT) == estimate_job_bytes(200)
+
+    def test_grows_with_pages_in_flight(self):
+        assert estimate_job_bytes(10, pages_in_flight=4) > estimate_job_bytes(10, pages_in_flight=1)
+
+    def test_pages_waiting_for_encoding_hold_their_bitmap(self):
+        page_bytes = 9 * 256 * 14 * 256 * 4
+        rendering = estimate_job_bytes(10, pages_in_flight=1)
+
+        assert estimate_job_bytes(10, pages_in_flight=3) == rendering + 2 * page_bytes
+        # No more pages in flight than the atlas has
+        assert estimate_job_bytes(2, pages_in_flight=3) == rendering + page_bytes
+
+    def test_pages_in_flight_follow_encode_workers(self):
+        assert admission.PAGES_IN_FLIGHT == ENCODE_WORKERS + 1
+
+    def test_default_encode_workers_capped(self, monkeypatch):
+        monkeypatch.setattr(pdf_writer.os, 'sched_getaffinity', lambda pid: set(range(64)), raising=False)
+        assert default_encode_workers() == MAX_DEFAULT_ENCODE_WORKERS
+
+        monkeypatch.setattr(pdf_writer.os, 'sched_getaffinity', lambda pid: {0, 1}, raising=False)
+        assert default_encode_workers() == 2
+
+    def test_grows_with_page_geometry(self):
+        assert estimate_job_bytes(1, columns=18, rows=14) > estimate_job_bytes(1, columns=9, rows=14)
+
+
+class TestAdmissionController:
+    """Test admission of jobs against a memory budget."""
+
+    def test_admits_within_budget(self):
+        async def scenario():
+            controller = AdmissionController(budget_bytes=100, max_queue=1, queue_timeout=1)
+            await controller.acquire(40)
+            await controller.acquire(60)
+            return controller
+
+        controller = asyncio.run(scenario())
+        assert (controller.reserved, controller.running) == (100, 2)
+
+    def test_queues_until_memory_is_released(self):
+        order = []
+
+        async def job(controller, name, nbytes, duration):
+            await controller.acquire(nbytes)
+            order.append(name)
+            await asyncio.sleep(duration)
+            controller.release(nbytes)
+
+        async def scenario():
+            controller = AdmissionController(budget_bytes=100, max_queue=5, queue_timeout=1)
+            await asyncio.gather(
+                job(controller, "big", 80, 0.02),
+                job(controller, "waits", 50, 0),
+                # Would fit, but does not overtake the waiting job
+                job(controller, "small", 10, 0),
+            )
+            return controller
+
+        controller = asyncio.run(scenario())
+        assert order == ["big", "waits", "small"]
+        assert (controller.reserved, controller.running) == (0, 0)
+
+    def test_rejects_job_larger_than_budget(self):
+        before = rejected_total.value(reason="too_large")
+
+        async def scenario():
+            controller = AdmissionController(budget_bytes=100)
+            await controller.acquire(101)
+
+        with pytest.raises(AdmissionRejected) as error:
+            asyncio.run(scenario())
+        assert error.value.reason == "too_large"
+        assert rejected_total.value(reason="too_large") == before + 1
+
+    def test_rejects_when_queue_is_full(self):
+        async def scenario():
+            controller = AdmissionController(budget_bytes=100, max_queue=1, queue_timeout=1)
+            await controller.acquire(100)
+            waiting = asyncio.ensure_future(controller.acquire(50))
+            await asyncio.sleep(0)
+            try:
+                await controller.acquire(50)
+            finally:
+                waiting.cancel()
+
+        with pytest.raises(AdmissionRejected) as error:
+            asyncio.run(scenario())
+        assert error.value.reason == "queue_full"
+
+    def test_rejects_after_queue_timeout(self):
+        async def scenario():
+            controller = AdmissionController(budget_bytes=100, max_queue=1, queue_timeout=0.01)
+            await controller.acquire(100)
+            try:
+                await controller.acquire(50)
+            finally:
+                assert len(controller._waiters) == 0
+
+        with pytest.raises(AdmissionRejected) as error:
+            asyncio.run(scenario())
+        assert error.value.reason == "timeout"
+
+
+class TestMetricsRegistry:
+    """Test the Prometheus text export."""
+
+    def test_render_prometheus(self):
+        registry = MetricsRegistry()
+        registry.counter("jobs_total", "Jobs").inc(reason="queue_full")
+        registry.gauge("queue_depth", "Waiting jobs").set(3)
+
+        text = registry.render_prometheus()
+
+        assert "# TYPE jobs_total counter" in text
+        assert 'jobs_total{reason="queue_full"} 1' in text
+        assert "queue_depth 3" in text
+
+    def test_same_name_returns_same_metric(self):
+        registry = MetricsRegistry()
+        assert registry.counter("a", "A") is registry.counter("a", "A")
+        with pytest.raises(ValueError):
+            registry.gauge("a", "A")
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,137 @@
+import asyncio
+import io
+import threading
+import pytest
+from PIL import Image
+import utils
+from utils import base_page_key, decode_base_page, encode_base_page, render_page
+from page_generation import fill_page
+from result_cache import LocalDirectoryStore, ResultCache
+
+
+@pytest.fixture
+def cached(monkeypatch, tmp_path, offline):
+    """The offline fetcher and an empty base page cache."""
+    cache = ResultCache(LocalDirectoryStore(str(tmp_path)))
+    monkeypatch.setattr(utils, 'get_base_page_cache', lambda: cache)
+    return offline, cache
+
+
+def render(page, line_color, fetcher, cache_base_pages=True):
+    async def scenario():
+        image = await render_page(page, 0, {}, 'OSM', line_color, cache_base_pages=cache_base_pages)
+        await fetcher.close()
+        return image
+    return asyncio.run(scenario())
+
+
+class TestBasePageCache:
+    """Test that style changes reuse the stitched base map."""
+
+    def test_key_depends_on_source_origin_and_size(self):
+        page = fill_page((100, 200), 14, 9)
+
+        assert base_page_key(page, 'osm') == base_page_key(fill_page((100, 200), 14, 9), 'OSM')
+        assert base_page_key(page, 'OSM') != base_page_key(page, 'IGN')
+        assert base_page_key(page, 'OSM') != base_page_key(fill_page((101, 200), 14, 9), 'OSM')
+        assert base_page_key(page, 'OSM') != base_page_key(fill_page((100, 200), 10, 9), 'OSM')
+
+    def test_colour_change_reuses_base(self, cached, new_fetcher):
+        fetcher, cache = cached
+        page = fill_page((100, 200), 3, 2)
+
+        first = render(page, '#ff0000', fetcher)
+        assert len(fetcher.downloads) == 6
+        assert base_page_key(page, 'OSM') in cache
+
+        # New fetcher: no in-memory state, only the base page cache can help
+        fetcher = new_fetcher()
+        second = render(page, '#00ff00', fetcher)
+
+        assert fetcher.downloads == []
+        # Lossless base: same pixels as the freshly stitched page
+        assert first.tobytes() == second.tobytes()
+
+    def test_missing_tiles_are_not_cached(self, cached):
+        fetcher, cache = cached
+        fetcher.down = True
+        page = fill_page((100, 200), 2, 2)
+
+        render(page, '#ff0000', fetcher)
+
+        assert base_page_key(page, 'OSM') not in cache
+
+    def test_pages_are_read_and_written_off_the_event_loop(self, cached, new_fetcher, monkeypatch):
+        fetcher, cache = cached
+        threads = []
+
+        def recorded(name):
+            method = getattr(cache, name)
+
+            def call(*args):
+                threads.append((name, threading.current_thread()))
+                return method(*args)
+            monkeypatch.setattr(cache, name, call)
+        recorded('get')
+        recorded('put')
+        page = fill_page((100, 200), 2, 2)
+
+        render(page, '#ff0000', fetcher)
+        render(page, '#00ff00', new_fetcher())
+
+        assert [name for name, _ in threads] == ['get', 'put', 'get']
+        assert all(thread is not threading.main_thread() for _, thread in threads)
+
+    def test_render_larger_than_the_cache_only_reads(self, cached, new_fetcher):
+        fetcher, cache = cached
+        page = fill_page((100, 200), 2, 2)
+
+        render(page, '#ff0000', fetcher, cache_base_pages=False)
+        assert base_page_key(page, 'OSM') not in cache
+
+        render(page, '#ff0000', new_fetcher())
+        fetcher = new_fetcher()
+        render(page, '#00ff00', fetcher, cache_base_pages=False)
+        assert fetcher.downloads == []
+
+    def test_renders_fit_by_page_count(self, monkeypatch, tmp_path):
+        cache = ResultCache(LocalDirectoryStore(str(tmp_path)), max_bytes=3 * utils.BASE_PAGE_BYTES)
+        monkeypatch.setattr(utils, 'get_base_page_cache', lambda: cache)
+
+        assert utils.base_page_cache_fits(3)
+        assert not utils.base_page_cache_fits(4)
+        monkeypatch.setattr(utils, 'get_base_page_cache', lambda: None)
+        assert not utils.base_page_cache_fits(1)
+
+
+class TestBasePageFormat:
+    """Test the raw format of the cached base pages."""
+
+    def test_round_trip(self):
+        image = Image.new('RGB', (512, 256), (10, 20, 30))
+        image.putpixel((511, 255), (1, 2, 3))
+
+        decoded = decode_base_page(encode_base_page(image))
+
+        assert decoded.size == (512, 256)
+        assert decoded.tobytes() == image.tobytes()
+
+    def test_rgbx_canvas_stored_as_rgb(self):
+        image = Image.new('RGB', (256, 256), (10, 20, 30))
+
+        data = encode_base_page(image.convert('RGBX'))
+
+        assert decode_base_page(data).tobytes() == image.tobytes()
+        assert len(data) < 256 * 256 * 4
+
+    def test_other_formats_are_misses(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (256, 256)).save(buffer, format='PNG')
+
+        assert decode_base_page(buffer.getvalue()) is None
+        assert decode_base_page(encode_base_page(Image.new('RGB', (256, 256)))[:-1]) is None
+        assert decode_base_page(b'') is None
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import shutil
+from pathlib import Path
+import pytest
+import utils
+import batch_render
+from batch_render import find_gpx_files, run_batch
+from result_cache import LocalDirectoryStore, ResultCache
+
+GPX_DIR = Path(__file__).parent.parent / 'gpx_files'
+
+
+@pytest.fixture
+def batch(monkeypatch, tmp_path, new_fetcher):
+    """Two copies of a route and a broken file, rendered offline with empty caches."""
+    fetcher = new_fetcher(cache=ResultCache(LocalDirectoryStore(str(tmp_path / 'tiles'))))
+    results = ResultCache(LocalDirectoryStore(str(tmp_path / 'results')))
+    monkeypatch.setattr(batch_render, 'get_default_fetcher', lambda: fetcher)
+    monkeypatch.setattr(batch_render, 'get_default_cache', lambda: results)
+    monkeypatch.setattr(utils, 'get_base_page_cache', lambda: None)
+
+    routes = tmp_path / 'routes'
+    routes.mkdir()
+    shutil.copy(GPX_DIR / '[Standard]mini_map.gpx', routes / 'a.gpx')
+    shutil.copy(GPX_DIR / '[Standard]mini_map.gpx', routes / 'b.gpx')
+    (routes / 'broken.gpx').write_text('not a gpx file')
+    return routes, tmp_path / 'out', fetcher
+
+
+class TestBatchRender:
+    """Test rendering a directory of GPX files in one batch."""
+
+    def test_find_gpx_files(self, batch):
+        routes, _, _ = batch
+
+        assert [Path(p).name for p in find_gpx_files([str(routes)])] == ['a.gpx', 'b.gpx', 'broken.gpx']
+        assert [Path(p).name for p in find_gpx_files([str(routes / '[ab].gpx')])] == ['a.gpx', 'b.gpx']
+        assert find_gpx_files([str(GPX_DIR / '[Standard]mini_map.gpx')]) == [str(GPX_DIR / '[Standard]mini_map.gpx')]
+
+    def test_shared_tiles_fetched_once(self, batch):
+        routes, out, fetcher = batch
+        downloads = fetcher.downloads
+
+        summary = asyncio.run(run_batch(find_gpx_files([str(routes)]), str(out), 'OSM', workers=1))
+        totals = summary['totals']
+
+        assert totals['files'] == 3 and totals['failed'] == 1
+        assert totals['tiles_requested'] == 2 * totals['tiles_unique']
+        assert len(downloads) == totals['tiles_unique']
+        assert (out / 'a.pdf').read_bytes() == (out / 'b.pdf').read_bytes()
+        json.dumps(summary)
+
+    def test_second_batch_served_from_result_cache(self, batch):
+        routes, out, _ = batch
+        paths = find_gpx_files([str(routes / '*.gpx')])
+
+        asyncio.run(run_batch(paths, str(out), 'OSM', workers=1))
+        summary = asyncio.run(run_batch(paths, str(out), 'OSM', workers=1))
+
+        assert summary['totals']['result_cache_hits'] == 2
+        assert summary['totals']['tiles_requested'] == 0
+
+    def test_atlas_with_missing_tiles_not_cached(self, batch):
+        routes, out, fetcher = batch
+        paths = [str(routes / 'a.gpx')]
+
+        fetcher.down = True
+        first = asyncio.run(run_batch(paths, str(out), 'OSM', workers=1))
+        broken = (out / 'a.pdf').read_bytes()
+        fetcher.down = False
+        fetcher.downloads.clear()
+        second = asyncio.run(run_batch(paths, str(out), 'OSM', workers=1))
+
+        assert first['files'][0]['complete'] is False
+        assert second['files'][0]['result_cache_hit'] is False
+        assert second['files'][0]['complete'] is True
+        assert len(fetcher.downloads) > 0
+        assert (out / 'a.pdf').read_bytes() != broken
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,147 @@
+import asyncio
+import io
+import numpy as np
+import pytest
+from PIL import Image
+import utils
+from instrumentation import RenderReport
+from conftest import FakeFetcher, solid_png
+from synthetic_routes import route_to_gpx
+from page_generation import fill_page
+from utils import BACKGROUND_COLOR, base_page_key, corridor_tiles
+
+
+def zoom_color(zoom):
+    return (zoom * 10 % 256, 100, 200)
+
+
+@pytest.fixture
+def tile():
+    """Tiles of one colour per zoom level."""
+    return lambda key: solid_png(zoom_color(key.zoom))
+
+
+def diagonal_route(length_deg=0.3):
+    """Straight line going south-east, across a few pages."""
+    lats = np.linspace(45.8, 45.8 - length_deg, 2000)
+    lons = np.linspace(4.8, 4.8 + length_deg, 2000)
+    return route_to_gpx(lats, lons)
+
+
+def render(fetcher, gpx, corridor):
+    report = RenderReport()
+
+    async def scenario():
+        pdf = await utils.main(gpx, 'OSM', report=report, corridor=corridor)
+        await fetcher.close()
+        return pdf
+
+    assert asyncio.run(scenario())
+    return report.to_dict()
+
+
+class TestCorridorTiles:
+    """Test which tiles of a page are near the track."""
+
+    def test_tiles_along_the_track_and_around_it(self):
+        page = fill_page((100, 200), 14, 9)
+        # Horizontal line through the middle of the tiles of row 5
+        list_post = [(10, 5 * 256 + 128), (9 * 256 - 10, 5 * 256 + 128)]
+
+        assert corridor_tiles(page, list_post, 0) == {(100 + i, 205) for i in range(9)}
+        assert corridor_tiles(page, list_post, 1) == {(100 + i, 205 + j) for i in range(9) for j in (-1, 0, 1)}
+
+    def test_tile_crossed_between_distant_points_kept(self):
+        page = fill_page((100, 200), 14, 9)
+        # Two points three tiles apart, nothing recorded in between
+        list_post = [(128, 128), (3 * 256 + 128, 128)]
+
+        assert corridor_tiles(page, list_post, 0) == {(100, 200), (101, 200), (102, 200), (103, 200)}
+
+    def test_corridor_clipped_to_the_page(self):
+        page = fill_page((100, 200), 14, 9)
+
+        assert corridor_tiles(page, [(10, 10)], 2) == {(100 + i, 200 + j) for i in range(3) for j in range(3)}
+
+    def test_base_page_key_depends_on_corridor(self):
+        page = fill_page((100, 200), 14, 9)
+
+        assert base_page_key(page, 'OSM', {(100, 200)}) != base_page_key(page, 'OSM')
+        assert base_page_key(page, 'OSM', {(100, 200)}) != base_page_key(page, 'OSM', {(101, 200)})
+
+
+class TestCorridorRender:
+    """Test rendering only the tiles near the track."""
+
+    def test_linear_route_fetches_less_than_half(self, offline):
+        gpx = diagonal_route()
+        full = render(offline, gpx, None)
+        offline.downloads.clear()
+        corridor = render(offline, gpx, 1)
+
+        assert corridor["pages"] == full["pages"]
+        assert corridor["tiles"]["requested"] < full["tiles"]["requested"] / 2
+        assert corridor["tiles"]["skipped"] == full["tiles"]["requested"] - (
+            corridor["tiles"]["requested"] - corridor["tiles"]["fill"]
+        )
+        assert corridor["tiles_saved"] == corridor["tiles"]["skipped"] - corridor["tiles"]["fill"] > 0
+        assert len(offline.downloads) == corridor["tiles"]["fetched"]
+
+    def test_low_zoom_fill(self, offline):
+        page = fill_page((16000, 11000), 14, 9)
+        near = {(16000, 11000)}
+
+        image = asyncio.run(utils.render_base_page(page, 'OSM', near))
+
+        assert image.getpixel((128, 128)) == zoom_color(15)
+        # Every other tile comes from the zoom 13 tiles above it
+        assert image.getpixel((5 * 256 + 128, 7 * 256 + 128)) == zoom_color(13)
+        assert {key.zoom for key in offline.downloads} == {15, 13}
+        assert len([key for key in offline.downloads if key.zoom == 13]) == 3 * 4
+
+    def test_background_fill(self, offline, monkeypatch):
+        monkeypatch.setattr(utils, 'CORRIDOR_FILL', 'background')
+        page = fill_page((16000, 11000), 14, 9)
+
+        image = asyncio.run(utils.render_base_page(page, 'OSM', {(16000, 11000)}))
+
+        assert image.getpixel((5 * 256 + 128, 7 * 256 + 128)) == BACKGROUND_COLOR
+        assert [key.zoom for key in offline.downloads] == [15]
+
+    def test_low_zoom_fill_has_no_seams(self, monkeypatch):
+        # Gradient running across the tile, broken up at tile edges by per-tile resizes
+        array = np.zeros((256, 256, 3), dtype=np.uint8)
+        array[:, :, 0] = np.arange(256, dtype=np.uint8)[None, :]
+        array[:, :, 1] = np.arange(256, dtype=np.uint8)[:, None]
+        buffer = io.BytesIO()
+        Image.fromarray(array).save(buffer, format="PNG")
+        fetcher = FakeFetcher(lambda key: buffer.getvalue())
+        monkeypatch.setattr(utils, 'get_default_fetcher', lambda: fetcher)
+        tiles = [(16000 + i, 11000 + j) for i in range(4) for j in range(4)]
+
+        filled = asyncio.run(utils.render_fill_tiles(tiles, 'OSM'))
+
+        page = Image.new("RGB", (1024, 1024))
+        for (col, row), image in filled.items():
+            page.paste(image, ((col - 16000) * 256, (row - 11000) * 256))
+        parent = Image.open(io.BytesIO(buffer.getvalue())).convert("RGB")
+        assert np.array_equal(np.asarray(page), np.asarray(parent.resize((1024, 1024), Image.BILINEAR)))
+
+    def test_fill_levels_per_tile_source(self, offline, monkeypatch):
+        assert utils.corridor_fill_levels('IGN') == 1
+        assert utils.corridor_fill_levels('OSM') == 2
+        monkeypatch.setattr(utils, 'CORRIDOR_FILL_LEVELS', 3)
+        assert utils.corridor_fill_levels('IGN') == 3
+
+        page = fill_page((16000, 11000), 14, 9)
+        asyncio.run(utils.render_base_page(page, 'OSM', {(16000, 11000)}))
+
+        assert {key.zoom for key in offline.downloads} == {15, 12}
+
+    def test_settings_keep_their_key_without_corridor(self):
+        assert "corridor" not in utils.render_settings('OSM')
+        assert utils.render_settings('OSM', corridor=2)["corridor"]["tiles"] == 2
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
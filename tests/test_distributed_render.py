@@ -0,0 +1,52 @@
+import asyncio
+from pathlib import Path
+import pytest
+import gpxpy
+from conftest import offline_worker
+from utils import layout_atlas, render_atlas
+from distributed_render import process_pool_mapper, render_atlas_distributed, render_process_pool, split_page_ranges
+
+GPX_DIR = Path(__file__).parent.parent / 'gpx_files'
+
+
+async def collect(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+
+class TestSplitPageRanges:
+    """Test the split of the pages into contiguous ranges."""
+
+    def test_balanced_contiguous_ranges(self):
+        assert split_page_ranges(range(7), 3) == [[0, 1, 2], [3, 4], [5, 6]]
+
+    def test_more_ranges_than_pages(self):
+        assert split_page_ranges([4, 9], 8) == [[4], [9]]
+
+
+class TestDistributedRender:
+    """Test that pages rendered by workers merge into the same PDF."""
+
+    def test_same_pdf_as_serial_render(self, offline):
+        with open(GPX_DIR / 'Wanderung Februar 2026 ohne Zusatz.gpx', 'r') as f:
+            gpx = gpxpy.parse(f)
+        layout = layout_atlas(gpx, 'OSM')
+
+        async def serial():
+            pdf = await collect(render_atlas(gpx, 'OSM', layout=layout, page_numbers="0-3"))
+            await offline.close()
+            return pdf
+
+        serial_pdf = asyncio.run(serial())
+
+        with render_process_pool(2, initializer=offline_worker) as executor:
+            distributed_pdf = asyncio.run(collect(render_atlas_distributed(
+                gpx, 'OSM', layout=layout, page_numbers="0-3",
+                map_chunks=process_pool_mapper(executor), workers=2,
+            )))
+
+        assert b"/Count 4" in distributed_pdf
+        assert distributed_pdf == serial_pdf
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -1,7 +1,6 @@
-import os
 import asyncio
 import gpxpy
-from main import main
+from utils import main
 
 async def test_gpx_to_pdf():
     """Test that the main function can process a GPX file and generate a PDF."""
@@ -9,11 +8,10 @@ async def test_gpx_to_pdf():
     try:
         with open(test_gpx_file, 'r') as gpx_file:
             gpx = gpxpy.parse(gpx_file)
-            pdf_path = await main(gpx)
-            assert pdf_path is not None
-            assert os.path.exists(pdf_path)
-            assert pdf_path.endswith('.pdf')
-            print(f"Test passed! PDF generated at: {pdf_path}")
+            pdf = await main(gpx)
+            assert pdf is not None
+            assert pdf.startswith(b'%PDF')
+            print(f"Test passed! PDF generated: {len(pdf)} bytes")
     except FileNotFoundError:
         print(f"Please create a test GPX file at {test_gpx_file}")
     except Exception as e:
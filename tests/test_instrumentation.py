@@ -0,0 +1,82 @@
+import asyncio
+import json
+from pathlib import Path
+import pytest
+import gpxpy
+from conftest import position_tile
+from utils import main
+from instrumentation import RenderReport, recording, stage
+
+GPX_DIR = Path(__file__).parent.parent / 'gpx_files'
+
+
+@pytest.fixture
+def tile():
+    """Tiles of the offline fetcher: one missing now and then."""
+    return lambda key: None if (key.col + key.row) % 50 == 0 else position_tile(key)
+
+
+class TestRenderReport:
+    """Test the stage timings and counters recorded during a render."""
+
+    def test_main_fills_report(self, offline):
+        with open(GPX_DIR / '[Standard]mini_map.gpx', 'r') as f:
+            gpx = gpxpy.parse(f)
+        report = RenderReport()
+
+        async def scenario():
+            pdf = await main(gpx, 'OSM', report=report)
+            await offline.close()
+            return pdf
+
+        assert asyncio.run(scenario())
+        data = report.to_dict()
+
+        for name in ("project", "layout", "fetch", "stitch", "draw", "annotate", "encode", "write"):
+            assert data["stages"][name]["calls"] >= 1
+        tiles = data["tiles"]
+        assert tiles["requested"] == 9 * 14 * data["pages"]
+        assert tiles["requested"] == tiles["fetched"] + tiles["cached"] + tiles["derived"] + tiles["failed"]
+        assert len(data["page_seconds"]) == data["pages"] == 1
+        assert data["peak_rss_bytes"] > 0
+        json.loads(report.to_json())
+
+    def test_prometheus_export(self):
+        report = RenderReport()
+        with recording(report):
+            with stage("encode"):
+                pass
+
+        text = report.to_prometheus()
+
+        assert '# TYPE render_stage_seconds_total counter' in text
+        assert 'render_stage_seconds_total{stage="encode"}' in text
+        assert 'tiles_total{result="failed"} 0' in text
+
+    def test_stage_outside_render_not_attributed(self):
+        report = RenderReport()
+        with stage("layout"):
+            pass
+
+        assert report.stages == {}
+
+    def test_merge_worker_reports(self):
+        first, second = RenderReport(), RenderReport()
+        with recording(first):
+            with stage("fetch"):
+                pass
+        second.add_stage("fetch", 1.0, 0.5)
+        second.count_tile("fetched")
+        second.add_page(2.0)
+        second.peak_rss_bytes = 123
+
+        first.merge(second.to_dict())
+
+        assert first.stages["fetch"]["calls"] == 2
+        assert first.tiles["fetched"] == 1
+        assert first.page_seconds == [2.0]
+        assert first.peak_rss_bytes == 123
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,90 @@
+from pathlib import Path
+import pytest
+
+pytest.importorskip("modal")
+pytest.importorskip("httpx")
+from fastapi.testclient import TestClient  # noqa: E402
+import modal_backend  # noqa: E402
+from prefetch import page_tiles  # noqa: E402
+from utils import layout_atlas, parse_gpx, parse_page_selection  # noqa: E402
+from result_cache import LocalDirectoryStore, ResultCache  # noqa: E402
+
+GPX_DIR = Path(__file__).parent.parent / 'gpx_files'
+
+
+@pytest.fixture
+def backend(monkeypatch, tmp_path, offline):
+    monkeypatch.setattr(modal_backend, 'PREFETCH_TILES', False)
+    cache = ResultCache(LocalDirectoryStore(str(tmp_path)))
+    monkeypatch.setattr(modal_backend, 'get_default_cache', lambda: cache)
+    with TestClient(modal_backend.web_app) as client:
+        yield client, offline
+        client.portal.call(offline.close)
+
+
+def post(client, *names, **params):
+    files = [("gpx_file", (name, (GPX_DIR / name).read_bytes(), "application/gpx+xml")) for name in names]
+    return client.post("/", files=files, params={"_tile_source": "OSM", **params})
+
+
+class TestRenderEndpoint:
+    """Test the render endpoint of the backend."""
+
+    def test_outage_not_cached(self, backend):
+        client, fetcher = backend
+
+        fetcher.down = True
+        broken = post(client, '[Standard]mini_map.gpx')
+        fetcher.down = False
+        fetcher.downloads.clear()
+        fixed = post(client, '[Standard]mini_map.gpx')
+
+        assert broken.status_code == fixed.status_code == 200
+        assert len(fetcher.downloads) > 0
+        assert fixed.content != broken.content
+        # Complete this time: served from the result cache
+        fetcher.downloads.clear()
+        assert post(client, '[Standard]mini_map.gpx').content == fixed.content
+        assert fetcher.downloads == []
+
+    def test_several_files_one_colour_each(self, backend):
+        client, _ = backend
+        days = ('[Standard]mini_map.gpx', '[Standard]mini_map.gpx')
+
+        one_colour = post(client, *days, _line_color='#B700FF')
+        two_colours = post(client, *days, _line_color='#B700FF,#0080FF')
+
+        assert one_colour.status_code == two_colours.status_code == 200
+        assert one_colour.content.startswith(b'%PDF')
+        # The second file is drawn in its own colour
+        assert two_colours.content != one_colour.content
+
+    def test_options_are_query_parameters(self, backend):
+        client, _ = backend
+        name = '[Standard]mini_map.gpx'
+        files = [("gpx_file", (name, (GPX_DIR / name).read_bytes(), "application/gpx+xml"))]
+
+        default = post(client, name)
+        query = post(client, name, _line_color='#0080FF')
+        form = client.post("/", files=files, data={"_line_color": "#0080FF"}, params={"_tile_source": "OSM"})
+
+        assert query.content != default.content
+        # As documented in the README: a form field is not an option
+        assert form.content == default.content
+    def test_page_selection_downloads_only_its_tiles(self, backend, monkeypatch, tmp_path):
+        client, fetcher = backend
+        name = 'Wanderung Februar 2026 ohne Zusatz.gpx'
+        monkeypatch.setattr(modal_backend, 'PREFETCH_TILES', True)
+        fetcher.cache = ResultCache(LocalDirectoryStore(str(tmp_path / 'tiles')))
+        pages, _ = layout_atlas(parse_gpx((GPX_DIR / name).read_bytes()), 'OSM')
+        assert len(pages) > 1
+
+        response = post(client, name, _pages='2')
+
+        assert response.status_code == 200
+        # Prefetched and rendered tiles are downloaded once, none of the rest of the track
+        assert sorted(key[2:] for key in fetcher.downloads) == sorted(set(page_tiles(pages, parse_page_selection('2', len(pages)))))
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
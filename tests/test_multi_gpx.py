@@ -0,0 +1,146 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+import numpy as np
+import pytest
+from PIL import ImageColor
+import utils
+from conftest import solid_png
+from synthetic_routes import route_to_gpx
+from utils import layout_atlas, merge_gpx, get_page_tracks_in_px, render_page, render_settings
+
+START = datetime(2026, 6, 1, 8, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def tile():
+    """Solid grey tiles, nothing like the track colours."""
+    return lambda key: solid_png((200, 200, 200))
+
+
+def day(start, end, day_number, points=500):
+    """One day of a trip: a straight line from start to end (lat, lon), timed."""
+    gpx = route_to_gpx(np.linspace(start[0], end[0], points), np.linspace(start[1], end[1], points))
+    for i, point in enumerate(gpx.tracks[0].segments[0].points):
+        point.time = START + timedelta(days=day_number, seconds=i)
+    return gpx
+
+
+def trip():
+    """Three days, each starting where the previous one stopped."""
+    stops = [(45.80, 4.80), (45.80, 4.83), (45.78, 4.85), (45.76, 4.85)]
+    return [day(stops[i], stops[i + 1], i) for i in range(3)]
+
+
+def render(new_fetcher, gpx, line_color=utils.LINE_COLOR):
+    fetcher = new_fetcher()
+
+    async def scenario():
+        pdf = await utils.main(gpx, 'OSM', line_color, prefetch=False)
+        await fetcher.close()
+        return pdf
+
+    return asyncio.run(scenario()), fetcher.downloads
+
+
+class TestMergeGpx:
+    """Test merging the GPX files of a trip into one track."""
+
+    def test_chronological_order(self):
+        days = trip()
+
+        merged, line_color = merge_gpx([days[2], days[0], days[1]], ["#FF0000", "#00FF00", "#0000FF"])
+
+        assert [track.segments[0].points[0].time for track in merged.tracks] == [
+            days[0].tracks[0].segments[0].points[0].time,
+            days[1].tracks[0].segments[0].points[0].time,
+            days[2].tracks[0].segments[0].points[0].time,
+        ]
+        # Colours follow their file
+        assert line_color == [(0, "#00FF00"), (500, "#0000FF"), (1000, "#FF0000")]
+
+    def test_files_without_times_keep_their_order(self):
+        first = route_to_gpx(np.array([45.0, 45.1]), np.array([5.0, 5.0]))
+        second = route_to_gpx(np.array([44.0, 44.1, 44.2]), np.array([5.0, 5.0, 5.0]))
+
+        merged, line_color = merge_gpx([first, second], "#B700FF")
+
+        assert merged.tracks == first.tracks + second.tracks
+        assert line_color == [(0, "#B700FF"), (2, "#B700FF")]
+
+    def test_single_file_unchanged(self):
+        days = trip()
+
+        assert merge_gpx(days[:1], ["#00FF00"]) == (days[0], "#00FF00")
+        assert render_settings('OSM', merge_gpx(days[:1])[1]) == render_settings('OSM')
+
+
+class TestMultiGpxAtlas:
+    """Test one atlas for several GPX files."""
+
+    def test_fewer_pages_and_fetches_than_separate_files(self, offline, new_fetcher):
+        days = trip()
+        separate_pages = sum(len(layout_atlas(gpx, 'OSM')[0]) for gpx in days)
+        separate_fetches = sum(len(render(new_fetcher, gpx)[1]) for gpx in days)
+
+        merged, _ = merge_gpx(days)
+        pdf, downloads = render(new_fetcher, days)
+
+        page_count = len(layout_atlas(merged, 'OSM')[0])
+        assert page_count < separate_pages
+        assert f"/Count {page_count}".encode() in pdf
+        assert len(downloads) == len(set(downloads)) < separate_fetches
+
+    def test_same_pdf_for_a_single_file_list(self, offline, new_fetcher):
+        gpx = trip()[0]
+
+        assert render(new_fetcher, [gpx])[0] == render(new_fetcher, gpx)[0]
+
+    def test_one_colour_per_file(self, offline, monkeypatch):
+        colors = ["#FF0000", "#00C000", "#0000FF"]
+        merged, line_color = merge_gpx(trip(), colors)
+        pages, gpx_points = layout_atlas(merged, 'OSM')
+
+        for compositor in ("canvas", "pil"):
+            monkeypatch.setattr(utils, 'PAGE_COMPOSITOR', compositor)
+            found = set()
+            for number, page in enumerate(pages):
+                image = np.asarray(asyncio.run(render_page(page, number, gpx_points, 'OSM', line_color)).convert("RGB"))
+                found.update(
+                    color for color in colors
+                    if np.all(image == ImageColor.getrgb(color), axis=-1).any()
+                )
+            assert found == set(colors)
+
+    def test_overview_with_one_colour_per_file(self, offline):
+        days = trip()
+        merged, line_color = merge_gpx(days, ["#FF0000", "#00C000", "#0000FF"])
+        page_count = len(layout_atlas(merged, 'OSM')[0])
+
+        async def scenario():
+            pdf = await utils.main(days, 'OSM', ["#FF0000", "#00C000", "#0000FF"], prefetch=False, overview=True)
+            await offline.close()
+            return pdf
+
+        assert f"/Count {page_count + 1}".encode() in asyncio.run(scenario())
+
+    def test_files_not_joined(self):
+        # A gap between the end of the first file and the start of the second
+        first = day((45.80, 4.80), (45.80, 4.84), 0)
+        second = day((45.80, 4.88), (45.80, 4.92), 1)
+        merged, line_color = merge_gpx([first, second], ["#FF0000", "#0000FF"])
+        pages, gpx_points = layout_atlas(merged, 'OSM')
+
+        tracks = get_page_tracks_in_px(pages[0], gpx_points, line_color)
+
+        assert [color for color, _ in tracks] == ["#FF0000", "#0000FF"]
+        end_of_first, start_of_second = tracks[0][1][-1], tracks[1][1][0]
+        assert start_of_second[0] - end_of_first[0] > 256
+
+    def test_render_settings_keep_the_colours(self):
+        settings = render_settings('OSM', [(0, "#FF0000"), (10, "#0000FF")])
+
+        assert settings["line_color"] == [[0, "#ff0000"], [10, "#0000ff"]]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
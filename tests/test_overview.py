@@ -0,0 +1,191 @@
+import asyncio
+import re
+import time
+from pathlib import Path
+import pytest
+import gpxpy
+from PIL import Image
+import utils
+from conftest import FakeFetcher, offline_worker, solid_png
+from distributed_render import process_pool_mapper, render_atlas_distributed, render_process_pool
+from overview import OverviewPage, overview_levels, page_thumbnail
+from utils import layout_atlas, render_atlas
+
+GPX_DIR = Path(__file__).parent.parent / 'gpx_files'
+
+
+def zoom_tile(key):
+    """Tile coloured by position and zoom level, the overview is made of lower zoom tiles."""
+    return solid_png((key.col % 256, key.row % 256, key.zoom * 10))
+
+
+@pytest.fixture
+def tile():
+    return zoom_tile
+
+
+@pytest.fixture(scope='module')
+def mini_map():
+    with open(GPX_DIR / '[Standard]mini_map.gpx', 'r') as f:
+        return gpxpy.parse(f)
+
+
+@pytest.fixture(scope='module')
+def viarhona():
+    with open(GPX_DIR / '[Hard]viarhona.gpx', 'r') as f:
+        return gpxpy.parse(f)
+
+
+async def collect(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+
+def page_order(pdf):
+    """Object ids of the pages, in document order."""
+    kids = re.search(rb"/Kids \[([^\]]*)\]", pdf).group(1)
+    return [int(object_id) for object_id in re.findall(rb"(\d+) 0 R", kids)]
+
+
+class TestOverviewLevels:
+    """Test the zoom of the overview."""
+
+    def test_pages_fit_on_one_page(self):
+        one_page = {"min_col": 0, "min_row": 0, "max_col": 9, "max_row": 14}
+        wide = {"min_col": 0, "min_row": 0, "max_col": 100, "max_row": 14}
+
+        assert overview_levels(one_page) == 1
+        assert overview_levels(one_page, margin=0) == 0
+        assert overview_levels(wide) == 4
+
+
+class TestOverviewPage:
+    """Test the overview page built from the rendered pages."""
+
+    def test_overview_is_the_first_page(self, offline, mini_map):
+        async def scenario():
+            pdf = await collect(render_atlas(mini_map, 'OSM', overview=True))
+            await offline.close()
+            return pdf
+
+        pdf = asyncio.run(scenario())
+
+        assert b"/Count 2" in pdf
+        # The overview is written last, after the page it is built from
+        assert page_order(pdf) == sorted(page_order(pdf), reverse=True)
+
+    def test_only_uncovered_areas_fetched(self, offline, mini_map):
+        layout = layout_atlas(mini_map, 'OSM')
+
+        async def scenario():
+            await collect(render_atlas(mini_map, 'OSM', layout=layout, overview=True))
+            await offline.close()
+
+        asyncio.run(scenario())
+
+        full_zoom = [key for key in offline.downloads if key.zoom == 15]
+        low_zoom = [key for key in offline.downloads if key.zoom < 15]
+        # The tiles of the page are not fetched again for the overview
+        assert len(full_zoom) == len(set(full_zoom)) == 9 * 14
+        overview = OverviewPage(*layout, 'OSM')
+        assert {key.zoom for key in low_zoom} == {15 - overview.levels}
+        assert 0 < len(low_zoom) < 9 * 14
+
+    def test_pages_not_added_are_fetched_at_low_zoom(self, mini_map):
+        pages, gpx_points = layout_atlas(mini_map, 'OSM')
+        stitched = Image.new("RGB", (9 * 256, 14 * 256), (255, 0, 0))
+
+        with_page = OverviewPage(pages, gpx_points, 'OSM')
+        with_page.add_base_page(0, stitched)
+
+        assert set(with_page._missing_tiles()) < set(OverviewPage(pages, gpx_points, 'OSM')._missing_tiles())
+
+    def test_built_from_the_pages_before_annotation(self, offline, mini_map):
+        pages, gpx_points = layout_atlas(mini_map, 'OSM')
+        overview = OverviewPage(pages, gpx_points, 'OSM')
+
+        async def scenario():
+            async for _ in utils.render_encoded_pages(pages, [0], gpx_points, 'OSM',
+                                                      on_base_page=overview.add_base_page):
+                pass
+            stitched = await utils.render_base_page(pages[0], 'OSM')
+            await offline.close()
+            return stitched
+
+        stitched = asyncio.run(scenario())
+
+        # No track, page number, scale or markers on the base map
+        assert overview._thumbnails[0].tobytes() == page_thumbnail(stitched, overview.levels).tobytes()
+
+    def test_no_overview_for_a_page_selection(self, offline):
+        with open(GPX_DIR / 'Wanderung Februar 2026 ohne Zusatz.gpx', 'r') as f:
+            gpx = gpxpy.parse(f)
+
+        async def scenario():
+            pdf = await collect(render_atlas(gpx, 'OSM', page_numbers="2", overview=True))
+            await offline.close()
+            return pdf
+
+        pdf = asyncio.run(scenario())
+
+        assert b"/Count 1" in pdf
+        assert {key.zoom for key in offline.downloads} == {15}
+
+    def test_fast_for_a_long_atlas(self, viarhona, monkeypatch):
+        pages, gpx_points = layout_atlas(viarhona, 'OSM')
+        assert len(pages) > 50
+        stitched = Image.new("RGB", (9 * 256, 14 * 256), (255, 0, 0))
+
+        tile = solid_png((0, 128, 0))
+        # Low zoom tiles as if already cached: only the overview itself is timed
+        fetcher = FakeFetcher(lambda key: tile)
+        monkeypatch.setattr(utils, 'get_default_fetcher', lambda: fetcher)
+
+        async def scenario():
+            await fetcher.fetch_tile_bytes((0, 0), 'OSM')
+            overview = OverviewPage(pages, gpx_points, 'OSM')
+            # Reduced while each page renders, a fraction of the time of a page
+            per_page = []
+            for number in range(len(pages)):
+                page_start = time.perf_counter()
+                overview.add_base_page(number, stitched)
+                per_page.append(time.perf_counter() - page_start)
+            render_start = time.perf_counter()
+            encoded = await overview.render()
+            elapsed = time.perf_counter() - render_start
+            await fetcher.close()
+            return encoded, sorted(per_page)[len(per_page) // 2], elapsed
+
+        encoded, per_page, elapsed = asyncio.run(scenario())
+
+        assert (encoded.width, encoded.height) == (9 * 256, 14 * 256)
+        assert per_page < 0.05
+        assert elapsed < 1.0
+
+    def test_same_pdf_as_serial_render(self, offline):
+        with open(GPX_DIR / 'Wanderung Februar 2026 ohne Zusatz.gpx', 'r') as f:
+            gpx = gpxpy.parse(f)
+        layout = layout_atlas(gpx, 'OSM')
+
+        async def serial():
+            pdf = await collect(render_atlas(gpx, 'OSM', layout=layout, overview=True))
+            await offline.close()
+            return pdf
+
+        serial_pdf = asyncio.run(serial())
+
+        with render_process_pool(2, initializer=offline_worker, initargs=(zoom_tile,)) as executor:
+            distributed_pdf = asyncio.run(collect(render_atlas_distributed(
+                gpx, 'OSM', layout=layout,
+                map_chunks=process_pool_mapper(executor), workers=2, overview=True,
+            )))
+
+        assert b"/Count 8" in distributed_pdf
+        assert distributed_pdf == serial_pdf
+
+    def test_settings_keep_their_key_without_overview(self):
+        assert "overview" not in utils.render_settings('OSM')
+        assert utils.render_settings('OSM', overview=True)["overview"] is True
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
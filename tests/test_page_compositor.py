@@ -0,0 +1,142 @@
+import asyncio
+import io
+import numpy as np
+import pytest
+import gpxpy
+from pathlib import Path
+from PIL import Image, ImageDraw
+import utils
+from benchmarks.compositor import run_benchmark
+from page_compositor import PageCanvas
+from result_cache import LocalDirectoryStore, ResultCache
+from utils import layout_atlas, render_encoded_page
+
+GPX_DIR = Path(__file__).parent.parent / 'gpx_files'
+
+
+GRADIENT = np.zeros((256, 256, 3), dtype=int)
+GRADIENT[:, :, 0] = np.arange(256)[None, :]
+GRADIENT[:, :, 1] = np.arange(256)[:, None]
+
+
+def gradient_tile(key):
+    """Gradient tile, shifted by position so that no two neighbours are the same."""
+    tile = ((GRADIENT + (key.col * 37, key.row * 59, key.zoom * 10)) % 256).astype(np.uint8)
+    buffer = io.BytesIO()
+    Image.fromarray(tile).save(buffer, format="PNG", compress_level=1)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def tile():
+    """Gradient tiles, any resampling or offset difference between the compositors shows."""
+    return gradient_tile
+
+
+@pytest.fixture(scope='module')
+def layout():
+    with open(GPX_DIR / 'Wanderung Februar 2026 ohne Zusatz.gpx', 'r') as f:
+        pages, gpx_points = layout_atlas(gpxpy.parse(f), 'OSM')
+    # Enough for a page with both navigation markers
+    return pages[:3], gpx_points
+
+
+def render_with(monkeypatch, fetcher, compositor, layout, corridor=None):
+    monkeypatch.setattr(utils, 'PAGE_COMPOSITOR', compositor)
+    pages, gpx_points = layout
+
+    async def scenario():
+        encoded = [
+            await render_encoded_page(pages, number, gpx_points, 'OSM', utils.LINE_COLOR, corridor=corridor)
+            for number in range(len(pages))
+        ]
+        await fetcher.close()
+        return encoded
+
+    return asyncio.run(scenario())
+
+
+class TestPageCanvas:
+    """Test the image the pages are assembled in."""
+
+    def test_tiles_placed_in_their_slice(self):
+        canvas = PageCanvas(3, 2)
+        tiles = {(c, r): Image.new("RGB", (256, 256), (c * 50, r * 50, 7)) for c in range(3) for r in range(2)}
+        for (column, row), tile in tiles.items():
+            canvas.place_tile(column, row, tile)
+
+        image = canvas.image().convert("RGB")
+        for (column, row), tile in tiles.items():
+            assert image.getpixel((column * 256 + 10, row * 256 + 10)) == tile.getpixel((0, 0))
+
+    def test_image_is_not_a_copy(self):
+        canvas = PageCanvas(1, 1)
+        canvas.place_tile(0, 0, Image.new("RGB", (256, 256)))
+        image = canvas.image()
+        canvas.paste(Image.new("RGB", (1, 1), (1, 2, 3)), (5, 5))
+
+        assert image.getpixel((5, 5)) == (1, 2, 3)
+
+    def test_palette_tiles_converted(self):
+        tile = Image.new("RGB", (256, 256), (10, 20, 30)).convert("P")
+        canvas = PageCanvas(1, 1)
+        canvas.place_tile(0, 0, tile)
+
+        assert canvas.crop((0, 0, 256, 256)).tobytes() == tile.convert("RGB").tobytes()
+
+    def test_blend_track_same_as_draw_line(self):
+        rng = np.random.default_rng(1)
+        base = Image.fromarray(rng.integers(0, 256, (512, 768, 3), dtype=np.uint8))
+        points = [(10, 500), (300, 20), None, (700.5, 300.2), (760, 510)]
+
+        canvas = PageCanvas.from_image(base)
+        canvas.blend_track(points, "#B700FF", 10)
+        expected = base.copy()
+        line = [point for point in points if point is not None]
+        mask = Image.new("L", base.size, 0)
+        ImageDraw.Draw(mask).line(line, fill=255, width=10)
+        expected.paste(Image.new("RGB", base.size, "#B700FF"), (0, 0), mask.point(lambda p: 255 if p > 128 else 0))
+        for (x0, y0), (x1, y1) in zip(line, line[1:]):
+            mask = Image.new("L", base.size, 0)
+            ImageDraw.Draw(mask).line((x0, y0, x1, y1), fill=255, width=10)
+            expected.paste(Image.new("RGB", base.size, "#B700FF"), (0, 0), mask)
+
+        assert np.array_equal(np.asarray(canvas.image().convert("RGB")), np.asarray(expected))
+
+
+class TestCompositors:
+    """Test the canvas compositor against the stitching of PIL images."""
+
+    def test_same_pages(self, offline, new_fetcher, monkeypatch, layout):
+        canvas_pages = render_with(monkeypatch, offline, "canvas", layout)
+        pil_pages = render_with(monkeypatch, new_fetcher(), "pil", layout)
+
+        assert len(canvas_pages) == 3
+        assert [page.data for page in canvas_pages] == [page.data for page in pil_pages]
+
+    def test_same_pages_in_corridor_mode(self, offline, new_fetcher, monkeypatch, layout):
+        canvas_pages = render_with(monkeypatch, offline, "canvas", layout, corridor=1)
+        pil_pages = render_with(monkeypatch, new_fetcher(), "pil", layout, corridor=1)
+
+        assert [page.data for page in canvas_pages] == [page.data for page in pil_pages]
+
+    def test_same_page_from_the_base_page_cache(self, offline, new_fetcher, monkeypatch, layout, tmp_path):
+        cache = ResultCache(LocalDirectoryStore(str(tmp_path)))
+        monkeypatch.setattr(utils, 'get_base_page_cache', lambda: cache)
+        pages, gpx_points = layout
+
+        first = render_with(monkeypatch, offline, "canvas", (pages[:1], gpx_points))
+        # Cached by the canvas compositor, read back by the PIL one
+        second = render_with(monkeypatch, new_fetcher(), "pil", (pages[:1], gpx_points))
+
+        assert first[0].data == second[0].data
+
+    def test_benchmark_canvas_faster(self):
+        report = run_benchmark(str(GPX_DIR / 'Wanderung Februar 2026 ohne Zusatz.gpx'), page_count=2, runs=1)
+
+        assert report["identical"]
+        assert report["canvas"]["compose_s_per_page"] < report["pil"]["compose_s_per_page"]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,97 @@
+import asyncio
+import itertools
+import threading
+import time
+from pathlib import Path
+import pytest
+import gpxpy
+import utils
+from instrumentation import RenderReport
+from pdf_writer import encode_page
+from utils import layout_atlas, render_atlas, render_encoded_pages
+
+GPX_DIR = Path(__file__).parent.parent / 'gpx_files'
+
+
+@pytest.fixture(scope='module')
+def layout():
+    with open(GPX_DIR / 'Wanderung Februar 2026 ohne Zusatz.gpx', 'r') as f:
+        gpx = gpxpy.parse(f)
+    return gpx, layout_atlas(gpx, 'OSM')
+
+
+def encode_workers(monkeypatch, workers):
+    monkeypatch.setattr(utils, 'ENCODE_WORKERS', workers)
+    monkeypatch.setattr(utils, '_encode_executor', None)
+
+
+def render_pdf(fetcher, gpx, layout, report=None):
+    async def scenario():
+        with utils.recording(report or RenderReport()):
+            pdf = b"".join([chunk async for chunk in render_atlas(gpx, 'OSM', layout=layout, page_numbers="0-4")])
+        await fetcher.close()
+        return pdf
+
+    return asyncio.run(scenario())
+
+
+class TestParallelEncoding:
+    """Test encoding the pages in a thread pool while the next ones render."""
+
+    def test_same_pdf_as_serial_encoding(self, offline, new_fetcher, monkeypatch, layout):
+        gpx, pages_layout = layout
+        encode_workers(monkeypatch, 0)
+        serial = render_pdf(offline, gpx, pages_layout)
+        encode_workers(monkeypatch, 3)
+        parallel = render_pdf(new_fetcher(), gpx, pages_layout)
+
+        assert b"/Count 5" in parallel
+        assert parallel == serial
+
+    def test_pages_in_order_whatever_finishes_first(self, offline, monkeypatch, layout):
+        encode_workers(monkeypatch, 4)
+        _, (pages, gpx_points) = layout
+        threads = set()
+        calls = itertools.count()
+
+        def slow_first_pages(image, quality=utils.JPEG_QUALITY):
+            threads.add(threading.current_thread().name)
+            # The first pages finish encoding last
+            time.sleep(0.05 * (5 - next(calls)))
+            return encode_page(image, quality)
+
+        monkeypatch.setattr(utils, 'encode_page', slow_first_pages)
+
+        async def scenario():
+            numbers = [number async for number, _ in render_encoded_pages(pages, range(5), gpx_points, 'OSM')]
+            await offline.close()
+            return numbers
+
+        assert asyncio.run(scenario()) == [0, 1, 2, 3, 4]
+        assert all(name.startswith("encode") for name in threads)
+
+    def test_encode_stage_in_the_report(self, offline, monkeypatch, layout):
+        gpx, pages_layout = layout
+        encode_workers(monkeypatch, 2)
+        report = RenderReport()
+
+        render_pdf(offline, gpx, pages_layout, report)
+
+        result = report.to_dict()
+        assert result["pages"] == 5
+        assert result["stages"]["encode"]["calls"] == 5
+
+    def test_forked_process_gets_its_own_pool(self, monkeypatch):
+        encode_workers(monkeypatch, 2)
+        executor = utils.get_encode_executor()
+        assert utils.get_encode_executor() is executor
+
+        monkeypatch.setattr(utils, '_encode_executor', (-1, executor))
+        assert utils.get_encode_executor() is not executor
+
+        encode_workers(monkeypatch, 0)
+        assert utils.get_encode_executor() is None
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,62 @@
+import asyncio
+from pathlib import Path
+import pytest
+import gpxpy
+from utils import layout_atlas, parse_page_selection, render_atlas
+
+GPX_DIR = Path(__file__).parent.parent / 'gpx_files'
+
+
+class TestParsePageSelection:
+    """Test parsing of page selections such as "0-3,7"."""
+
+    def test_single_pages_and_ranges(self):
+        assert parse_page_selection("3", 10) == [3]
+        assert parse_page_selection("0-2, 7,5-5", 10) == [0, 1, 2, 5, 7]
+
+    def test_duplicates_are_merged(self):
+        assert parse_page_selection("1-3,2", 10) == [1, 2, 3]
+
+    def test_iterable_of_numbers(self):
+        assert parse_page_selection([4, 1, 4], 10) == [1, 4]
+
+    def test_normalize_without_page_count(self):
+        assert parse_page_selection("9,2-3", None) == [2, 3, 9]
+
+    @pytest.mark.parametrize("selection", ["", "a", "3-1", "1-x", ","])
+    def test_malformed(self, selection):
+        with pytest.raises(ValueError):
+            parse_page_selection(selection, 10)
+
+    def test_out_of_range(self):
+        with pytest.raises(ValueError, match="do not exist"):
+            parse_page_selection("8-10", 10)
+
+
+class TestPartialRender:
+    """Test that only the selected pages are fetched and rendered."""
+
+    def test_only_selected_pages_are_fetched(self, offline):
+        with open(GPX_DIR / 'Wanderung Februar 2026 ohne Zusatz.gpx', 'r') as f:
+            gpx = gpxpy.parse(f)
+        layout = layout_atlas(gpx, 'OSM')
+        pages = layout[0]
+        assert len(pages) > 3
+
+        # Only the requests matter, placeholders are quicker than tiles
+        offline.down = True
+
+        async def scenario():
+            chunks = [chunk async for chunk in render_atlas(gpx, 'OSM', layout=layout, page_numbers="1,3")]
+            await offline.close()
+            return b"".join(chunks)
+
+        pdf = asyncio.run(scenario())
+
+        expected = {(int(col), int(row)) for number in (1, 3) for column in pages[number] for col, row in column}
+        assert {(key.col, key.row) for key in offline.downloads} == expected
+        assert b"/Count 2" in pdf
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
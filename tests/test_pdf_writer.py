@@ -0,0 +1,59 @@
+import re
+import pytest
+from PIL import Image
+from pdf_writer import PdfStreamWriter, encode_page
+
+
+def build_pdf(pages):
+    writer = PdfStreamWriter(resolution=100.0)
+    chunks = [writer.begin()]
+    for page in pages:
+        chunks.append(writer.add_page(page))
+    chunks.append(writer.close())
+    return chunks
+
+
+class TestPdfStreamWriter:
+    """Test the incremental PDF writer."""
+
+    @pytest.fixture
+    def encoded_pages(self):
+        colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255)]
+        return [encode_page(Image.new("RGB", (200, 100), color)) for color in colors]
+
+    def test_pages_are_emitted_before_close(self, encoded_pages):
+        chunks = build_pdf(encoded_pages)
+
+        assert chunks[0].startswith(b"%PDF-1.4")
+        # One chunk per page, each carrying its own JPEG stream
+        for chunk, page in zip(chunks[1:-1], encoded_pages):
+            assert page.data in chunk
+        assert b"xref" not in b"".join(chunks[:-1])
+        assert chunks[-1].endswith(b"%%EOF\n")
+
+    def test_xref_offsets_point_to_objects(self, encoded_pages):
+        pdf = b"".join(build_pdf(encoded_pages))
+
+        startxref = int(re.search(rb"startxref\n(\d+)", pdf).group(1))
+        assert pdf[startxref:].startswith(b"xref")
+
+        offsets = re.findall(rb"(\d{10}) 00000 n ", pdf[startxref:])
+        for object_id, offset in enumerate(offsets, start=1):
+            assert pdf[int(offset):].startswith(f"{object_id} 0 obj".encode("ascii"))
+
+    def test_page_tree_and_size(self, encoded_pages):
+        pdf = b"".join(build_pdf(encoded_pages))
+
+        assert b"/Count 3" in pdf
+        # 200x100 px at 100 dpi is 144x72 pt
+        assert pdf.count(b"/MediaBox [0 0 144.0000 72.0000]") == 3
+
+    def test_cannot_add_after_close(self, encoded_pages):
+        writer = PdfStreamWriter()
+        writer.close()
+        with pytest.raises(ValueError):
+            writer.add_page(encoded_pages[0])
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
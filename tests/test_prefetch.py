@@ -0,0 +1,173 @@
+import asyncio
+from pathlib import Path
+import pytest
+import prefetch
+import utils
+from conftest import FakeFetcher
+from instrumentation import RenderReport
+from prefetch import TilePrefetcher, page_tiles, scan_track_points, scan_track_tiles
+from provider_health import ProviderStats
+from result_cache import LocalDirectoryStore, ResultCache
+
+GPX_DIR = Path(__file__).parent.parent / 'gpx_files'
+
+
+@pytest.fixture
+def mini_map_data():
+    return (GPX_DIR / '[Standard]mini_map.gpx').read_bytes()
+
+
+@pytest.fixture
+def tile_cache(tmp_path):
+    """The prefetcher downloads into the tile cache, it does nothing without one."""
+    return ResultCache(LocalDirectoryStore(str(tmp_path)))
+
+
+class TestTrackScan:
+    """Test guessing the track tiles without parsing the file."""
+
+    def test_scan_matches_gpxpy(self, mini_map_data):
+        gpx = utils.parse_gpx(mini_map_data)
+        points = [p for track in gpx.tracks for segment in track.segments for p in segment.points]
+
+        lats, lons = scan_track_points(mini_map_data)
+
+        assert lats.tolist() == [p.latitude for p in points]
+        assert lons.tolist() == [p.longitude for p in points]
+
+    def test_scan_accepts_any_attribute_order(self):
+        data = b"""<gpx><trk><trkseg>
+            <trkpt lat="45.1" lon="4.2"><ele>100</ele></trkpt>
+            <trkpt lon='4.3' lat='45.2'/>
+            <wpt lat="1" lon="2"/>
+        </trkseg></trk></gpx>"""
+
+        lats, lons = scan_track_points(data)
+
+        assert lats.tolist() == [45.1, 45.2]
+        assert lons.tolist() == [4.2, 4.3]
+
+    @pytest.mark.parametrize("tile_source", ["OSM", "IGN"])
+    def test_scan_tiles_are_the_track_tiles_in_order(self, mini_map_data, tile_source):
+        tiles, _ = utils.extract_track(utils.parse_gpx(mini_map_data), tile_source)
+
+        assert scan_track_tiles(mini_map_data, tile_source) == tiles
+
+    def test_page_tiles_skip_unknown_pages(self):
+        pages = [[[(0, 0), (0, 1)], [(1, 0), (1, 1)]]]
+
+        assert page_tiles(pages) == [(0, 0), (0, 1), (1, 0), (1, 1)]
+        assert page_tiles(pages, [0, 3]) == page_tiles(pages)
+
+
+class TestTilePrefetcher:
+    """Test background downloads ahead of the render."""
+
+    def test_submitted_tiles_downloaded_once(self, offline):
+        async def scenario():
+            async with TilePrefetcher("OSM", offline, concurrency=4) as prefetcher:
+                prefetcher.submit([(1, 1), (1, 2), (1, 1)])
+                prefetcher.submit([(1, 2), (1, 3)])
+                await prefetcher.join()
+            await offline.close()
+            return prefetcher
+
+        prefetcher = asyncio.run(scenario())
+
+        assert sorted((key.col, key.row) for key in offline.downloads) == [(1, 1), (1, 2), (1, 3)]
+        assert (prefetcher.submitted, prefetcher.done, prefetcher.failed) == (3, 3, 0)
+
+    def test_disabled_without_tile_cache(self):
+        async def scenario():
+            async with TilePrefetcher("OSM", FakeFetcher()) as prefetcher:
+                prefetcher.submit([(1, 1)])
+            return prefetcher
+
+        assert asyncio.run(scenario()).submitted == 0
+
+    def test_track_tiles_download_while_parsing(self, offline, mini_map_data, monkeypatch):
+        parse_gpx = prefetch.parse_gpx
+        downloads_at_parse = []
+
+        def slow_parse(data):
+            # Parsing a large file: the loop keeps downloading meanwhile
+            import time
+            time.sleep(0.5)
+            downloads_at_parse.append(len(offline.downloads))
+            return parse_gpx(data)
+
+        monkeypatch.setattr(prefetch, 'parse_gpx', slow_parse)
+        report = RenderReport()
+
+        async def scenario():
+            pdf = await utils.main(mini_map_data, 'OSM', report=report)
+            await offline.close()
+            return pdf
+
+        assert asyncio.run(scenario())
+        track_tiles = scan_track_tiles(mini_map_data, 'OSM')
+        assert downloads_at_parse[0] == len(track_tiles)
+        # Every tile downloaded once, the render reading them from the cache
+        assert len(offline.downloads) == len(set(offline.downloads)) == 9 * 14
+        tiles = report.to_dict()["tiles"]
+        assert tiles["requested"] == 9 * 14
+        assert tiles["cached"] >= len(track_tiles)
+
+    def test_same_pdf_with_and_without_prefetch(self, offline, mini_map_data):
+        async def scenario():
+            with_prefetch = await utils.main(mini_map_data, 'OSM', prefetch=True)
+            without = await utils.main(utils.parse_gpx(mini_map_data), 'OSM', prefetch=False)
+            await offline.close()
+            return with_prefetch, without
+
+        with_prefetch, without = asyncio.run(scenario())
+
+        assert with_prefetch == without
+
+    def test_concurrency_follows_provider_health(self, tile_cache):
+        providers = ProviderStats()
+        for ok in [True, False, False, False]:
+            providers.record_response("OSM", 200 if ok else 503, 0.01)
+        fetcher = SlowFetcher(cache=tile_cache, providers=providers)
+
+        async def scenario():
+            async with TilePrefetcher("OSM", fetcher, concurrency=8, backoff_s=0.01) as prefetcher:
+                prefetcher.submit([(1, row) for row in range(16)])
+                await prefetcher.join()
+            await fetcher.close()
+            return prefetcher
+
+        prefetcher = asyncio.run(scenario())
+
+        # A score of 0.25 leaves 2 of the 8 workers downloading
+        assert prefetcher.active_workers == 2
+        assert fetcher.peak == 2
+        assert prefetcher.done == 16
+
+    def test_failing_provider_keeps_one_worker(self, tile_cache):
+        providers = ProviderStats()
+        providers.record_response("OSM", "error", 0.01)
+
+        prefetcher = TilePrefetcher("OSM", FakeFetcher(cache=tile_cache, providers=providers), concurrency=8)
+
+        assert prefetcher.active_workers == 1
+
+
+class SlowFetcher(FakeFetcher):
+    """FakeFetcher whose downloads take a while, recording the most running at the same time."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.running = 0
+        self.peak = 0
+
+    async def _download(self, session, key):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        await asyncio.sleep(0.01)
+        self.running -= 1
+        return await super()._download(session, key)
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
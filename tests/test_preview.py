@@ -0,0 +1,80 @@
+import ast
+import json
+import re
+import time
+from pathlib import Path
+import pytest
+import gpxpy
+from benchmarks.startup import forbidden_imports, measure_imports
+from preview import build_preview, render_preview_image
+
+REPO_ROOT = Path(__file__).parent.parent
+GPX_DIR = REPO_ROOT / 'gpx_files'
+
+
+@pytest.fixture(scope='module')
+def viarhona():
+    with open(GPX_DIR / '[Hard]viarhona.gpx', 'r') as f:
+        return gpxpy.parse(f)
+
+
+class TestPreview:
+    """Test the tile-free layout preview."""
+
+    def test_pages_match_layout(self, viarhona):
+        preview = build_preview(viarhona, 'OSM')
+
+        assert preview['page_count'] == len(preview['pages']) > 1
+        assert [p['number'] for p in preview['pages']] == list(range(preview['page_count']))
+        for page in preview['pages']:
+            assert (page['columns'], page['rows']) == (9, 14)
+
+    def test_track_is_simplified_and_inside_pages(self, viarhona):
+        preview = build_preview(viarhona, 'OSM', max_track_points=500)
+        bounds = preview['bounds']
+
+        assert len(preview['track']) <= 501
+        for x, y in preview['track']:
+            assert bounds['min_col'] <= x <= bounds['max_col']
+            assert bounds['min_row'] <= y <= bounds['max_row']
+
+    def test_json_serializable(self, viarhona):
+        json.dumps(build_preview(viarhona, 'OSM'))
+
+    def test_image_is_fast_and_small(self, viarhona):
+        start = time.time()
+        image = render_preview_image(build_preview(viarhona, 'OSM'), max_size=800)
+        elapsed = time.time() - start
+
+        assert max(image.size) <= 800
+        assert elapsed < 1.0, f"Preview took {elapsed:.2f}s"
+
+    def test_empty_track(self):
+        preview = build_preview(gpxpy.gpx.GPX(), 'OSM')
+
+        assert preview['page_count'] == 0
+        assert render_preview_image(preview) is None
+
+
+class TestFrontendDeployment:
+    """Test that the frontend runs from the files deploy_front.sh ships."""
+
+    def test_local_imports_are_shipped(self):
+        tree = ast.parse((REPO_ROOT / 'frontend.py').read_text())
+        imported = {alias.name.split('.')[0] for node in ast.walk(tree) if isinstance(node, ast.Import)
+                    for alias in node.names}
+        imported |= {node.module.split('.')[0] for node in ast.walk(tree) if isinstance(node, ast.ImportFrom)}
+        local = {name for name in imported if (REPO_ROOT / f'{name}.py').exists()}
+        shipped = re.search(r'tar -czf \S+ (.*)', (REPO_ROOT / 'deploy_front.sh').read_text()).group(1).split()
+
+        assert local == {'preview_image'}
+        assert all(f'{name}.py' in shipped for name in local)
+
+    def test_preview_image_needs_only_pillow(self):
+        imports = measure_imports("preview_image")
+
+        assert forbidden_imports(imports, forbidden=["utils", "numpy", "gpxpy", "aiohttp", "pyproj"]) == []
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
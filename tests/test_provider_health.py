@@ -0,0 +1,89 @@
+import asyncio
+import pytest
+from metrics import MetricsRegistry
+from instrumentation import RenderReport, recording
+from provider_health import ProviderHealth, ProviderStats
+from tile_fetcher import TileFetcher
+from benchmarks.tile_server import MockTileServer
+
+
+class TestHistogram:
+    """Test the Prometheus histogram."""
+
+    def test_cumulative_buckets(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 3.0):
+            histogram.observe(value, provider="OSM")
+
+        text = registry.render_prometheus()
+
+        assert '# TYPE latency_seconds histogram' in text
+        assert 'latency_seconds_bucket{provider="OSM",le="0.1"} 2' in text
+        assert 'latency_seconds_bucket{provider="OSM",le="1.0"} 3' in text
+        assert 'latency_seconds_bucket{provider="OSM",le="+Inf"} 4' in text
+        assert 'latency_seconds_count{provider="OSM"} 4' in text
+        assert histogram.sum(provider="OSM") == pytest.approx(3.65)
+
+
+class TestProviderHealth:
+    """Test the rolling health score of a tile provider."""
+
+    def test_healthy_by_default(self):
+        assert ProviderHealth().score == 1.0
+
+    def test_errors_lower_the_score(self):
+        health = ProviderHealth(window=10, latency_target_ms=500)
+        for ok in [True] * 5 + [False] * 5:
+            health.record(ok, 0.05)
+
+        assert health.score == 0.5
+
+    def test_slow_provider_loses_health(self):
+        health = ProviderHealth(window=10, latency_target_ms=500)
+        for _ in range(10):
+            health.record(True, 2.0)
+
+        assert health.score == 0.25
+
+    def test_window_forgets_old_downloads(self):
+        health = ProviderHealth(window=4)
+        for ok in [False] * 4 + [True] * 4:
+            health.record(ok, 0.01)
+
+        assert health.score == 1.0
+
+
+class TestFetcherProviderStats:
+    """Test the per-provider stats recorded by the fetcher."""
+
+    def test_status_latency_and_report(self):
+        stats = ProviderStats(latency_target_ms=1000)
+        report = RenderReport()
+
+        async def scenario(server):
+            fetcher = TileFetcher(sources=server.sources(), providers=stats)
+            try:
+                with recording(report):
+                    return await asyncio.gather(*(fetcher.get_tile((col, 7), "OSM") for col in range(40)))
+            finally:
+                await fetcher.close()
+
+        with MockTileServer(latency_ms=10, error_rate=0.25, seed=1) as server:
+            asyncio.run(scenario(server))
+            errors = server.errors
+
+        osm = report.to_dict()["providers"]["OSM"]
+        assert osm["requests"] == 40
+        assert osm["status"].get("503", 0) == errors > 0
+        assert osm["status"]["200"] == 40 - errors
+        assert osm["decodes"] == 40 - errors
+        assert osm["bytes"] > 0
+        assert osm["fetch_max_s"] >= 0.01
+        assert stats.summary()["OSM"]["error_rate"] == pytest.approx(errors / 40, abs=0.001)
+        assert osm["health"] == stats.health("OSM").score < 1.0
+        assert 'tile_responses_total{provider="OSM",status="503"}' in report.to_prometheus()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,196 @@
+import os
+import time
+import pytest
+import gpxpy.gpx
+from result_cache import LocalDirectoryStore, ResultCache, render_key, track_fingerprint
+
+
+def make_gpx(points, name=None):
+    """Build a single-segment GPX from (lat, lon) pairs."""
+    gpx = gpxpy.gpx.GPX()
+    track = gpxpy.gpx.GPXTrack(name=name)
+    segment = gpxpy.gpx.GPXTrackSegment()
+    for lat, lon in points:
+        segment.points.append(gpxpy.gpx.GPXTrackPoint(lat, lon))
+    track.segments.append(segment)
+    gpx.tracks.append(track)
+    return gpx
+
+
+class TestRenderKey:
+    """Test content-addressed keys for rendered atlases."""
+
+    POINTS = [(45.0, 5.0), (45.001, 5.002), (45.002, 5.004)]
+    SETTINGS = {"tile_source": "IGN", "line_color": "#b700ff"}
+
+    def test_same_track_same_key(self):
+        """Metadata that is not rendered does not change the key."""
+        key_a = render_key(make_gpx(self.POINTS, name="a"), self.SETTINGS)
+        key_b = render_key(make_gpx(self.POINTS, name="b"), self.SETTINGS)
+        assert key_a == key_b
+
+    def test_settings_change_key(self):
+        gpx = make_gpx(self.POINTS)
+        other = dict(self.SETTINGS, line_color="#ff0000")
+        assert render_key(gpx, self.SETTINGS) != render_key(gpx, other)
+
+    def test_points_change_fingerprint(self):
+        moved = self.POINTS[:-1] + [(45.003, 5.004)]
+        assert track_fingerprint(make_gpx(self.POINTS)) != track_fingerprint(make_gpx(moved))
+
+
+class TestResultCache:
+    """Test the LRU result cache over a local directory."""
+
+    def test_miss_then_hit(self, tmp_path):
+        cache = ResultCache(LocalDirectoryStore(str(tmp_path)), max_bytes=1024)
+
+        assert cache.get("abc") is None
+        cache.put("abc", b"%PDF-data")
+
+        assert cache.get("abc") == b"%PDF-data"
+        assert (cache.hits, cache.misses) == (1, 1)
+
+    def test_evicts_least_recently_used(self, tmp_path):
+        store = LocalDirectoryStore(str(tmp_path))
+        cache = ResultCache(store, max_bytes=25)
+
+        cache.put("old", b"x" * 10)
+        cache.put("used", b"y" * 10)
+        # Make "old" the least recently used entry, then read "used"
+        os.utime(os.path.join(str(tmp_path), "old.bin"), (1, 1))
+        assert cache.get("used") is not None
+
+        cache.put("new", b"z" * 10)
+
+        assert cache.get("old") is None
+        assert cache.get("used") == b"y" * 10
+        assert cache.get("new") == b"z" * 10
+
+    def test_open_streams_the_entry(self, tmp_path):
+        cache = ResultCache(LocalDirectoryStore(str(tmp_path)), max_bytes=1024)
+        source = tmp_path / "spool"
+        source.write_bytes(b"%PDF-data")
+        cache.put_file("abc", str(source))
+
+        assert cache.open("missing") is None
+        with cache.open("abc") as f:
+            # Evicted while read: the open file still reads the whole entry
+            cache.put("other", b"x" * 1020)
+            assert f.read() == b"%PDF-data"
+        assert (cache.hits, cache.misses) == (1, 1)
+        assert cache.get("abc") is None
+
+    def test_put_file_links_instead_of_copying(self, tmp_path):
+        cache = ResultCache(LocalDirectoryStore(str(tmp_path)), max_bytes=1024)
+        spool = tmp_path / "render.spool"
+        spool.write_bytes(b"%PDF-data")
+
+        cache.put_file("abc", str(spool))
+
+        assert (tmp_path / "abc.bin").stat().st_ino == spool.stat().st_ino
+        spool.unlink()
+        assert cache.get("abc") == b"%PDF-data"
+
+    def test_put_file_copies_across_filesystems(self, tmp_path, monkeypatch):
+        def cross_device(source, target):
+            raise OSError(18, "Invalid cross-device link")
+        monkeypatch.setattr(os, "link", cross_device)
+        cache = ResultCache(LocalDirectoryStore(str(tmp_path / "cache")), max_bytes=1024)
+        spool = tmp_path / "render.spool"
+        spool.write_bytes(b"%PDF-data")
+
+        cache.put_file("abc", str(spool))
+
+        assert cache.get("abc") == b"%PDF-data"
+        assert [name for name in os.listdir(tmp_path / "cache")] == ["abc.bin"]
+
+    def test_entry_larger_than_cache_is_skipped(self, tmp_path):
+        cache = ResultCache(LocalDirectoryStore(str(tmp_path)), max_bytes=4)
+        cache.put("big", b"too large")
+        assert cache.get("big") is None
+
+
+class ListedStore(LocalDirectoryStore):
+    """LocalDirectoryStore counting how many times it is listed."""
+
+    listings = 0
+
+    def entries(self):
+        self.listings += 1
+        return super().entries()
+
+
+class TestIndexLoading:
+    """Test that reads never wait for the store to be listed."""
+
+    def test_reads_do_not_list_the_store(self, tmp_path):
+        LocalDirectoryStore(str(tmp_path)).put("abc", b"%PDF-data")
+        store = ListedStore(str(tmp_path))
+        cache = ResultCache(store, max_bytes=1024)
+
+        assert cache.get("abc") == b"%PDF-data"
+        assert cache.get("missing") is None
+        assert store.listings == 0
+
+        cache.put("def", b"%PDF-other")
+        assert store.listings == 1
+        assert len(cache) == 2
+
+    def test_reads_before_listing_keep_the_order(self, tmp_path):
+        first = LocalDirectoryStore(str(tmp_path))
+        first.put("old", b"x" * 10)
+        first.put("used", b"y" * 10)
+        os.utime(os.path.join(str(tmp_path), "old.bin"), (1, 1))
+        os.utime(os.path.join(str(tmp_path), "used.bin"), (2, 2))
+        cache = ResultCache(LocalDirectoryStore(str(tmp_path)), max_bytes=25)
+
+        # Read before the index exists: "old" becomes the most recently used
+        assert cache.get("old") is not None
+        cache.put("new", b"z" * 10)
+
+        assert cache.get("used") is None
+        assert cache.get("old") == b"x" * 10
+
+    def test_preload_lists_in_the_background(self, tmp_path):
+        LocalDirectoryStore(str(tmp_path)).put("abc", b"%PDF-data")
+        store = ListedStore(str(tmp_path))
+        cache = ResultCache(store, max_bytes=1024)
+
+        cache.preload().join()
+        cache.put("def", b"%PDF-other")
+
+        assert store.listings == 1
+        assert cache.total_bytes == len(b"%PDF-data") + len(b"%PDF-other")
+
+    def test_write_waits_for_the_preload(self, tmp_path):
+        class SlowStore(ListedStore):
+            def entries(self):
+                time.sleep(0.1)
+                return super().entries()
+
+        LocalDirectoryStore(str(tmp_path)).put("abc", b"%PDF-data")
+        store = SlowStore(str(tmp_path))
+        cache = ResultCache(store, max_bytes=1024)
+
+        cache.preload()
+        cache.put("def", b"%PDF-other")
+
+        assert store.listings == 1
+        assert cache.total_bytes == len(b"%PDF-data") + len(b"%PDF-other")
+
+    def test_peek_keeps_the_access_time(self, tmp_path):
+        store = LocalDirectoryStore(str(tmp_path))
+        store.put("abc", b"%PDF-data")
+        path = os.path.join(str(tmp_path), "abc.bin")
+        os.utime(path, (1, 1))
+
+        assert store.peek("abc") == b"%PDF-data"
+        assert os.stat(path).st_mtime == 1
+        assert store.peek("missing") is None
+        store.get("abc")
+        assert os.stat(path).st_mtime > 1
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
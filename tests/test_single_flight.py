@@ -0,0 +1,176 @@
+import asyncio
+import pytest
+from single_flight import SingleFlight, SingleFlightStream
+from result_cache import LocalDirectoryStore, ResultCache
+from tile_fetcher import TileFetcher, tile_cache_key
+
+
+class TestSingleFlight:
+    """Test deduplication of identical in-flight calls."""
+
+    def test_concurrent_calls_share_one_execution(self):
+        calls = []
+
+        async def work(value):
+            calls.append(value)
+            await asyncio.sleep(0.01)
+            return value * 2
+
+        async def scenario():
+            flight = SingleFlight()
+            results = await asyncio.gather(*[flight.do("key", work, 21) for _ in range(5)])
+            return flight, results
+
+        flight, results = asyncio.run(scenario())
+
+        assert results == [42] * 5
+        assert len(calls) == 1
+        assert (flight.started, flight.shared) == (1, 4)
+        assert flight.in_flight() == 0
+
+    def test_different_keys_run_separately(self):
+        async def work(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        async def scenario():
+            flight = SingleFlight()
+            return await asyncio.gather(flight.do("a", work, 1), flight.do("b", work, 2))
+
+        assert asyncio.run(scenario()) == [1, 2]
+
+    def test_exception_is_shared_then_forgotten(self):
+        attempts = []
+
+        async def failing():
+            attempts.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def scenario():
+            flight = SingleFlight()
+            results = await asyncio.gather(
+                flight.do("key", failing), flight.do("key", failing), return_exceptions=True
+            )
+            # The key is retried once the failed call is over
+            retry = await asyncio.gather(flight.do("key", failing), return_exceptions=True)
+            return results + retry
+
+        results = asyncio.run(scenario())
+
+        assert all(isinstance(result, ValueError) for result in results)
+        assert len(attempts) == 2
+
+    def test_cancelled_caller_does_not_cancel_others(self):
+        async def work():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def scenario():
+            flight = SingleFlight()
+            first = asyncio.ensure_future(flight.do("key", work))
+            second = asyncio.ensure_future(flight.do("key", work))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        assert asyncio.run(scenario()) == "done"
+
+
+class TestSingleFlightStream:
+    """Test sharing one async generator between concurrent readers."""
+
+    def test_readers_share_one_producer(self, tmp_path):
+        produced = []
+        completed = []
+
+        async def chunks():
+            for part in (b"%PDF", b"-page1", b"-page2"):
+                produced.append(part)
+                await asyncio.sleep(0.01)
+                yield part
+
+        async def read(iterator):
+            return b"".join([chunk async for chunk in iterator])
+
+        async def scenario():
+            flight = SingleFlightStream(spool_dir=str(tmp_path))
+            first = flight.stream("key", chunks, on_complete=lambda path: completed.append(open(path, "rb").read()))
+            await asyncio.sleep(0.015)
+            # Joins after the first chunk was produced and replays it
+            second = flight.stream("key", chunks)
+            results = await asyncio.gather(read(first), read(second))
+            return flight, results
+
+        flight, results = asyncio.run(scenario())
+
+        assert results == [b"%PDF-page1-page2"] * 2
+        assert len(produced) == 3
+        assert completed == [b"%PDF-page1-page2"]
+        assert (flight.started, flight.shared) == (1, 1)
+        assert list(tmp_path.iterdir()) == []
+
+    def test_producer_error_reaches_readers(self, tmp_path):
+        async def failing():
+            yield b"partial"
+            raise ValueError("boom")
+
+        async def scenario():
+            flight = SingleFlightStream(spool_dir=str(tmp_path))
+            return [chunk async for chunk in flight.stream("key", failing)]
+
+        with pytest.raises(RuntimeError):
+            asyncio.run(scenario())
+
+
+class TestTileFetcherDeduplication:
+    """Test that concurrent requests for one tile download it once."""
+
+    def test_same_tile_downloaded_once(self):
+        downloads = []
+
+        class CountingFetcher(TileFetcher):
+            async def _download(self, session, key):
+                downloads.append(key)
+                await asyncio.sleep(0.01)
+                return None
+
+        async def scenario():
+            fetcher = CountingFetcher()
+            # numpy-style float coordinates and int coordinates are the same tile
+            await asyncio.gather(
+                fetcher.fetch_tile_bytes((10.0, 20.0), "osm"),
+                fetcher.fetch_tile_bytes((10, 20), "OSM"),
+                fetcher.fetch_tile_bytes((11, 20), "OSM"),
+            )
+            await fetcher.close()
+
+        asyncio.run(scenario())
+
+        assert sorted(downloads) == [("OSM", 15, 10, 20), ("OSM", 15, 11, 20)]
+
+    def test_cached_tile_not_downloaded_again(self, tmp_path):
+        downloads = []
+
+        class CountingFetcher(TileFetcher):
+            async def _download(self, session, key):
+                downloads.append(key)
+                data = b"tile %d %d" % (key.col, key.row)
+                self.cache.put(tile_cache_key(key), data)
+                return data
+
+        async def scenario(fetcher):
+            data = await fetcher.fetch_tile_bytes((10, 20), "OSM")
+            await fetcher.close()
+            return data
+
+        # A new fetcher over the same directory, as after a restart
+        for _ in range(2):
+            fetcher = CountingFetcher(cache=ResultCache(LocalDirectoryStore(str(tmp_path))))
+            assert asyncio.run(scenario(fetcher)) == b"tile 10 20"
+
+        assert downloads == [("OSM", 15, 10, 20)]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
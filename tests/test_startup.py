@@ -0,0 +1,31 @@
+import pytest
+from benchmarks.startup import DEFAULT_BUDGET_MS, forbidden_imports, measure_imports, run_benchmark
+
+# Test machines are busier than a fresh container: the budget of the benchmark, with room for the noise
+BUDGET_MARGIN = 2
+
+
+@pytest.fixture(scope='module')
+def utils_imports():
+    """Modules imported by a fresh `import utils`."""
+    return measure_imports("utils")
+
+
+class TestStartup:
+    """Test that the backend import path stays slim."""
+
+    def test_no_frontend_modules(self, utils_imports):
+        assert forbidden_imports(utils_imports) == []
+
+    def test_optional_modules_are_lazy(self, utils_imports):
+        """pyproj, aiohttp and tqdm are only imported when a render needs them."""
+        lazy = ["pyproj", "aiohttp", "tqdm", "requests", "gpxpy"]
+        assert forbidden_imports(utils_imports, forbidden=lazy) == []
+
+    def test_import_within_budget(self):
+        report = run_benchmark("utils", budget_ms=DEFAULT_BUDGET_MS * BUDGET_MARGIN, runs=3)
+        assert report["best_ms"] <= report["budget_ms"], report["slowest_self_ms"]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
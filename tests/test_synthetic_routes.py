@@ -0,0 +1,86 @@
+import time
+import numpy as np
+import pytest
+import gpxpy
+from synthetic_routes import (
+    SHAPES, generate_route, route_length_km, route_to_gpx, write_gpx, write_standard_routes,
+)
+from utils import layout_atlas
+
+
+def distance_m(lats, lons, i, j):
+    return 111320 * np.hypot(lats[i] - lats[j], (lons[i] - lons[j]) * np.cos(np.radians(lats[i])))
+
+
+class TestSyntheticRoutes:
+    """Test the generated routes have the requested length, density and shape."""
+
+    @pytest.mark.parametrize("shape", SHAPES)
+    def test_length_and_density(self, shape):
+        lats, lons = generate_route(shape, length_km=40, points_per_km=50)
+
+        assert len(lats) == len(lons) == 2000
+        assert route_length_km(lats, lons) == pytest.approx(40, rel=0.05)
+
+    def test_deterministic(self):
+        first = generate_route("city", 10, seed=4)
+        second = generate_route("city", 10, seed=4)
+        other = generate_route("city", 10, seed=5)
+
+        assert np.array_equal(first[0], second[0])
+        assert not np.array_equal(first[0], other[0])
+
+    def test_directions(self):
+        lats, lons = generate_route("east_west", 50)
+        assert np.ptp(lons) * np.cos(np.radians(lats[0])) > 10 * np.ptp(lats)
+
+        lats, lons = generate_route("north_south", 50)
+        assert np.ptp(lats) > 10 * np.ptp(lons) * np.cos(np.radians(lats[0]))
+        assert lats[-1] < lats[0]
+
+    def test_out_and_back_and_loop_return_to_start(self):
+        for shape in ("out_and_back", "loop"):
+            lats, lons = generate_route(shape, 30, laps=2)
+            assert distance_m(lats, lons, 0, -1) < 50
+
+    def test_city_stays_in_area(self):
+        lats, lons = generate_route("city", 60, area_km=2)
+
+        assert np.ptp(lats) * 111320 <= 2001
+        assert np.ptp(lons) * 111320 * np.cos(np.radians(lats[0])) <= 2001
+
+    def test_revisits_produce_fewer_pages(self):
+        straight = layout_atlas(route_to_gpx(*generate_route("east_west", 60)), 'OSM')[0]
+        back = layout_atlas(route_to_gpx(*generate_route("out_and_back", 120)), 'OSM')[0]
+
+        assert len(back) <= len(straight) + 1
+
+    def test_gpx_file_round_trip(self, tmp_path):
+        lats, lons = generate_route("loop", 5)
+        write_gpx(tmp_path / "loop.gpx", lats, lons)
+
+        with open(tmp_path / "loop.gpx") as f:
+            gpx = gpxpy.parse(f)
+        points = gpx.tracks[0].segments[0].points
+        assert len(points) == len(lats)
+        assert points[10].latitude == pytest.approx(lats[10], abs=1e-7)
+
+    def test_standard_routes(self, tmp_path):
+        paths = write_standard_routes(str(tmp_path), scale=0.05, points_per_km=20)
+
+        assert len(paths) == 5
+
+    def test_layout_scales_to_large_routes(self):
+        """10x the largest bundled file (~230k points)."""
+        gpx = route_to_gpx(*generate_route("east_west", 2300, points_per_km=100))
+
+        start = time.time()
+        pages, _ = layout_atlas(gpx, 'OSM')
+        elapsed = time.time() - start
+
+        assert len(pages) > 100
+        assert elapsed < 10, f"Layout of 230k points took {elapsed:.1f}s"
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
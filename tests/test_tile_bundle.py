@@ -0,0 +1,132 @@
+import asyncio
+import json
+import zipfile
+from pathlib import Path
+import pytest
+import gpxpy
+import utils
+from conftest import FakeFetcher, position_tile
+from instrumentation import RenderReport
+from result_cache import DeduplicatingStore, LocalDirectoryStore, ResultCache
+from tile_bundle import bbox_tiles, bundle_fetcher, create_bundle, import_bundle, read_manifest, route_tiles
+
+GPX_DIR = Path(__file__).parent.parent / 'gpx_files'
+
+
+def tile_but_origin(key):
+    """Generated tiles, (0, 0) missing."""
+    return None if (key.col, key.row) == (0, 0) else position_tile(key)
+
+
+def bundle(path, tiles, tile_source="OSM"):
+    fetcher = FakeFetcher(tile_but_origin)
+
+    async def scenario():
+        try:
+            return await create_bundle(str(path), tiles, tile_source, fetcher, description="test")
+        finally:
+            await fetcher.close()
+
+    return asyncio.run(scenario()), fetcher
+
+
+@pytest.fixture
+def mini_map():
+    with open(GPX_DIR / '[Standard]mini_map.gpx', 'r') as f:
+        return gpxpy.parse(f)
+
+
+class TestTileBundle:
+    """Test offline region bundles."""
+
+    def test_bundle_holds_every_tile_of_the_atlas(self, tmp_path, mini_map):
+        tiles = route_tiles(mini_map, "OSM")
+        manifest, fetcher = bundle(tmp_path / "route.zip", tiles)
+
+        assert len(tiles) == 9 * 14
+        assert manifest["tiles"] == len(tiles) and manifest["missing"] == []
+        assert (manifest["tile_source"], manifest["zoom"]) == ("OSM", 15)
+        assert read_manifest(tmp_path / "route.zip") == manifest
+        with zipfile.ZipFile(tmp_path / "route.zip") as archive:
+            assert len(archive.namelist()) == len(tiles) + 1
+
+    def test_missing_tiles_listed_in_manifest(self, tmp_path):
+        manifest, _ = bundle(tmp_path / "area.zip", {(0, 0), (0, 1)})
+
+        assert manifest["tiles"] == 1
+        assert manifest["missing"] == [[0, 0]]
+
+    def test_render_runs_from_the_bundle_only(self, tmp_path, mini_map, monkeypatch):
+        bundle(tmp_path / "route.zip", route_tiles(mini_map, "OSM"))
+        fetcher = bundle_fetcher(str(tmp_path / "route.zip"))
+        monkeypatch.setattr(utils, 'get_default_fetcher', lambda: fetcher)
+        monkeypatch.setattr(utils, 'get_base_page_cache', lambda: None)
+        report = RenderReport()
+
+        async def scenario():
+            pdf = await utils.main(mini_map, 'OSM', report=report)
+            await fetcher.close()
+            return pdf
+
+        assert asyncio.run(scenario())
+        tiles = report.to_dict()["tiles"]
+        assert tiles["cached"] == tiles["requested"] == 9 * 14
+        assert tiles["fetched"] == tiles["failed"] == 0
+
+    def test_tile_missing_from_bundle_is_not_downloaded(self, tmp_path):
+        bundle(tmp_path / "area.zip", {(5, 5)})
+        fetcher = bundle_fetcher(str(tmp_path / "area.zip"))
+
+        async def scenario():
+            data = await fetcher.fetch_tile_bytes((6, 6), "OSM"), await fetcher.fetch_tile_bytes((5, 5), "OSM")
+            await fetcher.close()
+            return data
+
+        missing, present = asyncio.run(scenario())
+        assert missing is None
+        assert present is not None
+
+    def test_import_into_tile_cache(self, tmp_path):
+        bundle(tmp_path / "area.zip", {(5, 5), (5, 6)})
+        cache = ResultCache(DeduplicatingStore(LocalDirectoryStore(str(tmp_path / "cache"))))
+
+        assert import_bundle(str(tmp_path / "area.zip"), cache) == 2
+
+        fetcher = FakeFetcher(cache=cache)
+
+        async def scenario():
+            data = await fetcher.fetch_tile_bytes((5, 6), "OSM")
+            await fetcher.close()
+            return data
+
+        assert asyncio.run(scenario()) == cache.get("OSM_15_5_6")
+        assert fetcher.downloads == []
+
+    def test_unsupported_version_rejected(self, tmp_path):
+        with zipfile.ZipFile(tmp_path / "old.zip", "w") as archive:
+            archive.writestr("manifest.json", json.dumps({"version": 0}))
+
+        with pytest.raises(ValueError):
+            read_manifest(tmp_path / "old.zip")
+
+
+class TestBboxTiles:
+    """Test the tiles covering an area."""
+
+    def test_area_covered_with_a_page_of_margin(self):
+        tiles = bbox_tiles(45.75, 4.85, 45.76, 4.86, "OSM")
+        inner = bbox_tiles(45.75, 4.85, 45.76, 4.86, "OSM", margin=(0, 0))
+        cols = {col for col, _ in inner}
+        rows = {row for _, row in inner}
+
+        assert inner <= tiles
+        assert len(tiles) == (len(cols) + 2 * utils.NUMBER_COLUMNS) * (len(rows) + 2 * utils.NUMBER_ROWS)
+        assert utils.get_tile_number_from_coord(45.755, 4.855, "OSM")[:2] in inner
+
+    def test_inverted_bounds_rejected(self):
+        with pytest.raises(ValueError):
+            bbox_tiles(45.76, 4.85, 45.75, 4.86, "OSM")
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
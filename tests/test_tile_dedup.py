@@ -0,0 +1,134 @@
+import asyncio
+import os
+import pytest
+from conftest import FakeFetcher, solid_png
+from instrumentation import RenderReport, recording
+from result_cache import DeduplicatingStore, LocalDirectoryStore, ResultCache
+
+
+SEA = solid_png((170, 211, 223))
+LAND = solid_png((242, 239, 233))
+
+
+class TestDeduplicatingStore:
+    """Test storing identical payloads once."""
+
+    def test_identical_payloads_stored_once(self, tmp_path):
+        store = DeduplicatingStore(LocalDirectoryStore(str(tmp_path)))
+        for col in range(5):
+            store.put(f"OSM_15_{col}_0", SEA)
+        store.put("OSM_15_9_9", LAND)
+
+        assert store.get("OSM_15_3_0") == SEA
+        assert store.get("OSM_15_9_9") == LAND
+        stats = store.stats()
+        assert (stats["keys"], stats["payloads"]) == (6, 2)
+        assert stats["stored_bytes"] == len(SEA) + len(LAND)
+        assert stats["dedup_ratio"] == round((5 * len(SEA) + len(LAND)) / (len(SEA) + len(LAND)), 3)
+        # Two payloads on disk besides the six small keys
+        assert len(list(tmp_path.glob("blob_*"))) == 2
+
+    def test_payload_deleted_with_its_last_key(self, tmp_path):
+        store = DeduplicatingStore(LocalDirectoryStore(str(tmp_path)))
+        store.put("a", SEA)
+        store.put("b", SEA)
+
+        store.delete("a")
+        assert store.get("b") == SEA
+        store.delete("b")
+
+        assert store.get("b") is None
+        assert list(tmp_path.glob("blob_*")) == []
+
+    def test_overwritten_key_releases_its_old_payload(self, tmp_path):
+        store = DeduplicatingStore(LocalDirectoryStore(str(tmp_path)))
+        store.put("a", SEA)
+        store.put("a", LAND)
+
+        assert store.get("a") == LAND
+        assert store.stats()["payloads"] == 1
+
+    def test_reference_counts_rebuilt_after_restart(self, tmp_path):
+        first = DeduplicatingStore(LocalDirectoryStore(str(tmp_path)))
+        first.put("a", SEA)
+        first.put("b", SEA)
+
+        store = DeduplicatingStore(LocalDirectoryStore(str(tmp_path)))
+        assert sorted((key, size) for key, size, _ in store.entries()) == [("a", len(SEA)), ("b", len(SEA))]
+        store.delete("a")
+        assert store.get("b") == SEA
+
+    def test_rebuilding_reference_counts_keeps_access_times(self, tmp_path):
+        first = DeduplicatingStore(LocalDirectoryStore(str(tmp_path)))
+        first.put("a", SEA)
+        first.put("b", LAND)
+        os.utime(tmp_path / "a.bin", (100, 100))
+        os.utime(tmp_path / "b.bin", (200, 200))
+
+        store = DeduplicatingStore(LocalDirectoryStore(str(tmp_path)))
+        cache = ResultCache(store, max_bytes=len(SEA) + 2 * len(LAND))
+
+        assert sorted((key, access_time) for key, _, access_time in store.entries()) == [("a", 100), ("b", 200)]
+        assert (os.stat(tmp_path / "a.bin").st_mtime, os.stat(tmp_path / "b.bin").st_mtime) == (100, 200)
+        # Least recently used first, as before the restart
+        cache.put("c", LAND)
+        cache.put("d", SEA)
+        assert cache.get("a") is None
+        assert cache.get("b") == LAND
+
+    def test_lru_cache_on_top_evicts_keys_and_payloads(self, tmp_path):
+        store = DeduplicatingStore(LocalDirectoryStore(str(tmp_path)))
+        cache = ResultCache(store, max_bytes=2 * len(SEA) + len(LAND))
+        cache.put("a", SEA)
+        cache.put("b", SEA)
+        cache.put("c", LAND)
+        cache.put("d", LAND)
+
+        assert cache.get("a") is None
+        assert cache.get("d") == LAND
+        assert store.stats()["payloads"] == 2
+
+    def test_raw_payload_of_an_older_cache_is_a_miss(self, tmp_path):
+        LocalDirectoryStore(str(tmp_path)).put("OSM_15_1_2", SEA)
+        store = DeduplicatingStore(LocalDirectoryStore(str(tmp_path)))
+
+        assert store.get("OSM_15_1_2") is None
+        store.put("OSM_15_1_2", SEA)
+        assert store.get("OSM_15_1_2") == SEA
+
+
+class TestSharedDecoding:
+    """Test identical tiles decoded once and shared by reference."""
+
+    def render(self, fetcher, tiles):
+        async def scenario():
+            with recording(RenderReport()) as report:
+                images = await asyncio.gather(*(fetcher.get_tile(tile, "OSM") for tile in tiles))
+            await fetcher.close()
+            return [image for _, image in images], report
+        return asyncio.run(scenario())
+
+    def test_identical_tiles_share_one_image(self):
+        coast = FakeFetcher(lambda key: SEA if key.col < 8 else LAND)
+        images, report = self.render(coast, [(col, 0) for col in range(10)])
+
+        assert all(image is images[0] for image in images[:8])
+        assert images[8] is images[9] and images[8] is not images[0]
+        assert report.decodes == {"decoded": 2, "shared": 8}
+        assert report.to_dict()["decode_dedup_ratio"] == 5.0
+
+    def test_sharing_can_be_disabled(self):
+        images, report = self.render(FakeFetcher(lambda key: SEA, decoded_cache_size=0), [(0, 0), (1, 0)])
+
+        assert images[0] is not images[1]
+        assert report.decodes == {"decoded": 2, "shared": 0}
+
+    def test_fetcher_reports_cache_dedup(self, tmp_path):
+        fetcher = FakeFetcher(lambda key: SEA, cache=ResultCache(DeduplicatingStore(LocalDirectoryStore(str(tmp_path)))))
+        self.render(fetcher, [(col, 0) for col in range(4)])
+
+        assert fetcher.cache_stats()["dedup_ratio"] == 4.0
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,116 @@
+import asyncio
+import io
+import threading
+import pytest
+from PIL import Image
+from conftest import FakeFetcher, solid_png
+from instrumentation import RenderReport, recording
+from result_cache import LocalDirectoryStore, ResultCache
+from tile_fetcher import TileKey, child_tile_keys, downsample_tiles, tile_cache_key
+
+
+COLORS = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 255)]
+
+
+def fetch(fetcher, col_row, zoom):
+    async def scenario():
+        with recording(RenderReport()) as report:
+            data = await fetcher.fetch_tile_bytes(col_row, "OSM", zoom)
+        await fetcher.close()
+        return data, report
+    return asyncio.run(scenario())
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResultCache(LocalDirectoryStore(str(tmp_path)))
+
+
+def put_children(cache, key):
+    for child, color in zip(child_tile_keys(key), COLORS):
+        cache.put(tile_cache_key(child), solid_png(color))
+
+
+class TestTilePyramid:
+    """Test building missing tiles from cached tiles of the next zoom levels."""
+
+    def test_children_cover_the_parent(self):
+        children = child_tile_keys(TileKey("OSM", 14, 100, 200))
+
+        assert children == [
+            ("OSM", 15, 200, 400), ("OSM", 15, 201, 400),
+            ("OSM", 15, 200, 401), ("OSM", 15, 201, 401),
+        ]
+
+    def test_downsample_places_children_in_quadrants(self):
+        tile = downsample_tiles([Image.new("RGB", (256, 256), color) for color in COLORS])
+
+        assert tile.size == (256, 256)
+        assert tile.getpixel((64, 64)) == COLORS[0]
+        assert tile.getpixel((192, 64)) == COLORS[1]
+        assert tile.getpixel((64, 192)) == COLORS[2]
+        assert tile.getpixel((192, 192)) == COLORS[3]
+
+    def test_cache_is_read_off_the_event_loop(self, tmp_path):
+        class ThreadStore(LocalDirectoryStore):
+            threads = set()
+
+            def get(self, key):
+                self.threads.add(threading.get_ident())
+                return super().get(key)
+
+        store = ThreadStore(str(tmp_path))
+        cache = ResultCache(store)
+        put_children(cache, TileKey("OSM", 14, 100, 200))
+
+        data, _ = fetch(FakeFetcher(cache=cache), (100, 200), 14)
+
+        assert data is not None
+        assert store.threads and threading.get_ident() not in store.threads
+
+    def test_parent_built_from_cached_children(self, cache):
+        put_children(cache, TileKey("OSM", 14, 100, 200))
+        fetcher = FakeFetcher(cache=cache)
+
+        data, report = fetch(fetcher, (100, 200), 14)
+
+        assert fetcher.downloads == []
+        assert report.tiles["derived"] == 1
+        assert Image.open(io.BytesIO(data)).getpixel((192, 192)) == COLORS[3]
+        # Kept in the cache, the next request is a plain hit
+        assert cache.get(tile_cache_key(TileKey("OSM", 14, 100, 200))) == data
+        assert fetch(fetcher, (100, 200), 14)[1].tiles["cached"] == 1
+
+    def test_parent_built_two_levels_down(self, cache):
+        for child in child_tile_keys(TileKey("OSM", 13, 50, 100)):
+            put_children(cache, child)
+        fetcher = FakeFetcher(cache=cache)
+
+        data, report = fetch(fetcher, (50, 100), 13)
+
+        assert fetcher.downloads == []
+        assert report.tiles["derived"] == 1
+        assert Image.open(io.BytesIO(data)).getpixel((32, 32)) == COLORS[0]
+
+    def test_missing_child_falls_back_to_download(self, cache):
+        key = TileKey("OSM", 14, 100, 200)
+        put_children(cache, key)
+        cache.store.delete(tile_cache_key(child_tile_keys(key)[2]))
+        fetcher = FakeFetcher(cache=cache)
+
+        _, report = fetch(fetcher, (100, 200), 14)
+
+        assert fetcher.downloads == [key]
+        assert (report.tiles["derived"], report.tiles["fetched"]) == (0, 1)
+
+    def test_pyramid_can_be_disabled(self, cache):
+        put_children(cache, TileKey("OSM", 14, 100, 200))
+        fetcher = FakeFetcher(cache=cache, pyramid_levels=0)
+
+        fetch(fetcher, (100, 200), 14)
+
+        assert fetcher.downloads == [TileKey("OSM", 14, 100, 200)]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
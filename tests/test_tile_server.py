@@ -0,0 +1,102 @@
+import asyncio
+import time
+from pathlib import Path
+import pytest
+from tile_fetcher import TileFetcher
+from benchmarks.tile_server import MockTileServer
+from benchmarks.pipeline import compare_to_baseline, run_benchmark
+
+GPX_DIR = Path(__file__).parent.parent / 'gpx_files'
+
+
+def fetch(server, tiles, source="OSM"):
+    async def scenario():
+        fetcher = TileFetcher(sources=server.sources(), cache=None)
+        try:
+            return await asyncio.gather(*(fetcher.fetch_tile_bytes(tile, source) for tile in tiles))
+        finally:
+            await fetcher.close()
+    return asyncio.run(scenario())
+
+
+class TestMockTileServer:
+    """Test the local tile server used by the offline benchmarks."""
+
+    def test_tiles_are_deterministic(self):
+        with MockTileServer() as server:
+            first = fetch(server, [(10, 20), (11, 20)])
+            second = fetch(server, [(10, 20), (11, 20)])
+
+        assert first == second
+        assert first[0] != first[1]
+        assert first[0].startswith(b"\x89PNG")
+
+    def test_ign_tiles_are_jpeg(self):
+        with MockTileServer() as server:
+            data, = fetch(server, [(10, 20)], source="IGN")
+
+        assert data.startswith(b"\xff\xd8")
+
+    def test_error_rate_fails_the_same_tiles(self):
+        tiles = [(col, 0) for col in range(40)]
+        with MockTileServer(error_rate=0.5, seed=3) as server:
+            first = fetch(server, tiles)
+            second = fetch(server, tiles)
+
+        failed = [tile for tile, data in zip(tiles, first) if data is None]
+        assert 5 < len(failed) < 35
+        assert [data is None for data in first] == [data is None for data in second]
+        assert server.errors == 2 * len(failed)
+
+    def test_latency(self):
+        with MockTileServer(latency_ms=100) as server:
+            start = time.perf_counter()
+            fetch(server, [(1, 1)])
+            elapsed = time.perf_counter() - start
+
+        assert elapsed >= 0.1
+
+
+class TestPipelineBenchmark:
+    """Test the offline pipeline benchmark and its baseline comparison."""
+
+    def test_renders_offline(self):
+        report = run_benchmark([str(GPX_DIR / '[Standard]mini_map.gpx')], runs=1, latency_ms=0, jitter_ms=0)
+        result = report['routes']['[Standard]mini_map.gpx']
+
+        assert result['pages'] == 1
+        assert result['tiles_requested'] == 126
+        assert result['tiles_failed'] == 0
+        assert 'fetch' in result['stages_s']
+
+    def test_corridor_compared_to_full_pages(self):
+        report = run_benchmark([str(GPX_DIR / '[Standard]mini_map.gpx')], runs=1, latency_ms=0, jitter_ms=0,
+                               corridor=1)
+        result = report['routes']['[Standard]mini_map.gpx']
+
+        assert result['tiles_requested'] == 126
+        assert result['corridor']['tiles_requested'] < 126
+        assert result['corridor']['tiles_saved'] > 0
+        assert result['corridor']['speedup'] > 0
+
+    def test_regressions(self):
+        settings = {"tile_source": "OSM", "server": {"latency_ms": 20}}
+        baseline = dict(settings, routes={"a.gpx": {"best_s": 10.0, "pages": 5, "tiles_requested": 600}})
+
+        same = dict(settings, routes={"a.gpx": {"best_s": 11.0, "pages": 5, "tiles_requested": 600}})
+        slower = dict(settings, routes={"a.gpx": {"best_s": 13.0, "pages": 5, "tiles_requested": 600}})
+        more_tiles = dict(settings, routes={"a.gpx": {"best_s": 9.0, "pages": 5, "tiles_requested": 700}})
+
+        assert compare_to_baseline(same, baseline, threshold=0.2) == []
+        assert len(compare_to_baseline(slower, baseline, threshold=0.2)) == 1
+        assert len(compare_to_baseline(more_tiles, baseline, threshold=0.2)) == 1
+
+    def test_different_settings_not_compared(self):
+        baseline = {"tile_source": "OSM", "server": {"latency_ms": 20}, "routes": {}}
+        report = {"tile_source": "OSM", "server": {"latency_ms": 50}, "routes": {}}
+
+        assert len(compare_to_baseline(report, baseline)) == 1
+
+
+if __name__ == '__main__':
+    pytest.main([__file__, '-v'])
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+"""
+Offline region bundles: the tiles of a route or an area in one archive file.
+
+A bundle is a zip archive holding every tile needed to render a GPX file
+(the tiles of every page from get_filled_pages) or an area, downloaded
+once. Renders can then run from the bundle alone, without any network,
+or the bundle can be imported into the shared tile cache.
+
+Usage:
+    python tile_bundle.py create route.gpx --output lyon.zip [--tile-source OSM]
+    python tile_bundle.py create --bbox 45.70,4.80,45.80,4.90 --output lyon.zip
+    python tile_bundle.py import lyon.zip
+    python tile_bundle.py info lyon.zip
+
+Render from a bundle by setting TILE_BUNDLE=lyon.zip, or with
+`python batch_render.py route.gpx --bundle lyon.zip`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+from result_cache import CacheStore, ResultCache
+from tile_fetcher import TILE_SOURCES, TileFetcher, get_default_fetcher, tile_cache_key
+
+# Bump when the archive layout changes
+BUNDLE_FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+TILES_DIR = "tiles/"
+# Tiles downloaded at the same time while creating a bundle
+BUNDLE_FETCH_CONCURRENCY = int(os.getenv("BUNDLE_FETCH_CONCURRENCY", "32"))
+
+
+def route_tiles(gpx, tile_source):
+    """Set of (col, row) tiles of every page of the atlas of a parsed GPX file."""
+    from utils import layout_atlas
+
+    pages, _ = layout_atlas(gpx, tile_source)
+    return {(int(col), int(row)) for page in pages for column in page for col, row in column}
+
+
+def bbox_tiles(south, west, north, east, tile_source, margin=None):
+    """
+    Set of (col, row) tiles covering an area.
+
+    Args:
+        south, west, north, east: Bounds in degrees
+        margin: (columns, rows) added around the area, one page by default,
+            so the pages of any route inside the area are fully covered
+    """
+    import numpy as np
+    from utils import NUMBER_COLUMNS, NUMBER_ROWS, vectorized_get_tile_number_from_coord
+
+    if south > north or west > east:
+        raise ValueError("Expected south <= north and west <= east")
+    margin_cols, margin_rows = margin if margin is not None else (NUMBER_COLUMNS, NUMBER_ROWS)
+    cols, rows, _, _ = vectorized_get_tile_number_from_coord(
+        np.array([north, south], dtype=float), np.array([west, east], dtype=float), tile_source
+    )
+    col_min, col_max = int(min(cols)) - margin_cols, int(max(cols)) + margin_cols
+    row_min, row_max = int(min(rows)) - margin_rows, int(max(rows)) + margin_rows
+    return {(col, row) for col in range(col_min, col_max + 1) for row in range(row_min, row_max + 1)}
+
+
+async def create_bundle(path, tiles, tile_source, fetcher=None, concurrency=BUNDLE_FETCH_CONCURRENCY,
+                        description=None):
+    """
+    Download tiles once and write them to a bundle.
+
+    Tiles already in the tile cache of the fetcher are not downloaded
+    again. The archive is written to a temporary file first, so an
+    interrupted run never leaves a partial bundle behind.
+
+    Args:
+        path: Archive to write
+        tiles: (col, row) tiles, see route_tiles and bbox_tiles
+        tile_source: "IGN", "OSM" or "TOPO"
+        fetcher: TileFetcher, the shared one by default
+        concurrency: Tiles downloaded at the same time
+        description: Free text kept in the manifest, e.g. the GPX file name
+
+    Returns:
+        dict: The manifest of the bundle.
+    """
+    fetcher = fetcher if fetcher is not None else get_default_fetcher()
+    source = tile_source.upper()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(col_row):
+        async with semaphore:
+            try:
+                return col_row, await fetcher.fetch_tile_bytes(col_row, source)
+            except Exception as e:
+                print(f"Error fetching tile {col_row}: {e}")
+                return col_row, None
+
+    results = await asyncio.gather(*(fetch(col_row) for col_row in sorted(tiles)))
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    os.close(fd)
+    missing = []
+    try:
+        # Tiles are already compressed images, stored as is
+        with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_STORED) as archive:
+            for col_row, data in results:
+                if data is None:
+                    missing.append(list(col_row))
+                    continue
+                archive.writestr(TILES_DIR + tile_cache_key(fetcher.tile_key(col_row, source)), data)
+            manifest = {
+                "version": BUNDLE_FORMAT_VERSION,
+                "tile_source": source,
+                "zoom": fetcher.tile_key((0, 0), source).zoom,
+                "tiles": len(results) - len(missing),
+                "missing": missing,
+                "description": description,
+                "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            }
+            archive.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2))
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    return manifest
+
+
+def read_manifest(path):
+    with zipfile.ZipFile(path) as archive:
+        manifest = json.loads(archive.read(MANIFEST_NAME))
+    if manifest.get("version") != BUNDLE_FORMAT_VERSION:
+        raise ValueError(f"Unsupported bundle version {manifest.get('version')} in {path}")
+    return manifest
+
+
+class BundleStore(CacheStore):
+    """
+    Read-only CacheStore over the tiles of a bundle.
+
+    Writes are ignored, so tiles built locally (e.g. from the tile pyramid)
+    are simply rebuilt on the next render.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.manifest = read_manifest(path)
+        self._archive = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _open(self):
+        # Forked workers must not share the file offset of their parent
+        if self._archive is None or self._pid != os.getpid():
+            self._archive = zipfile.ZipFile(self.path)
+            self._pid = os.getpid()
+        return self._archive
+
+    def get(self, key):
+        with self._lock:
+            try:
+                return self._open().read(TILES_DIR + key)
+            except KeyError:
+                return None
+
+    def put(self, key, data):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def entries(self):
+        with self._lock:
+            infos = self._open().infolist()
+        return [
+            (info.filename[len(TILES_DIR):], info.file_size, time.mktime(info.date_time + (0, 0, -1)))
+            for info in infos
+            if info.filename.startswith(TILES_DIR)
+        ]
+
+
+def bundle_fetcher(path, sources=TILE_SOURCES):
+    """TileFetcher reading every tile from a bundle, never from the network."""
+    store = BundleStore(path)
+    # Never evicts: the bundle is read-only
+    cache = ResultCache(store, max_bytes=sys.maxsize)
+    return TileFetcher(sources=sources, cache=cache, offline=True)
+
+
+def import_bundle(path, cache=None):
+    """
+    Copy the tiles of a bundle into a tile cache, the shared one by default.
+
+    Returns:
+        int: Number of tiles imported.
+    """
+    cache = cache if cache is not None else get_default_fetcher().cache
+    if cache is None:
+        raise ValueError("No tile cache to import into")
+    read_manifest(path)
+    count = 0
+    with zipfile.ZipFile(path) as archive:
+        for name in archive.namelist():
+            if name.startswith(TILES_DIR):
+                cache.put(name[len(TILES_DIR):], archive.read(name))
+                count += 1
+    return count
+
+
+def parse_bbox(text):
+    """"south,west,north,east" in degrees."""
+    try:
+        south, west, north, east = (float(value) for value in text.split(","))
+    except ValueError:
+        raise argparse.ArgumentTypeError("Expected south,west,north,east")
+    return south, west, north, east
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    create = commands.add_parser("create", help="Download the tiles of a route or an area into a bundle")
+    create.add_argument("gpx", nargs="?", help="GPX file whose atlas pages are bundled")
+    create.add_argument("--bbox", type=parse_bbox, help="Area to bundle instead: south,west,north,east")
+    create.add_argument("--output", required=True)
+    create.add_argument("--tile-source", default="IGN", choices=["IGN", "OSM", "TOPO"], type=str.upper)
+
+    import_command = commands.add_parser("import", help="Copy the tiles of a bundle into the tile cache")
+    import_command.add_argument("bundle")
+
+    info = commands.add_parser("info", help="Print the manifest of a bundle")
+    info.add_argument("bundle")
+    args = parser.parse_args()
+
+    if args.command == "create":
+        if (args.gpx is None) == (args.bbox is None):
+            parser.error("create needs either a GPX file or --bbox")
+        if args.gpx is not None:
+            from utils import parse_gpx
+
+            with open(args.gpx, "rb") as f:
+                tiles = route_tiles(parse_gpx(f.read()), args.tile_source)
+            description = os.path.basename(args.gpx)
+        else:
+            tiles = bbox_tiles(*args.bbox, args.tile_source)
+            description = "bbox " + ",".join(f"{value:g}" for value in args.bbox)
+
+        async def run():
+            fetcher = get_default_fetcher()
+            try:
+                return await create_bundle(args.output, tiles, args.tile_source, fetcher, description=description)
+            finally:
+                await fetcher.close()
+
+        print(f"Bundling {len(tiles)} {args.tile_source} tiles into {args.output}")
+        manifest = asyncio.run(run())
+        print(f"{manifest['tiles']} tiles bundled, {len(manifest['missing'])} missing")
+        sys.exit(1 if manifest["missing"] else 0)
+
+    elif args.command == "import":
+        print(f"{import_bundle(args.bundle)} tiles imported")
+
+    else:
+        manifest = read_manifest(args.bundle)
+        manifest["missing"] = len(manifest["missing"])
+        print(json.dumps(manifest, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,389 @@
+import asyncio
+import hashlib
+import io
+import os
+import time
+from collections import OrderedDict, namedtuple
+
+from PIL import Image, ImageDraw
+
+from result_cache import DeduplicatingStore, LocalDirectoryStore, ResultCache
+from single_flight import SingleFlight
+from metrics import REGISTRY
+from instrumentation import count_bytes_downloaded, count_decode, count_tile
+from provider_health import PROVIDERS
+
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", "./cache/tiles")
+TILE_CACHE_MAX_MB = float(os.getenv("TILE_CACHE_MAX_MB", "4096"))
+# Bundle (see tile_bundle.py) the default fetcher reads every tile from, without any network
+TILE_BUNDLE = os.getenv("TILE_BUNDLE")
+# Zoom levels a missing tile can be rebuilt from cached higher-zoom tiles, 0 disables it
+TILE_PYRAMID_LEVELS = int(os.getenv("TILE_PYRAMID_LEVELS", "2"))
+# Decoded tiles kept by content hash, identical tiles are decoded once (a page has 126 tiles)
+TILE_DECODED_CACHE_SIZE = int(os.getenv("TILE_DECODED_CACHE_SIZE", "128"))
+
+cache_bytes = REGISTRY.gauge("tile_cache_bytes", "Tile cache size: logical counts every key, stored each payload once")
+cache_dedup_ratio = REGISTRY.gauge("tile_cache_dedup_ratio", "Logical over stored bytes of the tile cache")
+
+# Tile URL templates, filled with the zoom, tile column and row.
+# "zoom" is the level the atlas is rendered at, "format" the encoding of the tiles.
+TILE_SOURCES = {
+    "IGN": {
+        "url": "https://data.geopf.fr/private/wmts?apikey=ign_scan_ws&SERVICE=WMTS&REQUEST=GetTile&VERSION=1.0.0&LAYER=GEOGRAPHICALGRIDSYSTEMS.MAPS&STYLE=normal&TILEMATRIXSET=PM&TILEMATRIX={zoom}&TILEROW={row}&TILECOL={col}&FORMAT=image%2Fjpeg",
+        "headers": {},
+        "zoom": 16,
+        "format": "JPEG",
+        # Zoom levels below "zoom" of the corridor fill, see utils.corridor_fill_levels
+        "fill_levels": 1,
+    },
+    "OSM": {
+        "url": "https://a.tile.openstreetmap.org/{zoom}/{col}/{row}.png",
+        # OSM requires a User-Agent
+        "headers": {
+            "User-Agent": "GPX Map Generator/1.0",
+            "Accept": "image/png,image/*;q=0.9",
+        },
+        "zoom": 15,
+        "format": "PNG",
+        "fill_levels": 2,
+    },
+    "TOPO": {
+        "url": "https://a.tile.opentopomap.org/{zoom}/{col}/{row}.png",
+        # Same headers as a browser, OpenTopoMap rejects the others
+        "headers": {
+            "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:137.0) Gecko/20100101 Firefox/137.0",
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Language": "en-US,en;q=0.5",
+            "Accept-Encoding": "gzip, deflate, br, zstd",
+            "Connection": "keep-alive",
+            "Upgrade-Insecure-Requests": "1",
+            "Sec-Fetch-Dest": "document",
+            "Sec-Fetch-Mode": "navigate",
+            "Sec-Fetch-Site": "cross-site",
+        },
+        "zoom": 15,
+        "format": "PNG",
+        "fill_levels": 2,
+    },
+}
+
+TileKey = namedtuple("TileKey", ["source", "zoom", "col", "row"])
+
+
+def placeholder_tile(col_row, label="Tile", color=(0, 0, 0)):
+    """Grey tile with its coordinates, used when a tile cannot be fetched or decoded."""
+    image = Image.new("RGB", (256, 256), (240, 240, 240))
+    draw = ImageDraw.Draw(image)
+    draw.text((10, 120), f"{label}: {col_row[0]},{col_row[1]}", fill=color)
+    draw.rectangle((0, 0, 255, 255), outline=color, width=1)
+    # Lets callers tell it from a real tile, e.g. to avoid caching pages built on it
+    image.info["placeholder"] = True
+    return image
+
+
+def tile_key(col_row, tile_source, zoom=None):
+    """
+    Normalized TileKey, col/row may come in as numpy floats.
+
+    Args:
+        zoom: Zoom level, the zoom of the source in TILE_SOURCES by default
+    """
+    source = tile_source.upper()
+    if zoom is None:
+        zoom = TILE_SOURCES[source]["zoom"]
+    return TileKey(source, int(zoom), int(col_row[0]), int(col_row[1]))
+
+
+def tile_cache_key(key):
+    """File-name safe cache key of a TileKey."""
+    return "{}_{}_{}_{}".format(*key)
+
+
+def child_tile_keys(key):
+    """The four tiles covering `key` at the next zoom level: top-left, top-right, bottom-left, bottom-right."""
+    return [
+        TileKey(key.source, key.zoom + 1, 2 * key.col + dx, 2 * key.row + dy)
+        for dy in (0, 1)
+        for dx in (0, 1)
+    ]
+
+
+def downsample_tiles(children):
+    """
+    Build a tile from its four children, see child_tile_keys.
+
+    The children are pasted as a 2×2 mosaic which is then halved, each
+    pixel being the average of 2×2 child pixels.
+
+    Returns:
+        PIL.Image.Image: RGB tile of the size of a child.
+    """
+    size = children[0].width
+    mosaic = Image.new("RGB", (2 * size, 2 * size))
+    for index, child in enumerate(children):
+        mosaic.paste(child.convert("RGB"), ((index % 2) * size, (index // 2) * size))
+    return mosaic.reduce(2)
+
+
+class TileFetcher:
+    """
+    Download map tiles over a shared HTTP session.
+
+    Concurrent requests for the same tile, from one render or from several
+    renders running in the same process, trigger a single download.
+    Downloaded tiles are kept in `cache`, so retries and later renders of
+    the same area do not hit the network again.
+
+    The cache works as a pyramid: a missing tile whose four children at
+    the next zoom are cached (or can be built from theirs, up to
+    `pyramid_levels` zooms below) is built locally by downsampling them,
+    e.g. a zoom 14 tile over an area already rendered at zoom 15.
+
+    Cache reads and writes, and the pyramid builds, run in threads: a
+    page asks for a hundred tiles at once, the event loop does not wait
+    for the disk.
+
+    Identical tiles (sea, empty fields, blank tiles out of coverage) are
+    decoded once: the last `decoded_cache_size` decoded tiles are kept by
+    content hash and the same image is returned for the same payload.
+    Callers must not modify the tiles they get.
+
+    Latency, status codes, bytes and decode time of every download are
+    recorded per provider in `providers`, which keeps a rolling health
+    score of each of them.
+
+    Args:
+        sources: Mapping of tile source name to {"url", "headers"}
+        cache: Optional ResultCache of encoded tiles
+        providers: ProviderStats recording the downloads, the process-wide one by default
+        pyramid_levels: Zoom levels below a missing tile searched to build it, 0 disables it
+        decoded_cache_size: Decoded tiles kept by content hash, 0 disables the sharing
+        offline: Never download, tiles missing from the cache are failed tiles
+    """
+
+    def __init__(self, sources=TILE_SOURCES, cache=None, providers=PROVIDERS, pyramid_levels=TILE_PYRAMID_LEVELS,
+                 decoded_cache_size=TILE_DECODED_CACHE_SIZE, offline=False):
+        self.sources = sources
+        self.cache = cache
+        self.providers = providers
+        self.pyramid_levels = pyramid_levels
+        self.decoded_cache_size = decoded_cache_size
+        self.offline = offline
+        self._decoded = OrderedDict()
+        self._session = None
+        self._session_loop = None
+        self._flight = SingleFlight()
+        self._flight_loop = None
+
+    def _get_session(self):
+        loop = asyncio.get_running_loop()
+        # Sessions are bound to the loop that created them
+        if self._session is None or self._session_loop is not loop or self._session.closed:
+            # Imported on first use, keeps it out of the import-time path
+            import aiohttp
+
+            self._session = aiohttp.ClientSession()
+            self._session_loop = loop
+        return self._session
+
+    def _get_flight(self):
+        loop = asyncio.get_running_loop()
+        # In-flight tasks are bound to the loop that created them
+        if self._flight_loop is not loop:
+            self._flight = SingleFlight()
+            self._flight_loop = loop
+        return self._flight
+
+    def tile_key(self, col_row, tile_source, zoom=None):
+        """TileKey of a tile of these sources, at the zoom of the source by default."""
+        if zoom is None:
+            zoom = self.sources[tile_source.upper()]["zoom"]
+        return tile_key(col_row, tile_source, zoom)
+
+    async def fetch_tile_bytes(self, col_row, tile_source, zoom=None):
+        """
+        Download the encoded tile.
+
+        Args:
+            zoom: Zoom level, the zoom of the source by default
+
+        Returns:
+            bytes or None if the server did not return the tile.
+        """
+        key = self.tile_key(col_row, tile_source, zoom)
+        count_tile("requested")
+        try:
+            # The cache is looked up within the shared call: a tile is in the
+            # cache as soon as the call that downloaded it is over
+            image_data, outcome = await self._get_flight().do(key, self._fetch, key)
+        except Exception:
+            count_tile("failed")
+            raise
+        count_tile(outcome)
+        return image_data
+
+    async def _fetch(self, key):
+        """(bytes or None, how it was got: "cached", "derived", "fetched" or "failed")"""
+        if self.cache is not None:
+            image_data = await asyncio.to_thread(self.cache.get, tile_cache_key(key))
+            if image_data is not None:
+                return image_data, "cached"
+            image_data = await asyncio.to_thread(self._build_from_children, key, self.pyramid_levels)
+            if image_data is not None:
+                return image_data, "derived"
+        if self.offline:
+            return None, "failed"
+        image_data = await self._download(self._get_session(), key)
+        return image_data, "fetched" if image_data is not None else "failed"
+
+    def _build_from_children(self, key, levels):
+        """
+        Build a tile from cached tiles of the next `levels` zooms, and cache it.
+
+        Returns:
+            bytes of the encoded tile, or None if a child is missing.
+        """
+        if levels <= 0:
+            return None
+        children = []
+        for child in child_tile_keys(key):
+            data = self.cache.get(tile_cache_key(child))
+            if data is None:
+                data = self._build_from_children(child, levels - 1)
+            if data is None:
+                return None
+            children.append(data)
+
+        try:
+            images = [Image.open(io.BytesIO(data)) for data in children]
+            tile = downsample_tiles(images)
+        except Exception as e:
+            print(f"Error building tile {key} from its children: {e}")
+            return None
+        image_format = self.sources[key.source].get("format", "PNG")
+        buffer = io.BytesIO()
+        if image_format == "JPEG":
+            tile.save(buffer, image_format, quality=90)
+        else:
+            tile.save(buffer, image_format)
+        image_data = buffer.getvalue()
+        self.cache.put(tile_cache_key(key), image_data)
+        return image_data
+
+    def provider_health(self, tile_source):
+        """Rolling health score of a tile source, 1.0 healthy down to 0.0, see TilePrefetcher."""
+        return self.providers.health(tile_source.upper()).score
+
+    async def _download(self, session, key):
+        source, zoom, col, row = key
+        config = self.sources[source]
+        url = config["url"].format(zoom=zoom, col=col, row=row)
+        start = time.perf_counter()
+        try:
+            async with session.get(url, headers=config["headers"]) as response:
+                if response.status != 200:
+                    self.providers.record_response(source, response.status, time.perf_counter() - start)
+                    return None
+                image_data = await response.read()
+        except Exception:
+            self.providers.record_response(source, "error", time.perf_counter() - start)
+            raise
+        self.providers.record_response(source, 200, time.perf_counter() - start, len(image_data))
+        count_bytes_downloaded(len(image_data))
+        # Failed tiles are not cached, they are retried on the next render
+        if self.cache is not None:
+            await asyncio.to_thread(self._cache_tile, key, image_data)
+        return image_data
+
+    def _cache_tile(self, key, image_data):
+        self.cache.put(tile_cache_key(key), image_data)
+        self._record_cache_size()
+
+    def cache_stats(self):
+        """Deduplication stats of the tile cache (see DeduplicatingStore.stats), None if it does not deduplicate."""
+        store = getattr(self.cache, "store", None)
+        return store.stats() if isinstance(store, DeduplicatingStore) else None
+
+    def _record_cache_size(self):
+        stats = self.cache_stats()
+        if stats is not None:
+            cache_bytes.set(stats["logical_bytes"], kind="logical")
+            cache_bytes.set(stats["stored_bytes"], kind="stored")
+            cache_dedup_ratio.set(stats["dedup_ratio"])
+
+    def _decode(self, image_data, tile_source):
+        """Decoded tile, shared with the earlier tiles of the same content."""
+        digest = hashlib.sha256(image_data).digest()
+        image = self._decoded.get(digest)
+        if image is not None:
+            self._decoded.move_to_end(digest)
+            count_decode("shared")
+            return image
+
+        start = time.perf_counter()
+        image = Image.open(io.BytesIO(image_data))
+        # Decoded here rather than lazily while stitching, to time it
+        image.load()
+        self.providers.record_decode(tile_source.upper(), time.perf_counter() - start)
+        count_decode("decoded")
+        if self.decoded_cache_size > 0:
+            self._decoded[digest] = image
+            while len(self._decoded) > self.decoded_cache_size:
+                self._decoded.popitem(last=False)
+        return image
+
+    async def get_tile(self, col_row, tile_source, zoom=None):
+        """
+        Fetch and decode one tile.
+
+        Args:
+            zoom: Zoom level, the zoom of the source by default
+
+        Returns:
+            (col_row, PIL.Image.Image), a placeholder image if the tile is missing.
+            The image may be shared with other tiles of the same content.
+        """
+        image_data = await self.fetch_tile_bytes(col_row, tile_source, zoom)
+        if image_data is None:
+            count_tile("placeholder")
+            return col_row, placeholder_tile(col_row)
+        try:
+            return col_row, self._decode(image_data, tile_source)
+        except Exception as e:
+            # Fallback if image can't be opened
+            print(f"Error opening tile at {col_row}: {e}")
+            count_tile("placeholder")
+            return col_row, placeholder_tile(col_row, label="Error", color=(255, 0, 0))
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+_default_fetcher = None
+
+
+def get_default_fetcher():
+    """Return the process-wide TileFetcher shared by concurrent renders."""
+    global _default_fetcher
+    if _default_fetcher is None:
+        if TILE_BUNDLE:
+            # Imported here, tile_bundle imports this module
+            from tile_bundle import bundle_fetcher
+
+            _default_fetcher = bundle_fetcher(TILE_BUNDLE)
+        else:
+            cache = ResultCache(
+                DeduplicatingStore(LocalDirectoryStore(TILE_CACHE_DIR)), max_bytes=int(TILE_CACHE_MAX_MB * 1024 * 1024)
+            )
+            # Every key of the tile cache is read to count the references to its payloads, off the request path
+            cache.preload()
+            _default_fetcher = TileFetcher(cache=cache)
+    return _default_fetcher
+
+
+def set_default_fetcher(fetcher):
+    """Replace the process-wide TileFetcher, e.g. with one pointing at a local tile server. None resets it."""
+    global _default_fetcher
+    _default_fetcher = fetcher
@@ -1,25 +1,37 @@
 import base64
+import bisect
+import contextvars
+import functools
+import hashlib
 import io
+import json
 import math
-from pyproj import Transformer
-import requests
-import gpxpy
-import gpxpy.gpx
 import os
-import datetime
+import struct
+import threading
+import time
 from PIL import Image, ImageDraw, ImageFont
-from tqdm import tqdm
-import copy
-from dotenv import load_dotenv
 import asyncio
-import aiohttp
-from stqdm import stqdm
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-import pandas as pd
 from page_generation import get_filled_pages
-
-load_dotenv()
+from tile_fetcher import TILE_SOURCES, get_default_fetcher
+from result_cache import LocalDirectoryStore, ResultCache
+from instrumentation import RenderReport, count_tile, record_page, recording, stage
+from pdf_writer import ENCODE_WORKERS, JPEG_QUALITY, PDF_RESOLUTION, PdfStreamWriter, encode_page
+from page_compositor import PageCanvas
+
+# Keep this module cheap to import: the backend cold start goes through it.
+# pyproj (IGN only) and tqdm are imported where they are used, streamlit
+# and pandas are not needed here at all.
+
+# Try to load dotenv if available (for production), but don't fail if missing (for tests)
+try:
+    from dotenv import load_dotenv
+    load_dotenv()
+except ImportError:
+    pass
 
 # Get DEBUG flag from environment
 DEBUG_LOGGING = os.getenv("DEBUG_LOGGING", "false").lower() == "true"
@@ -50,7 +62,6 @@ def debug_print(message):
 # DONE : Give choice OSM or IGN
 # TODO : Give choice add legend page
 
-load_dotenv()
 NUMBER_ROWS = 14  # 14
 NUMBER_COLUMNS = 9  # 9
 IGN_KEY = os.getenv("IGN_KEY")
@@ -60,6 +71,154 @@ half_k_in_px = Distance_in_scale_in_m / resolution
 LINE_WIDTH = 8
 LINE_COLOR = "#B700FF"
 TILE_SOURCE = "IGN"  # Default to IGN, can be changed to "OSM"
+FONT_DIR = os.getenv("FONT_DIR", "/usr/share/fonts/truetype/freefont")
+# Bundled copies, used when the fonts are not installed system-wide
+BUNDLED_FONT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fonts")
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(name, size):
+    """Load a TrueType font once per (name, size) instead of on every page."""
+    path = os.path.join(FONT_DIR, name)
+    if not os.path.exists(path):
+        path = os.path.join(BUNDLED_FONT_DIR, name)
+    return ImageFont.truetype(path, size)
+
+
+# pyproj transformers must not be shared between threads, and parsing or layout may run in one
+_transformers = threading.local()
+
+
+def get_transformer(always_xy=False):
+    """EPSG:4326 -> EPSG:3857 transformer, built once per thread as it is slow to create."""
+    transformers = _transformers.__dict__
+    if always_xy not in transformers:
+        from pyproj import Transformer
+        transformers[always_xy] = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=always_xy)
+    return transformers[always_xy]
+
+
+# Download the tiles of a track while it is still parsed and laid out (see prefetch.py)
+PREFETCH_TILES = os.getenv("PREFETCH_TILES", "true").lower() == "true"
+
+# Page assembly: "canvas" composes each page in one preallocated image (see page_compositor.py),
+# "pil" stitches columns of tiles and draws the track on a separate image, as before
+PAGE_COMPOSITOR = os.getenv("PAGE_COMPOSITOR", "canvas")
+# Height of the band of the page number and scale, the only part of the page annotate_image draws on
+ANNOTATION_HEIGHT = 200
+
+# Add an overview page with the whole route and the outline of every page in front of the atlas (see overview.py)
+OVERVIEW_PAGE = os.getenv("OVERVIEW_PAGE", "false").lower() == "true"
+
+# Corridor mode: only the tiles within this many tiles of the track are fetched, unset fetches them all
+CORRIDOR_TILES = int(os.getenv("CORRIDOR_TILES")) if os.getenv("CORRIDOR_TILES") else None
+# Rest of the page in corridor mode: "lowzoom" upscales lower zoom tiles, "background" is a plain colour
+CORRIDOR_FILL = os.getenv("CORRIDOR_FILL", "lowzoom")
+# Zoom levels below the page of the "lowzoom" fill: 2 fetches one tile per 4x4 page tiles.
+# Unset uses the "fill_levels" of the tile source in TILE_SOURCES
+CORRIDOR_FILL_LEVELS = int(os.getenv("CORRIDOR_FILL_LEVELS")) if os.getenv("CORRIDOR_FILL_LEVELS") else None
+BACKGROUND_COLOR = (242, 239, 233)
+
+# Stitched base-map pages, reused when only the overlay (line colour...) changes
+BASE_PAGE_CACHE_DIR = os.getenv("BASE_PAGE_CACHE_DIR", "./cache/base_pages")
+# Bump when the stitching or the format of the cached pages changes so old bases are not reused
+BASE_PAGE_CACHE_VERSION = 2
+# Cached base pages are raw RGB rows behind this header (magic, width, height): no compression
+# to pay on a miss nor decoding on a hit, a 9x14 tiles page is about 25 MB
+BASE_PAGE_HEADER = struct.Struct("<4sII")
+BASE_PAGE_MAGIC = b"RGB8"
+BASE_PAGE_BYTES = BASE_PAGE_HEADER.size + NUMBER_COLUMNS * 256 * NUMBER_ROWS * 256 * 3
+# Pages the base page cache holds by default: the longest sample route (french-divide) has 322 at IGN.
+# Renders of more pages than the cache holds only read it, see base_page_cache_fits
+BASE_PAGE_CACHE_PAGES = 330
+BASE_PAGE_CACHE_MAX_MB = float(os.getenv("BASE_PAGE_CACHE_MAX_MB",
+                                         str(BASE_PAGE_CACHE_PAGES * BASE_PAGE_BYTES // (1024 * 1024))))
+
+_base_page_cache = None
+_encode_executor = None
+
+
+def get_base_page_cache():
+    """Return the process-wide cache of stitched base pages, None if disabled."""
+    global _base_page_cache
+    if BASE_PAGE_CACHE_MAX_MB <= 0:
+        return None
+    if _base_page_cache is None:
+        _base_page_cache = ResultCache(
+            LocalDirectoryStore(BASE_PAGE_CACHE_DIR), max_bytes=int(BASE_PAGE_CACHE_MAX_MB * 1024 * 1024)
+        )
+    return _base_page_cache
+
+
+def base_page_cache_fits(page_count):
+    """
+    True if the base pages of a render of page_count pages fit in the base page cache.
+
+    Pages are written in page order: those of a larger render are evicted
+    by its own later pages before they are read again, a re-render with
+    another line colour would get no hit and write them all again. Such
+    renders read the cache but do not write to it.
+    """
+    cache = get_base_page_cache()
+    return cache is not None and page_count * BASE_PAGE_BYTES <= cache.max_bytes
+
+
+def get_encode_executor():
+    """Return the process-wide thread pool pages are encoded in, None if ENCODE_WORKERS is 0."""
+    global _encode_executor
+    if ENCODE_WORKERS <= 0:
+        return None
+    # A pool inherited from a forked parent has no threads, workers make their own
+    if _encode_executor is None or _encode_executor[0] != os.getpid():
+        _encode_executor = (os.getpid(), ThreadPoolExecutor(ENCODE_WORKERS, thread_name_prefix="encode"))
+    return _encode_executor[1]
+
+
+def base_page_key(page, tile_source=TILE_SOURCE, corridor=None):
+    """
+    Cache key of a base page: tile source, top-left tile and page size in tiles.
+
+    Args:
+        corridor: Optional set of the tiles fetched at full resolution (see
+            corridor_tiles), the fill of the others is part of the key too
+    """
+    col, row = page[0][0]
+    key = "base_v{}_{}_{}_{}_{}x{}".format(
+        BASE_PAGE_CACHE_VERSION, tile_source.upper(), int(col), int(row), len(page), len(page[0])
+    )
+    if corridor is not None:
+        payload = json.dumps([CORRIDOR_FILL, corridor_fill_levels(tile_source), sorted(corridor)])
+        key += "_c" + hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+    return key
+
+
+def render_settings(tile_source=TILE_SOURCE, line_color=LINE_COLOR, corridor=None, overview=False):
+    """Every setting that changes the rendered atlas, used to key cached results."""
+    settings = {
+        "tile_source": tile_source.upper(),
+        "line_color": line_color.lower() if isinstance(line_color, str)
+        else [[start, color.lower()] for start, color in line_color],
+        "line_width": LINE_WIDTH,
+        "number_rows": NUMBER_ROWS,
+        "number_columns": NUMBER_COLUMNS,
+        "resolution": resolution,
+        "scale_in_m": Distance_in_scale_in_m,
+        "pdf_resolution": PDF_RESOLUTION,
+        "encoding": "jpeg",
+        "jpeg_quality": JPEG_QUALITY,
+    }
+    if corridor is not None:
+        settings["corridor"] = {"tiles": corridor, "fill": CORRIDOR_FILL, "fill_levels": corridor_fill_levels(tile_source)}
+    if overview:
+        settings["overview"] = True
+    return settings
+
+
+def corridor_fill_levels(tile_source=TILE_SOURCE):
+    """Zoom levels below the page of the "lowzoom" corridor fill of a tile source."""
+    if CORRIDOR_FILL_LEVELS is not None:
+        return CORRIDOR_FILL_LEVELS
+    return TILE_SOURCES.get(tile_source.upper(), {}).get("fill_levels", 2)
 
 def lat_long_to_osm_tile(lat, lon, zoom=15):
     """Convert latitude/longitude to OSM tile coordinates"""
@@ -91,86 +250,10 @@ def vectorized_lat_long_to_osm_tile(lats, longs, zoom=15):
 # Replace the TILE_SOURCE line with:
 TILE_SOURCE = "IGN"  # Default to IGN, can be changed to "OSM" or "TOPO"
 
-# In the get_image_with_request_from_col_row_fast function, modify or add the OpenTopoMap option:
+# Tile URLs per source live in tile_fetcher.TILE_SOURCES
 async def get_image_with_request_from_col_row_fast(col_row, tile_source=TILE_SOURCE):
-    async with aiohttp.ClientSession() as session:
-        if tile_source.upper() == "IGN":
-            # IGN tile URL
-            url = f"https://data.geopf.fr/private/wmts?apikey=ign_scan_ws&SERVICE=WMTS&REQUEST=GetTile&VERSION=1.0.0&LAYER=GEOGRAPHICALGRIDSYSTEMS.MAPS&STYLE=normal&TILEMATRIXSET=PM&TILEMATRIX=16&TILEROW={col_row[1]}&TILECOL={col_row[0]}&FORMAT=image%2Fjpeg"
-            
-            async with session.get(url) as response:
-                if response.status != 200:
-                    # If IGN request fails, create a blank tile
-                    image = Image.new("RGB", (256, 256), (240, 240, 240))
-                    draw = ImageDraw.Draw(image)
-                    draw.text((10, 120), f"Tile: {col_row[0]},{col_row[1]}", fill=(0, 0, 0))
-                    draw.rectangle((0, 0, 255, 255), outline=(0, 0, 0), width=1)
-                    return col_row, image
-                
-                image_data = await response.read()
-        
-        elif tile_source.upper() == "OSM":
-            # OSM tile URL
-            zoom_level = 15  # Same zoom level as IGN
-            url = f"https://a.tile.openstreetmap.org/{zoom_level}/{int(col_row[0])}/{int(col_row[1])}.png"
-            
-            # Create proper headers for OSM - they require a User-Agent
-            headers = {
-                "User-Agent": "GPX Map Generator/1.0",
-                "Accept": "image/png,image/*;q=0.9"
-            }
-            
-            async with session.get(url, headers=headers) as response:
-                if response.status != 200:
-                    # If the request fails, create a blank image with the tile coordinates
-                    image = Image.new("RGB", (256, 256), (240, 240, 240))
-                    draw = ImageDraw.Draw(image)
-                    draw.text((10, 120), f"Tile: {col_row[0]},{col_row[1]}", fill=(0, 0, 0))
-                    draw.rectangle((0, 0, 255, 255), outline=(0, 0, 0), width=1)
-                    return col_row, image
-                
-                image_data = await response.read()
-                
-        elif tile_source.upper() == "TOPO":
-            # OpenTopoMap tile URL
-            zoom_level = 15  # Using zoom level 15 as in the working example
-            url = f"https://a.tile.opentopomap.org/{zoom_level}/{int(col_row[0])}/{int(col_row[1])}.png"
-            # Create proper headers - using the exact headers from the working curl command
-            headers = {
-                "User-Agent": "Mozilla/5.0 (X11; Ubuntu; Linux x86_64; rv:137.0) Gecko/20100101 Firefox/137.0",
-                "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
-                "Accept-Language": "en-US,en;q=0.5",
-                "Accept-Encoding": "gzip, deflate, br, zstd",
-                "Connection": "keep-alive",
-                "Upgrade-Insecure-Requests": "1",
-                "Sec-Fetch-Dest": "document",
-                "Sec-Fetch-Mode": "navigate",
-                "Sec-Fetch-Site": "cross-site"
-            }
-            
-            async with session.get(url, headers=headers) as response:
-                if response.status != 200:
-                    # If the request fails, create a blank image with the tile coordinates
-                    image = Image.new("RGB", (256, 256), (240, 240, 240))
-                    draw = ImageDraw.Draw(image)
-                    draw.text((10, 120), f"Tile: {col_row[0]},{col_row[1]}", fill=(0, 0, 0))
-                    draw.rectangle((0, 0, 255, 255), outline=(0, 0, 0), width=1)
-                    return col_row, image 
-                
-                image_data = await response.read()
-
-    try:
-        # Process the image data if necessary and return the image
-        image = Image.open(io.BytesIO(image_data))
-        return col_row, image
-    except Exception as e:
-        # Fallback if image can't be opened
-        print(f"Error opening tile at {col_row}: {e}")
-        image = Image.new("RGB", (256, 256), (240, 240, 240))
-        draw = ImageDraw.Draw(image)
-        draw.text((10, 120), f"Error: {col_row[0]},{col_row[1]}", fill=(255, 0, 0))
-        draw.rectangle((0, 0, 255, 255), outline=(255, 0, 0), width=1)
-        return col_row, image
+    # Shared fetcher: concurrent renders needing the same tile download it once
+    return await get_default_fetcher().get_tile(col_row, tile_source)
 
 
 def get_tile_number_from_coord(lat, long, tile_source=TILE_SOURCE):
@@ -179,7 +262,7 @@ def get_tile_number_from_coord(lat, long, tile_source=TILE_SOURCE):
         return lat_long_to_osm_tile(lat, long)
     else:
         # Original IGN code
-        TRAN_4326_TO_3857 = Transformer.from_crs("EPSG:4326", "EPSG:3857")
+        TRAN_4326_TO_3857 = get_transformer()
         # ORiginal coordinates for our resolution
         # resolution = 0.5971642835#meters per px
         tile_size_in_meters = 256 * resolution
@@ -201,7 +284,7 @@ def vectorized_get_tile_number_from_coord(lats, longs, tile_source=TILE_SOURCE):
         return vectorized_lat_long_to_osm_tile(lats, longs)
     else:
         # Original IGN code
-        transformer = Transformer.from_crs("EPSG:4326", "EPSG:3857", always_xy=True)
+        transformer = get_transformer(always_xy=True)
         xs, ys = transformer.transform(longs, lats)
         tile_size_in_meters = 256 * resolution
         x0, y0 = -20037508, 20037508
@@ -225,8 +308,8 @@ def draw_navigation_marker(draw, direction, position, page_num):
         page_num: page number to display
     """
     marker_size = 60
-    font_small = ImageFont.truetype("/usr/share/fonts/truetype/freefont/FreeMono.ttf", 24)
-    font_bold = ImageFont.truetype("/usr/share/fonts/truetype/freefont/FreeMonoBold.ttf", 24)
+    font_small = load_font("FreeMono.ttf", 24)
+    font_bold = load_font("FreeMonoBold.ttf", 24)
 
     x, y = position
 
@@ -353,10 +436,8 @@ def annotate_image(image, number, position, rectangle_position):
     draw = ImageDraw.Draw(annotated_image)
 
     # Define the font style and size
-    font = ImageFont.truetype("/usr/share/fonts/truetype/freefont/FreeMono.ttf", 60)
-    font_bold = ImageFont.truetype(
-        "/usr/share/fonts/truetype/freefont/FreeMonoBold.ttf", 60
-    )
+    font = load_font("FreeMono.ttf", 60)
+    font_bold = load_font("FreeMonoBold.ttf", 60)
 
     # Write the number at the specified position
     draw.text(position, "N° : " + str(number), font=font_bold, fill=(255, 255, 255))
@@ -503,7 +584,6 @@ def draw_line(list_of_circles, original_image, line_color=LINE_COLOR):
     draw = ImageDraw.Draw(image)
     draw_mask = ImageDraw.Draw(mask)
     radius = 5
-    font = ImageFont.truetype("/usr/share/fonts/truetype/freefont/FreeMono.ttf", 24)
     i = 0
     list_of_circles = [x for x in list_of_circles if x is not None]
     for idx, (x, y) in enumerate(list_of_circles):
@@ -549,9 +629,6 @@ def get_pos_gpx_in_px_in_page(page, point):
         pass
 
 
-pages = []
-image_pages_for_export = []
-
 def displayPDF(file):
     # Opening file from file path
     file_size = os.path.getsize(file)  # Get file size in bytes
@@ -563,15 +640,18 @@ def displayPDF(file):
         base64_pdf = base64.b64encode(f.read()).decode("utf-8")
         return base64_pdf
 
-async def main(gpx, tile_source=TILE_SOURCE, line_color=LINE_COLOR):
-    # Get all the track points from the GPX file
-    track_points = gpx.get_points_data()
+def extract_track(gpx, tile_source=TILE_SOURCE):
+    """
+    Project every track point onto the tile grid.
 
-    tiles = []
-    gpx_in_px = []
-    gpx_points = {}
-    page = [[(0, 0)] * NUMBER_ROWS for _ in range(NUMBER_COLUMNS)]
+    Args:
+        gpx: gpxpy.gpx.GPX object
+        tile_source: "IGN", "OSM" or "TOPO"
 
+    Returns:
+        list_index_found: Unique (col, row) tiles in GPS chronological order
+        gpx_points: dict (col, row) -> list of (offset_x, offset_y, latitude, point_index)
+    """
     list_index_found = []
     seen_tiles = set()
     gpx_points = defaultdict(list)
@@ -579,12 +659,19 @@ async def main(gpx, tile_source=TILE_SOURCE, line_color=LINE_COLOR):
     point_index = 0
     for track in gpx.tracks:
         for segment in track.segments:
-            data = pd.DataFrame([(p.latitude, p.longitude) for p in segment.points], columns=['lat', 'long'])
+            lats = np.array([p.latitude for p in segment.points], dtype=float)
+            longs = np.array([p.longitude for p in segment.points], dtype=float)
 
             cols, rows, offset_xs, offset_ys = vectorized_get_tile_number_from_coord(
-                data['lat'].values, data['long'].values, tile_source
+                lats, longs, tile_source
             )
 
+            # Plain Python ints/floats: much faster than numpy scalars in the layout loops
+            cols = np.asarray(cols).astype(np.int64).tolist()
+            rows = np.asarray(rows).astype(np.int64).tolist()
+            offset_xs = np.asarray(offset_xs).tolist()
+            offset_ys = np.asarray(offset_ys).tolist()
+
             for i, (col, row, ox, oy) in enumerate(zip(cols, rows, offset_xs, offset_ys)):
                 point = segment.points[i]
                 # Add sequence number (point_index) to stored data
@@ -598,13 +685,649 @@ async def main(gpx, tile_source=TILE_SOURCE, line_color=LINE_COLOR):
                 point_index += 1
 
     # list_index_found is already a list in GPS chronological order
-    import sys
-    import json
     debug_print(f"[DEBUG] Total unique tiles: {len(list_index_found)}")
     debug_print(f"[DEBUG] Total points processed: {point_index}")
     debug_print(f"[DEBUG] First 12 tiles: {list_index_found[:12]}")
+    return list_index_found, gpx_points
+
+
+def get_page_track_in_px(page, gpx_points):
+    """Track points falling on the page, in pixels from its top-left corner, in GPS order."""
+    return [(x, y) for x, y, _ in _page_track_points(page, gpx_points)]
+
+
+def _page_track_points(page, gpx_points):
+    list_post = []
+    for key in gpx_points.keys():
+        tile_pos = get_pos_gpx_in_px_in_page(page, key)
+        if not tile_pos == None:
+            for point in gpx_points[key]:
+                # Include sequence index in collected points
+                list_post.append(
+                    (tile_pos[0] + point[0], tile_pos[1] + point[1], point[3])
+                )
+
+    # Sort points by sequence index before drawing
+    list_post.sort(key=lambda x: x[2])
+    return list_post
+
+
+def split_tracks(points, line_color=LINE_COLOR):
+    """
+    Split track points between the GPX files of a merged atlas.
+
+    Args:
+        points: (x, y, point index) track points, in GPS order
+        line_color: (first point index, colour) of each file, see merge_gpx
+
+    Returns:
+        list of (colour, [(x, y), ...]), one per file with points, in GPS order.
+    """
+    starts = [start for start, _ in line_color]
+    tracks = []
+    for x, y, index in points:
+        track = bisect.bisect_right(starts, index) - 1
+        if not tracks or tracks[-1][0] != track:
+            tracks.append((track, []))
+        tracks[-1][1].append((x, y))
+    return [(line_color[track][1], track_points) for track, track_points in tracks]
+
+
+def get_page_tracks_in_px(page, gpx_points, line_color=LINE_COLOR):
+    """
+    Track of the page, one line per GPX file of the atlas.
+
+    Args:
+        page: 2D array of (col, row) tuples from get_filled_pages
+        gpx_points: Track points per tile, as returned by extract_track
+        line_color: Colour of the track line, or the (first point index,
+            colour) of each file of a merged atlas (see merge_gpx)
+
+    Returns:
+        list of (colour, track points in px as get_page_track_in_px). The
+        files are never joined: the end of one and the start of the next
+        are different lines.
+    """
+    if isinstance(line_color, str):
+        return [(line_color, get_page_track_in_px(page, gpx_points))]
+    return split_tracks(_page_track_points(page, gpx_points), line_color)
+
+
+def corridor_tiles(page, list_post, radius):
+    """
+    Tiles of a page within `radius` tiles of the track drawn on it.
+
+    The line between consecutive points is followed, so a tile crossed
+    between two distant points counts as on the track.
+
+    Args:
+        page: 2D array of (col, row) tuples from get_filled_pages
+        list_post: Track points of the page in px, from get_page_track_in_px
+        radius: Distance in tiles, 0 keeps only the tiles under the track
+
+    Returns:
+        set of (col, row) tiles to fetch at full resolution.
+    """
+    columns, rows = len(page), len(page[0])
+    on_track = set()
+    for (x0, y0), (x1, y1) in zip(list_post, list_post[1:] + list_post[-1:]):
+        # Sampled every half tile along the segment
+        steps = max(1, int(max(abs(x1 - x0), abs(y1 - y0)) // 128))
+        for step in range(steps + 1):
+            x = x0 + (x1 - x0) * step / steps
+            y = y0 + (y1 - y0) * step / steps
+            on_track.add((int(x // 256), int(y // 256)))
+
+    near = set()
+    for column, row in on_track:
+        for i in range(max(0, column - radius), min(columns, column + radius + 1)):
+            for j in range(max(0, row - radius), min(rows, row + radius + 1)):
+                col, tile_row = page[i][j]
+                near.add((int(col), int(tile_row)))
+    return near
+
+
+def background_tile(placeholder=False):
+    """Plain light tile filling pages away from the track."""
+    image = Image.new("RGB", (256, 256), BACKGROUND_COLOR)
+    if placeholder:
+        image.info["placeholder"] = True
+    return image
+
+
+async def render_fill_tiles(tiles, tile_source=TILE_SOURCE):
+    """
+    Tiles of the page away from the track, without fetching them.
+
+    With the "lowzoom" fill, the tiles corridor_fill_levels zooms below
+    covering the tiles are fetched once, laid side by side and upscaled in
+    a single resize over the whole fill area, so the filled tiles join
+    without seams. With the "background" fill, tiles are a plain colour.
+
+    Returns:
+        dict of (col, row) -> PIL.Image.Image
+    """
+    for _ in tiles:
+        count_tile("skipped")
+    if CORRIDOR_FILL != "lowzoom":
+        background = background_tile()
+        return {col_row: background for col_row in tiles}
+
+    fetcher = get_default_fetcher()
+    levels = corridor_fill_levels(tile_source)
+    scale = 2 ** levels
+    zoom = fetcher.tile_key((0, 0), tile_source).zoom - levels
+    parents = sorted({(col // scale, row // scale) for col, row in tiles})
+    for _ in parents:
+        count_tile("fill")
+    parent_images = dict(await asyncio.gather(*(fetcher.get_tile(parent, tile_source, zoom) for parent in parents)))
+
+    parent_col, parent_row = min(col for col, _ in parents), min(row for _, row in parents)
+    columns = max(col for col, _ in parents) - parent_col + 1
+    rows = max(row for _, row in parents) - parent_row + 1
+    mosaic = Image.new("RGB", (columns * 256, rows * 256), BACKGROUND_COLOR)
+    for (col, row), image in parent_images.items():
+        if not image.info.get("placeholder"):
+            mosaic.paste(image.convert("RGB"), ((col - parent_col) * 256, (row - parent_row) * 256))
+
+    # The fill area in mosaic pixels, resized with the pixels around it
+    col_min, col_max = min(col for col, _ in tiles), max(col for col, _ in tiles)
+    row_min, row_max = min(row for _, row in tiles), max(row for _, row in tiles)
+    size = 256 / scale
+    box = (
+        (col_min - parent_col * scale) * size,
+        (row_min - parent_row * scale) * size,
+        (col_max + 1 - parent_col * scale) * size,
+        (row_max + 1 - parent_row * scale) * size,
+    )
+    upscaled = mosaic.resize(((col_max - col_min + 1) * 256, (row_max - row_min + 1) * 256), Image.BILINEAR, box=box)
+
+    filled = {}
+    for col, row in tiles:
+        if parent_images[(col // scale, row // scale)].info.get("placeholder"):
+            # Not cached with the page, the fill is retried on the next render
+            filled[(col, row)] = background_tile(placeholder=True)
+            continue
+        x, y = (col - col_min) * 256, (row - row_min) * 256
+        filled[(col, row)] = upscaled.crop((x, y, x + 256, y + 256))
+    return filled
+
+
+def encode_base_page(image):
+    """Bytes of a stitched page for the base page cache: BASE_PAGE_HEADER, then raw RGB rows."""
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    return BASE_PAGE_HEADER.pack(BASE_PAGE_MAGIC, image.width, image.height) + image.tobytes()
+
+
+def decode_base_page(data):
+    """Stitched page from encode_base_page bytes, None if they are not in that format."""
+    if len(data) < BASE_PAGE_HEADER.size:
+        return None
+    magic, width, height = BASE_PAGE_HEADER.unpack_from(data)
+    if magic != BASE_PAGE_MAGIC or len(data) != BASE_PAGE_HEADER.size + width * height * 3:
+        return None
+    return Image.frombytes("RGB", (width, height), memoryview(data)[BASE_PAGE_HEADER.size:])
+
+
+def _read_base_page(cache, key):
+    data = cache.get(key)
+    return None if data is None else decode_base_page(data)
+
+
+async def _cached_base_page(cache, key):
+    """Stitched page from the base page cache, None if it is not there."""
+    if cache is None:
+        return None
+    with stage("stitch"):
+        # Read in a thread, the event loop keeps fetching the tiles of other pages
+        image = await asyncio.to_thread(_read_base_page, cache, key)
+    if image is not None:
+        debug_print(f"Base page {key} from cache")
+    return image
+
+
+async def _cache_base_page(cache, key, image, tiles, write=True):
+    """Keep a stitched page in the base page cache, unless one of its tiles is missing or write is False."""
+    if cache is not None and write and not any(tile.info.get("placeholder") for tile in tiles):
+        # Lossless, the page is only JPEG-encoded once, in the PDF. Written in a thread, off the event loop
+        await asyncio.to_thread(lambda: cache.put(key, encode_base_page(image)))
+
+
+async def fetch_page_tiles(page, tile_source=TILE_SOURCE, corridor=None):
+    """
+    Fetch the tiles of one page, or fill those away from the corridor.
+
+    Returns:
+        list of the tile images, column after column.
+    """
+    flattened_list = [(int(col), int(row)) for sublist in page for col, row in sublist]
+    full = flattened_list if corridor is None else [col_row for col_row in flattened_list if col_row in corridor]
+    tasks = []
+    for col_row in full:
+        task = asyncio.create_task(
+            get_image_with_request_from_col_row_fast(col_row, tile_source)
+        )
+        tasks.append(task)
+    fill = [col_row for col_row in flattened_list if corridor is not None and col_row not in corridor]
+
+    with stage("fetch"):
+        tiles = dict(await asyncio.gather(*tasks))
+        if fill:
+            tiles.update(await render_fill_tiles(fill, tile_source))
+    return [tiles[col_row] for col_row in flattened_list]
+
+
+async def render_base_page(page, tile_source=TILE_SOURCE, corridor=None, cache_base_pages=True):
+    """
+    Fetch and stitch the map tiles of one page, without any overlay.
+
+    Stitched pages are kept losslessly in the base page cache, so rendering
+    the same page again with another line colour or annotations skips the
+    fetching, decoding and stitching. Pages with a missing tile are not
+    cached, the tile is retried on the next render.
+
+    Args:
+        page: 2D array of (col, row) tuples from get_filled_pages
+        tile_source: "IGN", "OSM" or "TOPO"
+        corridor: Optional set of the tiles to fetch at full resolution
+            (see corridor_tiles), the others are filled by render_fill_tiles
+        cache_base_pages: Write the page to the base page cache on a miss,
+            see base_page_cache_fits. It is read in any case.
+
+    Returns:
+        PIL.Image.Image: The stitched page, RGB.
+    """
+    cache = get_base_page_cache()
+    key = base_page_key(page, tile_source, corridor)
+    image = await _cached_base_page(cache, key)
+    if image is not None:
+        return image
+
+    sorted_images = await fetch_page_tiles(page, tile_source, corridor)
+
+    with stage("stitch"):
+        grid = [
+            sorted_images[i : i + NUMBER_ROWS]
+            for i in range(0, len(sorted_images), NUMBER_ROWS)
+        ]
+        stitched_horizontal = [get_concat_v_blank_gpt(*row) for row in grid]
+        global_image = get_concat_h_blank_gpt(*stitched_horizontal)
+    # Written before the track is drawn over it
+    await _cache_base_page(cache, key, global_image, sorted_images, cache_base_pages)
+    return global_image
+
+
+async def render_base_canvas(page, tile_source=TILE_SOURCE, corridor=None, cache_base_pages=True):
+    """
+    render_base_page, each tile copied straight into its place in a PageCanvas.
+
+    Returns:
+        PageCanvas: The stitched page, shares the base page cache of render_base_page.
+    """
+    cache = get_base_page_cache()
+    key = base_page_key(page, tile_source, corridor)
+    image = await _cached_base_page(cache, key)
+    if image is not None:
+        with stage("stitch"):
+            return PageCanvas.from_image(image)
+
+    tiles = await fetch_page_tiles(page, tile_source, corridor)
+
+    with stage("stitch"):
+        rows = len(page[0])
+        canvas = PageCanvas(len(page), rows)
+        for index, tile in enumerate(tiles):
+            canvas.place_tile(index // rows, index % rows, tile)
+    # Written before the track is drawn over it, in a thread
+    await _cache_base_page(cache, key, canvas.image(), tiles, cache_base_pages)
+    return canvas
+
+
+def draw_track(base_image, list_post, line_color=LINE_COLOR):
+    """Draw a track line over a base page, in place."""
+    with stage("draw"):
+        # Use the custom line color parameter here
+        gpx_trace_img, mask = draw_line(list_post, base_image, line_color)
+
+        # Create a mask of the white pixels in the first image
+        mask = mask.point(
+            lambda p: p > 128 and 255
+        )  # Threshold the image to white (pixel value > 128)
+
+        # Paste the first image's white pixels onto the second image
+        base_image.paste(gpx_trace_img, (0, 0), mask=mask)
+    return base_image
+
+
+def annotate_page(image, page_number):
+    """Add scale and page number to page."""
+    with stage("annotate"):
+        return annotate_image(
+            image, page_number, (20, 20), (20, 75, 20 + half_k_in_px, 80)
+        )
+
+
+def draw_overlay(base_image, page_number, tracks):
+    """
+    Draw the tracks, scale and page number over a base page.
+
+    Args:
+        base_image: Stitched page from render_base_page, modified in place
+        page_number: Number written on the page
+        tracks: (colour, track points in px) of each line of the page, from
+            get_page_tracks_in_px
+
+    Returns:
+        PIL.Image.Image: The annotated page.
+    """
+    for color, list_post in tracks:
+        draw_track(base_image, list_post, color)
+    return annotate_page(base_image, page_number)
+
+
+def annotate_canvas(canvas, page_number):
+    """annotate_page on a PageCanvas, drawn on a copy of the band the page number and scale sit in only."""
+    band = canvas.crop((0, 0, canvas.width, min(ANNOTATION_HEIGHT, canvas.height)))
+    canvas.paste(annotate_page(band, page_number), (0, 0))
+    return canvas
+
+
+def draw_canvas_overlay(canvas, page_number, tracks):
+    """
+    draw_overlay on a PageCanvas, in place.
+
+    The tracks are blended straight into the page, and the page number and
+    scale drawn on a copy of the band they sit in only.
+    """
+    with stage("draw"):
+        for color, list_post in tracks:
+            canvas.blend_track(list_post, color, LINE_WIDTH)
+    return annotate_canvas(canvas, page_number)
+
+
+def _tracks_corridor(page, tracks, corridor):
+    """Tiles of the page near any of its tracks, None if no corridor."""
+    if corridor is None:
+        return None
+    return set().union(*(corridor_tiles(page, list_post, corridor) for _, list_post in tracks))
+
+
+async def render_page_canvas(page, page_number, gpx_points, tile_source=TILE_SOURCE, line_color=LINE_COLOR,
+                             corridor=None, cache_base_pages=True, on_base_page=None):
+    """render_page on a PageCanvas, see page_compositor.py."""
+    tracks = get_page_tracks_in_px(page, gpx_points, line_color)
+    canvas = await render_base_canvas(page, tile_source, _tracks_corridor(page, tracks, corridor), cache_base_pages)
+    if on_base_page is not None:
+        on_base_page(page_number, canvas.image())
+    return draw_canvas_overlay(canvas, page_number, tracks)
+
+
+async def render_page(page, page_number, gpx_points, tile_source=TILE_SOURCE, line_color=LINE_COLOR, corridor=None,
+                      cache_base_pages=True, on_base_page=None):
+    """
+    Fetch, stitch and draw one page of the atlas.
+
+    Args:
+        page: 2D array of (col, row) tuples from get_filled_pages
+        page_number: Number written on the page
+        gpx_points: Track points per tile, as returned by extract_track
+        line_color: Colour of the track line, or the colour of each GPX
+            file of a merged atlas (see get_page_tracks_in_px)
+        corridor: Optional distance in tiles to the track: only the tiles
+            this close are fetched, the others are filled (see render_fill_tiles)
+        cache_base_pages: Write the stitched page to the base page cache, see
+            render_base_page
+        on_base_page: Optional callable of (page_number, image) given the
+            stitched page before anything is drawn on it, e.g.
+            OverviewPage.add_base_page. The image is drawn on next: copy
+            what is kept.
+
+    Returns:
+        PIL.Image.Image: The page with the track, scale and page number.
+    """
+    if PAGE_COMPOSITOR == "canvas":
+        canvas = await render_page_canvas(page, page_number, gpx_points, tile_source, line_color, corridor,
+                                          cache_base_pages, on_base_page)
+        return canvas.image()
+    tracks = get_page_tracks_in_px(page, gpx_points, line_color)
+    base_image = await render_base_page(page, tile_source, _tracks_corridor(page, tracks, corridor), cache_base_pages)
+    if on_base_page is not None:
+        on_base_page(page_number, base_image)
+    return draw_overlay(base_image, page_number, tracks)
+
+
+def navigation_markers(idx, pages):
+    """
+    Next/previous page markers of page idx of pages.
+
+    Returns:
+        list of (direction, (x, y) position, page number) for draw_navigation_marker.
+    """
+    current_page_tiles = pages[idx]
+    markers = []
+
+    # Add "next page" marker
+    if idx < len(pages) - 1:
+        next_page_tiles = pages[idx + 1]
+        direction, position = calculate_page_direction(current_page_tiles, next_page_tiles)
+        markers.append((direction, position, idx + 2))  # idx+2 because pages are 1-indexed
+
+    # Add "previous page" marker
+    if idx > 0:
+        prev_page_tiles = pages[idx - 1]
+        # Reverse direction for previous
+        direction, position = calculate_page_direction(current_page_tiles, prev_page_tiles)
+        # Invert direction
+        inv_dir = direction.replace("up", "DOWN").replace("down", "UP").replace("left", "RIGHT").replace("right", "LEFT").replace("DOWN", "down").replace("UP", "up").replace("LEFT", "left").replace("RIGHT", "right")
+        # Use opposite edge for position
+        page_width = len(current_page_tiles) * 256
+        page_height = len(current_page_tiles[0]) * 256
+        if "right" in inv_dir:
+            x = page_width - 80
+        elif "left" in inv_dir:
+            x = 80
+        else:
+            x = page_width // 2
+        if "down" in inv_dir:
+            y = page_height - 80
+        elif "up" in inv_dir:
+            y = 80
+        else:
+            y = page_height // 2
+        markers.append((inv_dir, (x, y), idx))  # idx because pages are 1-indexed and we want previous
+    return markers
+
+
+def add_navigation_markers(image, idx, pages):
+    """Draw the next/previous page markers on page idx of pages."""
+    draw = ImageDraw.Draw(image)
+    for direction, position, page_num in navigation_markers(idx, pages):
+        draw_navigation_marker(draw, direction, position, page_num)
+    return image
+
+
+def add_canvas_navigation_markers(canvas, idx, pages):
+    """add_navigation_markers on a PageCanvas, each marker drawn on a copy of the area around it only."""
+    for direction, (x, y), page_num in navigation_markers(idx, pages):
+        # Marker circle and the page number under it
+        box = (max(0, x - 64), max(0, y - 64), min(canvas.width, x + 64), min(canvas.height, y + 96))
+        area = canvas.crop(box)
+        draw_navigation_marker(ImageDraw.Draw(area), direction, (x - box[0], y - box[1]), page_num)
+        canvas.paste(area, box[:2])
+    return canvas
+
+
+async def render_final_page(pages, page_number, gpx_points, tile_source=TILE_SOURCE, line_color=LINE_COLOR,
+                            corridor=None, cache_base_pages=True, on_base_page=None):
+    """
+    Render page page_number of the layout, markers included.
+
+    Returns:
+        PIL.Image.Image ready for encode_page.
+    """
+    if PAGE_COMPOSITOR == "canvas":
+        canvas = await render_page_canvas(pages[page_number], page_number, gpx_points, tile_source, line_color,
+                                          corridor, cache_base_pages, on_base_page)
+        # Markers only depend on the layout, so the page is final here
+        with stage("annotate"):
+            add_canvas_navigation_markers(canvas, page_number, pages)
+        # Encoded straight from the canvas, not copied
+        return canvas.image()
+    image = await render_page(pages[page_number], page_number, gpx_points, tile_source, line_color, corridor,
+                              cache_base_pages, on_base_page)
+    with stage("annotate"):
+        add_navigation_markers(image, page_number, pages)
+    return image
+
+
+def _encode_final_page(image, render_seconds):
+    with stage("encode"):
+        start = time.perf_counter()
+        encoded = encode_page(image)
+    record_page(render_seconds + time.perf_counter() - start)
+    return encoded
+
+
+async def render_encoded_page(pages, page_number, gpx_points, tile_source=TILE_SOURCE, line_color=LINE_COLOR,
+                              corridor=None, cache_base_pages=True, on_base_page=None):
+    """
+    Render page page_number of the layout, markers included, and compress it.
+
+    Returns:
+        EncodedPage ready for PdfStreamWriter.add_page.
+    """
+    start = time.perf_counter()
+    image = await render_final_page(pages, page_number, gpx_points, tile_source, line_color, corridor,
+                                    cache_base_pages, on_base_page)
+    return _encode_final_page(image, time.perf_counter() - start)
+
+
+async def render_encoded_pages(pages, page_numbers, gpx_points, tile_source=TILE_SOURCE, line_color=LINE_COLOR,
+                               corridor=None, cache_base_pages=True, on_base_page=None):
+    """
+    Render and compress pages of the layout, each one encoded while the next ones render.
+
+    Finished pages are encoded on the ENCODE_WORKERS threads of
+    get_encode_executor, at most that many pages waiting at once. Pages
+    come out in the order of page_numbers whatever order their encoding
+    finishes in.
+
+    Args:
+        cache_base_pages: Write the stitched pages to the base page cache,
+            see base_page_cache_fits
+        on_base_page: Optional callable given each stitched page, see render_page
+
+    Yields:
+        (page number, EncodedPage) in the order of page_numbers.
+    """
+    executor = get_encode_executor()
+    if executor is None:
+        for page_number in page_numbers:
+            yield page_number, await render_encoded_page(pages, page_number, gpx_points, tile_source, line_color,
+                                                         corridor, cache_base_pages, on_base_page)
+        return
+
+    loop = asyncio.get_running_loop()
+    pending = deque()
+    for page_number in page_numbers:
+        start = time.perf_counter()
+        image = await render_final_page(pages, page_number, gpx_points, tile_source, line_color, corridor,
+                                        cache_base_pages, on_base_page)
+        # The copied context keeps the stage timings in the report of this render
+        context = contextvars.copy_context()
+        pending.append((page_number, loop.run_in_executor(
+            executor, context.run, _encode_final_page, image, time.perf_counter() - start
+        )))
+        while pending and (pending[0][1].done() or len(pending) > ENCODE_WORKERS):
+            page_number, encoding = pending.popleft()
+            yield page_number, await encoding
+    while pending:
+        page_number, encoding = pending.popleft()
+        yield page_number, await encoding
+
+
+def parse_gpx(data):
+    """
+    Parse a GPX document, timed as the "parse" stage.
+
+    Args:
+        data: GPX content as str or UTF-8 bytes
+
+    Returns:
+        gpxpy.gpx.GPX object
+    """
+    import gpxpy
+
+    with stage("parse"):
+        if isinstance(data, bytes):
+            data = data.decode("utf-8")
+        return gpxpy.parse(data)
+
+
+def merge_gpx(gpxs, line_color=LINE_COLOR):
+    """
+    Merge the GPX files of a multi-day trip into one, for a single atlas.
+
+    The tracks of the files follow each other in chronological order, by
+    the time of their first point; files without times keep the order
+    given. Laid out as one track, the tiles around each overnight stop are
+    on a single page and fetched once.
+
+    Args:
+        gpxs: gpxpy.gpx.GPX objects
+        line_color: Colour of every track, or a list of colours, one per
+            file in the order given (repeated if there are fewer colours)
+
+    Returns:
+        (gpx, line_color): The merged gpxpy.gpx.GPX object, and the
+        line_color to render it with. For several files, the (first point
+        index, colour) of each file in the merged track, so each is drawn
+        as its own line.
+    """
+    import gpxpy.gpx
+
+    colors = [line_color] if isinstance(line_color, str) else list(line_color)
+    if len(gpxs) == 1:
+        return gpxs[0], colors[0]
+
+    order = list(range(len(gpxs)))
+    starts = [gpx.get_time_bounds().start_time for gpx in gpxs]
+    if all(start is not None for start in starts):
+        try:
+            order.sort(key=lambda i: starts[i])
+        except TypeError:
+            # Timezone-aware and naive times cannot be compared
+            pass
+
+    merged = gpxpy.gpx.GPX()
+    track_colors = []
+    point_index = 0
+    for i in order:
+        track_colors.append((point_index, colors[i % len(colors)]))
+        for track in gpxs[i].tracks:
+            merged.tracks.append(track)
+            point_index += sum(len(segment.points) for segment in track.segments)
+    debug_print(f"[DEBUG] Merged {len(gpxs)} GPX files, {point_index} points, order {order}")
+    return merged, track_colors
+
+
+def layout_atlas(gpx, tile_source=TILE_SOURCE):
+    """
+    Compute the pages of the atlas without fetching any tile.
+
+    Args:
+        gpx: gpxpy.gpx.GPX object
+        tile_source: "IGN", "OSM" or "TOPO"
+
+    Returns:
+        pages: Filled pages from get_filled_pages
+        gpx_points: Track points per tile, as returned by extract_track
+    """
+    with stage("project"):
+        list_index_found, gpx_points = extract_track(gpx, tile_source)
+
     debug_print(f"[DEBUG] Calling get_filled_pages with COLUMNS={NUMBER_COLUMNS}, ROWS={NUMBER_ROWS}")
-    sys.stdout.flush()
 
     # Write tiles to file for debugging (only if DEBUG enabled)
     if DEBUG_LOGGING:
@@ -619,134 +1342,202 @@ async def main(gpx, tile_source=TILE_SOURCE, line_color=LINE_COLOR):
         except Exception as e:
             debug_print(f"[DEBUG] Could not write debug file: {e}")
 
-    pages = get_filled_pages(list_index_found, NUMBER_COLUMNS, NUMBER_ROWS)
+    with stage("layout"):
+        pages = get_filled_pages(list_index_found, NUMBER_COLUMNS, NUMBER_ROWS)
     debug_print(f"[DEBUG] Number of pages generated: {len(pages)}")
     debug_print(f"[DEBUG] Tiles per page: {[len(p) for p in pages]}")
-    sys.stdout.flush()
-
-    global_image = None
-    image_pages_for_export = []
-
-    page_number = 0
-    for _page in tqdm(pages):
-        list_post = []
-        for key in gpx_points.keys():
-            tile_pos = get_pos_gpx_in_px_in_page(_page, key)
-            if not tile_pos == None:
-                for point in gpx_points[key]:
-                    # Include sequence index in collected points
-                    list_post.append(
-                        (tile_pos[0] + point[0], tile_pos[1] + point[1], point[3])
-                    )
-        
-        # Sort points by sequence index before drawing
-        list_post.sort(key=lambda x: x[2])
-        # Remove sequence index for drawing
-        list_post = [(x[0], x[1]) for x in list_post]
-
-        ###############
-        #'''
-        flattened_list = [item for sublist in _page for item in sublist]
-        tasks = []
-        for col_row in flattened_list:
-            task = asyncio.create_task(
-                get_image_with_request_from_col_row_fast(col_row, tile_source)
-            )
-            tasks.append(task)
+    return pages, gpx_points
 
-        images = await asyncio.gather(*tasks)
-        image_dict = {col_row: image for col_row, image in images}
-        sorted_images = sorted(images, key=lambda x: flattened_list.index(x[0]))
-        sorted_images = [image for _, image in sorted_images]
-        grid = [
-            sorted_images[i : i + NUMBER_ROWS]
-            for i in range(0, len(sorted_images), NUMBER_ROWS)
-        ]
-        stitched_horizontal = [get_concat_v_blank_gpt(*row) for row in grid]
-        global_image = get_concat_h_blank_gpt(*stitched_horizontal)
 
-        # Use the custom line color parameter here
-        gpx_trace_img, mask = draw_line(list_post, global_image, line_color)
+def parse_page_selection(selection, page_count):
+    """
+    Parse a page selection such as "3", "2-5" or "0,4-6,9".
 
-        today = str(datetime.date.today()).replace("-", "")
-        folderpath = "./output/" + today
-        try:
-            os.makedirs(folderpath)
-        except OSError:
-            pass
+    Pages are numbered as printed on them ("N° : 0" is the first page).
 
-        # Create a mask of the white pixels in the first image
-        mask = mask.point(
-            lambda p: p > 128 and 255
-        )  # Threshold the image to white (pixel value > 128)
+    Args:
+        selection: Selection string, or an iterable of page numbers
+        page_count: Number of pages of the atlas, None to only normalize the selection
 
-        # Paste the first image's white pixels onto the second image
-        global_image.paste(gpx_trace_img, (0, 0), mask=mask)
-        # Add scale and page number to page
-        global_image = annotate_image(
-            global_image, page_number, (20, 20), (20, 75, 20 + half_k_in_px, 80)
-        )
+    Returns:
+        list: Sorted unique page numbers.
 
-        image_pages_for_export.append(copy.deepcopy(global_image))
-        page_number += 1
-
-    # Second pass: Add navigation markers
-    for idx in range(len(image_pages_for_export)):
-        image = image_pages_for_export[idx]
-        current_page_tiles = pages[idx]
-        draw = ImageDraw.Draw(image)
-
-        # Add "next page" marker
-        if idx < len(pages) - 1:
-            next_page_tiles = pages[idx + 1]
-            direction, position = calculate_page_direction(current_page_tiles, next_page_tiles)
-            draw_navigation_marker(draw, direction, position, idx + 2)  # idx+2 because pages are 1-indexed
-
-        # Add "previous page" marker
-        if idx > 0:
-            prev_page_tiles = pages[idx - 1]
-            # Reverse direction for previous
-            direction, position = calculate_page_direction(current_page_tiles, prev_page_tiles)
-            # Invert direction
-            inv_dir = direction.replace("up", "DOWN").replace("down", "UP").replace("left", "RIGHT").replace("right", "LEFT").replace("DOWN", "down").replace("UP", "up").replace("LEFT", "left").replace("RIGHT", "right")
-            # Use opposite edge for position
-            page_width = len(current_page_tiles) * 256
-            page_height = len(current_page_tiles[0]) * 256
-            if "right" in inv_dir:
-                x = page_width - 80
-            elif "left" in inv_dir:
-                x = 80
-            else:
-                x = page_width // 2
-            if "down" in inv_dir:
-                y = page_height - 80
-            elif "up" in inv_dir:
-                y = 80
-            else:
-                y = page_height // 2
-            draw_navigation_marker(draw, inv_dir, (x, y), idx)  # idx because pages are 1-indexed and we want previous
-
-    file_name = "OUTPUT.pdf"
-    timestamp = datetime.datetime.now().strftime("%d-%m-%Y_%H:%M:%S")
-    output_dir_pdf_path = "./output/PDFs/"
-    os.makedirs(output_dir_pdf_path, exist_ok=True)
-    file_name = output_dir_pdf_path + timestamp + ".pdf"
-
-    debug_print(f"[DEBUG] Final page count for PDF export: {len(image_pages_for_export)}")
-
-    if len(image_pages_for_export) == 0:
-        file_name = None
-    elif len(image_pages_for_export) == 1:
-        image_pages_for_export[0].save(
-            file_name, "PDF", resolution=100.0, save_all=True
-        )
+    Raises:
+        ValueError: The selection is malformed or names a page that does not exist.
+    """
+    if isinstance(selection, str):
+        numbers = set()
+        for part in selection.replace(" ", "").split(","):
+            if not part:
+                continue
+            first, _, last = part.partition("-")
+            try:
+                first = int(first)
+                last = int(last) if last else first
+            except ValueError:
+                raise ValueError(f"Invalid page selection: {part!r}")
+            if last < first:
+                raise ValueError(f"Invalid page range: {part!r}")
+            numbers.update(range(first, last + 1))
     else:
-        image_pages_for_export[0].save(
-            file_name,
-            "PDF",
-            resolution=100.0,
-            save_all=True,
-            append_images=image_pages_for_export[1:],
-        )
+        numbers = {int(number) for number in selection}
+
+    if not numbers:
+        raise ValueError("Empty page selection")
+    if page_count is None:
+        return sorted(numbers)
+    out_of_range = sorted(n for n in numbers if not 0 <= n < page_count)
+    if out_of_range:
+        raise ValueError(f"Pages {out_of_range} do not exist, the atlas has pages 0 to {page_count - 1}")
+    return sorted(numbers)
+
+
+async def render_atlas(gpx, tile_source=TILE_SOURCE, line_color=LINE_COLOR, layout=None, page_numbers=None,
+                       corridor=None, overview=False):
+    """
+    Render the atlas of a GPX track as a stream of PDF chunks.
+
+    The layout is computed first, so each page can be finished, navigation
+    markers included, and sent before the next one is fetched. The
+    cross-reference table and trailer come in the last chunk.
+
+    Args:
+        gpx: gpxpy.gpx.GPX object
+        tile_source: "IGN", "OSM" or "TOPO"
+        line_color: Colour of the track line
+        layout: Optional (pages, gpx_points) already computed by layout_atlas
+        page_numbers: Optional page selection (see parse_page_selection). The
+            layout stays the one of the full atlas, only these pages are
+            fetched and rendered, with their usual numbers and markers.
+        corridor: Optional distance in tiles to the track: only the tiles
+            this close are fetched at full resolution (see render_page)
+        overview: Add an overview page of the whole route in front of the
+            atlas, built from the rendered pages (see overview.py). Not
+            added to a page selection.
+
+    Yields:
+        bytes: Consecutive parts of the PDF. Nothing if the track produced no pages.
+    """
+    pages, gpx_points = layout if layout is not None else layout_atlas(gpx, tile_source)
+
+    if len(pages) == 0:
+        return
+
+    overview_page = None
+    if overview and page_numbers is None:
+        from overview import OverviewPage
+
+        overview_page = OverviewPage(pages, gpx_points, tile_source, line_color)
+
+    if page_numbers is None:
+        page_numbers = range(len(pages))
+    else:
+        page_numbers = parse_page_selection(page_numbers, len(pages))
+
+    from tqdm import tqdm
+
+    writer = PdfStreamWriter(resolution=PDF_RESOLUTION)
+    yield writer.begin()
+    progress = tqdm(total=len(page_numbers))
+    on_base_page = overview_page.add_base_page if overview_page is not None else None
+    async for page_number, encoded in render_encoded_pages(pages, page_numbers, gpx_points, tile_source, line_color,
+                                                           corridor, base_page_cache_fits(len(page_numbers)),
+                                                           on_base_page):
+        progress.update()
+        with stage("write"):
+            chunk = writer.add_page(encoded)
+        yield chunk
+
+    progress.close()
+
+    if overview_page is not None:
+        encoded = await overview_page.render()
+        with stage("write"):
+            chunk = writer.add_page(encoded, position=0)
+        yield chunk
+
+    debug_print(f"[DEBUG] Final page count for PDF export: {writer.page_count}")
+    with stage("write"):
+        chunk = writer.close()
+    yield chunk
+
+
+async def main(gpx, tile_source=TILE_SOURCE, line_color=LINE_COLOR, output=None, page_numbers=None, workers=None,
+               report=None, prefetch=PREFETCH_TILES, corridor=CORRIDOR_TILES, overview=OVERVIEW_PAGE):
+    """
+    Render the atlas of a GPX track as a PDF.
 
-    return file_name
\ No newline at end of file
+    Nothing is written to disk and no state is shared between calls, so
+    several renders can run concurrently in the same process.
+
+    Args:
+        gpx: gpxpy.gpx.GPX object, or the content of the GPX file: it is
+            then parsed here, the tiles of its track downloading meanwhile.
+            A list of them renders one atlas of all their tracks (see merge_gpx).
+        tile_source: "IGN", "OSM" or "TOPO"
+        line_color: Colour of the track line, or a list of colours, one per
+            GPX file of a list
+        output: Optional binary stream the PDF is written to, page by page
+        page_numbers: Optional page selection, e.g. "3-5,8", to render only
+            these pages of the atlas
+        workers: Render pages on a local pool of this many processes
+            (see distributed_render), None renders them here one by one
+        report: Optional RenderReport filled with the stage timings, tile
+            counts, page times and peak memory of this render
+        prefetch: Download the tiles of the track while it is parsed and laid
+            out, and those of the next pages while a page is rendered (see
+            prefetch.py). Needs a tile cache to keep them in.
+        corridor: Optional distance in tiles to the track: only the tiles
+            this close are fetched at full resolution, the rest of the page
+            is filled as set by CORRIDOR_FILL
+        overview: Add an overview page of the whole route in front of the
+            atlas, unless only some pages are rendered
+
+    Returns:
+        bytes of the PDF if no output stream is given, otherwise the output
+        stream. None if the track produced no pages.
+    """
+    stream = output if output is not None else io.BytesIO()
+    written = False
+    with recording(report if report is not None else RenderReport()) as report:
+        from prefetch import TilePrefetcher, layout_atlas_prefetching, parse_gpx_prefetching
+
+        prefetcher = TilePrefetcher(tile_source).start() if prefetch else None
+        selection = parse_page_selection(page_numbers, None) if page_numbers else None
+        # The track runs across the whole atlas, only its pages are known before the layout
+        track_prefetcher = prefetcher if selection is None else None
+        try:
+            if isinstance(gpx, (list, tuple)):
+                async def parse(data):
+                    if isinstance(data, (bytes, str)):
+                        return await parse_gpx_prefetching(data, tile_source, track_prefetcher)
+                    return data
+
+                gpx, line_color = merge_gpx(await asyncio.gather(*(parse(data) for data in gpx)), line_color)
+            elif isinstance(gpx, (bytes, str)):
+                gpx = await parse_gpx_prefetching(gpx, tile_source, track_prefetcher)
+            layout = await layout_atlas_prefetching(gpx, tile_source, prefetcher, selection, corridor)
+            if workers:
+                from distributed_render import render_atlas_distributed
+
+                # Worker processes read the prefetched tiles from the shared tile cache
+                chunks = render_atlas_distributed(gpx, tile_source, line_color, layout=layout,
+                                                  page_numbers=page_numbers, workers=workers, corridor=corridor,
+                                                  overview=overview)
+            else:
+                chunks = render_atlas(gpx, tile_source, line_color, layout=layout, page_numbers=page_numbers,
+                                      corridor=corridor, overview=overview)
+            async for chunk in chunks:
+                with stage("write"):
+                    stream.write(chunk)
+                written = True
+        finally:
+            if prefetcher is not None:
+                await prefetcher.stop()
+    report.finish()
+
+    if not written:
+        return None
+    if output is not None:
+        return output
+    return stream.getvalue()